@@ -4,8 +4,35 @@ import sys
 import platform
 import subprocess # <<< NUEVO: Para un ping más controlado
 from time import sleep
+import time
 from datetime import datetime
 import json # <<< NUEVO: Para persistencia de datos
+import csv
+import gzip
+import io
+import argparse
+import contextlib
+import tempfile
+import shlex
+import ipaddress
+import bisect
+import hashlib
+from array import array
+import sqlite3
+import struct
+import errno
+import functools
+import math
+import mmap
+import threading
+import itertools
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+try:
+    import fcntl # Bloqueo entre procesos del almacenamiento (no existe en Windows)
+except ImportError:
+    fcntl = None
 
 # 🌈 Paleta de colores y estilos
 class Color:
@@ -24,13 +51,34 @@ class Color:
 current_user = None
 menu_history = []
 NOMBRE_ARCHIVO_DATOS = "dispositivos_red.json" # <<< NUEVO: Nombre del archivo para guardar datos
+NOMBRE_ARCHIVO_DIARIO = "dispositivos_red.journal" # Diario de operaciones pendientes de compactar
+DIARIO_MAX_OPERACIONES = 500 # Operaciones en el diario antes de reescribir la instantánea
+NOMBRE_ARCHIVO_SQLITE = "dispositivos_red.db" # Base de datos del almacenamiento SQLite
+# Almacenamiento del inventario: "json" (instantánea + diario) o "sqlite". Se elige con
+# GESTION_RED_ALMACENAMIENTO o con --almacenamiento en la línea de comandos.
+ALMACENAMIENTO = os.environ.get("GESTION_RED_ALMACENAMIENTO", "json").strip().lower() or "json"
+# Modo rápido: sin pausas ni barras de progreso artificiales, limpieza de pantalla con
+# secuencias ANSI y carga del inventario recién cuando se usa por primera vez.
+# Se activa con GESTION_RED_RAPIDO=1 o con la opción --rapido.
+MODO_RAPIDO = os.environ.get("GESTION_RED_RAPIDO", "").strip().lower() in ("1", "s", "si", "sí", "true", "yes")
 # ---------------------------------------------------
 
 # 🎨 Diseño de la interfaz
 def limpiar_pantalla():
+    if MODO_RAPIDO: # Sin lanzar un proceso por cada pantalla
+        print("\033[2J\033[H", end="", flush=True)
+        return
     os.system('cls' if os.name == 'nt' else 'clear')
 
+def pausa(segundos):
+    """Pausa para que el usuario alcance a leer un mensaje; se omite en modo rápido."""
+    if not MODO_RAPIDO:
+        sleep(segundos)
+
 def mostrar_barra_progreso(duracion_segundos, mensaje="Cargando...", prefijo="", sufijo="Completado"):
+    if MODO_RAPIDO:
+        if sufijo != "Completado": print(f"{Color.GREEN}{sufijo}{Color.END}") # Conserva mensajes como el de bienvenida
+        return
     total_pasos = 20
     tiempo_por_paso = duracion_segundos / total_pasos if total_pasos > 0 and duracion_segundos > 0 else 0
 
@@ -47,7 +95,7 @@ def mostrar_barra_progreso(duracion_segundos, mensaje="Cargando...", prefijo="",
         barra = '█' * total_pasos
         print(f"\r{Color.GREEN}[{barra}] {porcentaje}%{Color.END}", end="", flush=True)
         print(f"\n{Color.GREEN}{sufijo}{Color.END}\n")
-    sleep(0.5)
+    pausa(0.5)
 
 
 def mostrar_titulo(titulo, con_usuario=True):
@@ -71,29 +119,564 @@ def mostrar_mensaje(mensaje, tipo="info", esperar_enter=False):
         input(f"{Color.GREEN}Presione Enter para continuar...{Color.END}")
 
 # ---------------- PERSISTENCIA DE DATOS (JSON) ----------------
-def cargar_dispositivos_desde_archivo():
-    """Carga la lista de dispositivos desde un archivo JSON."""
+# La persistencia combina una instantánea completa (NOMBRE_ARCHIVO_DATOS) con un diario
+# de operaciones (NOMBRE_ARCHIVO_DIARIO): cada alta, modificación o baja se agrega al
+# diario con fsync, y al cargar se reproduce sobre la instantánea. Cada cierto número
+# de operaciones se compacta: se reescribe la instantánea y se vacía el diario.
+# Las operaciones llevan un número de secuencia y el diario compactado empieza con una
+# cabecera {"op": "base", "secuencia": N} (la última operación incluida en la instantánea).
+# Al compactar, el diario anterior se conserva como <diario>.anterior: una sesión de otro
+# proceso que no lo terminó de leer lee lo que le falta de ahí y sigue con el nuevo, sin
+# recargar la instantánea; solo recarga todo si se quedó atrás más de una compactación.
+def _identidad_archivo(ruta):
+    """(inodo, mtime_ns, tamaño) del archivo, o None si no existe; cambia cuando se reemplaza."""
     try:
-        if os.path.exists(NOMBRE_ARCHIVO_DATOS):
-            with open(NOMBRE_ARCHIVO_DATOS, 'r', encoding='utf-8') as f:
-                dispositivos = json.load(f)
-                mostrar_mensaje(f"Datos cargados desde '{NOMBRE_ARCHIVO_DATOS}'.", "info")
-                return dispositivos
+        info = os.stat(ruta)
+    except OSError:
+        return None
+    return info.st_ino, info.st_mtime_ns, info.st_size
+
+class DiarioDispositivos:
+    """Diario de escritura anticipada (append-only, una operación JSON por línea)."""
+
+    def __init__(self, ruta_diario=None, ruta_instantanea=None, max_operaciones=None):
+        self.ruta_diario = ruta_diario or NOMBRE_ARCHIVO_DIARIO
+        self.ruta_instantanea = ruta_instantanea or NOMBRE_ARCHIVO_DATOS
+        self.max_operaciones = max_operaciones or DIARIO_MAX_OPERACIONES
+        self.operaciones = 0 # Operaciones en el diario desde la última compactación
+        self.secuencia = 0 # Número de la última operación leída o escrita
+        self._posicion = 0 # Bytes del diario ya leídos
+        self._base = 0 # Secuencia de la cabecera del diario que se está leyendo
+        self._sello = None # Identidad de la instantánea leída (cambia si otro proceso compacta)
+        self._archivo = None
+
+    def registrar(self, operacion):
+        """Agrega la operación al diario y fuerza su escritura a disco.
+
+        Devuelve True cuando el diario alcanzó el límite y conviene compactar.
+        """
+        if self._archivo is None:
+            self._archivo = open(self.ruta_diario, 'ab')
+        self.secuencia += 1
+        linea = json.dumps(dict(operacion, secuencia=self.secuencia), ensure_ascii=False, default=_dispositivo_a_json) + "\n"
+        self._archivo.write(linea.encode('utf-8'))
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self._posicion = self._archivo.tell() # Con el bloqueo tomado, nadie más escribió en medio
+        self.operaciones += 1
+        return self.operaciones >= self.max_operaciones
+
+    def _leer_diario(self, desde=0, ruta=None):
+        """Genera las operaciones completas del diario a partir del byte 'desde' y avanza la posición.
+
+        Una última línea incompleta o corrupta (escritura cortada por un fallo) se descarta
+        junto con el resto del archivo.
+        """
+        ruta = ruta or self.ruta_diario
+        with open(ruta, 'rb+') as f:
+            f.seek(desde)
+            posicion_valida = desde
+            for linea in f:
+                try:
+                    if not linea.endswith(b"\n"):
+                        raise ValueError("línea sin terminar")
+                    operacion = json.loads(linea.decode('utf-8')) if linea.strip() else None
+                except ValueError: # Incluye json.JSONDecodeError y UnicodeDecodeError
+                    mostrar_mensaje(f"Línea incompleta en el diario '{ruta}' (byte {posicion_valida}); se descarta desde ahí.", "advertencia")
+                    f.truncate(posicion_valida) # Para que las nuevas operaciones no queden pegadas al resto corrupto
+                    break
+                posicion_valida += len(linea)
+                self._posicion = posicion_valida
+                if operacion is not None:
+                    yield operacion
+        self._posicion = posicion_valida
+
+    def _avanzar(self, operacion):
+        """Actualiza secuencia y contador con una operación leída; False si es la cabecera de una compactación."""
+        if operacion.get("op") == "base":
+            self.secuencia = self._base = operacion.get("secuencia", self.secuencia)
+            return False
+        self.secuencia = operacion.get("secuencia", self.secuencia + 1) # Diarios viejos: sin numerar
+        self.operaciones += 1
+        return True
+
+    def reproducir(self, dispositivos):
+        """Aplica las operaciones del diario sobre la lista de la instantánea y la devuelve.
+
+        La reproducción es idempotente (un alta repetida reemplaza, una baja inexistente se
+        ignora), por lo que es segura aunque la compactación se haya interrumpido a medias.
+        """
+        self.operaciones = self.secuencia = self._posicion = self._base = 0
+        if not os.path.exists(self.ruta_diario):
+            return dispositivos
+        por_nombre = {d.get("NOMBRE", "").lower(): d for d in dispositivos}
+        for operacion in self._leer_diario():
+            if self._avanzar(operacion):
+                self._aplicar(operacion, dispositivos, por_nombre)
+        return dispositivos
+
+    def _secuencia_base(self, ruta=None):
+        """Secuencia de la cabecera del diario (0 si no tiene, None si no existe)."""
+        try:
+            with open(ruta or self.ruta_diario, 'rb') as f:
+                operacion = json.loads(f.readline().decode('utf-8') or "{}")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            return 0
+        return operacion.get("secuencia", 0) if operacion.get("op") == "base" else 0
+
+    def hay_cambios_externos(self):
+        """Indica, sin bloquear, si otro proceso escribió en el diario o compactó desde la última lectura."""
+        try:
+            tamano = os.path.getsize(self.ruta_diario)
+        except OSError:
+            tamano = 0
+        return tamano != self._posicion or _identidad_archivo(self.ruta_instantanea) != self._sello
+
+    def cambios_externos(self):
+        """Lo que otros procesos guardaron desde la última lectura, para aplicarlo en memoria.
+
+        Devuelve (None, [operaciones]) si alcanza con aplicar las operaciones nuevas, o
+        (dispositivos, []) con el inventario completo si otro proceso compactó operaciones
+        que esta sesión no había leído. Debe llamarse con el bloqueo tomado.
+        """
+        operaciones = []
+        if _identidad_archivo(self.ruta_instantanea) != self._sello: # Otro proceso compactó
+            self.cerrar() # El diario se reemplazó: las próximas escrituras van al nuevo
+            anterior = self.ruta_diario + ".anterior"
+            if self._secuencia_base(anterior) == self._base: # Es el diario que se venía leyendo
+                operaciones = [op for op in self._leer_diario(self._posicion, anterior) if self._avanzar(op)]
+            if self._secuencia_base() not in (self.secuencia, None):
+                return cargar_dispositivos_desde_archivo(self), []
+            self._sello = _identidad_archivo(self.ruta_instantanea)
+            self.operaciones = self._posicion = 0
+        if os.path.exists(self.ruta_diario) and os.path.getsize(self.ruta_diario) > self._posicion:
+            operaciones.extend(op for op in self._leer_diario(self._posicion) if self._avanzar(op))
+        return None, operaciones
+
+    @staticmethod
+    def _aplicar(operacion, dispositivos, por_nombre):
+        tipo_op = operacion.get("op")
+        clave = (operacion.get("nombre") or "").lower()
+        if tipo_op == "agregar":
+            disp = Dispositivo.desde_dict(operacion["dispositivo"])
+            existente = por_nombre.get(disp.get("NOMBRE", "").lower())
+            if existente is not None:
+                existente.clear(); existente.update(disp)
+            else:
+                dispositivos.append(disp)
+                por_nombre[disp.get("NOMBRE", "").lower()] = disp
+        elif tipo_op == "modificar":
+            disp = por_nombre.pop(clave, None)
+            if disp is not None:
+                disp.update(operacion.get("cambios", {}))
+                por_nombre[disp.get("NOMBRE", "").lower()] = disp
+        elif tipo_op == "eliminar":
+            disp = por_nombre.pop(clave, None)
+            if disp is not None:
+                dispositivos.remove(disp)
+
+    def compactar(self, dispositivos, desde_diario=False):
+        """Escribe una instantánea atómica con el estado actual y vacía el diario.
+
+        Con desde_diario=True la instantánea es exactamente el resultado de las operaciones
+        ya numeradas y se conserva la secuencia; si no (cargas masivas), se avanza para que
+        las demás sesiones sepan que deben recargarla.
+        """
+        if not desde_diario:
+            self.secuencia += 1
+        if not guardar_dispositivos_en_archivo(dispositivos, self.ruta_instantanea):
+            return False
+        self.cerrar()
+        try: # Se conserva para las sesiones que todavía no lo terminaron de leer
+            os.replace(self.ruta_diario, self.ruta_diario + ".anterior")
+        except FileNotFoundError:
+            pass
+        except OSError: # Windows no deja reemplazar un archivo abierto por otro proceso: se vacía en su lugar
+            pass
+        cabecera = json.dumps({"op": "base", "secuencia": self.secuencia}) + "\n"
+        with open(self.ruta_diario, 'wb') as f:
+            f.write(cabecera.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        self.operaciones = 0
+        self._posicion = len(cabecera)
+        self._base = self.secuencia
+        self._sello = _identidad_archivo(self.ruta_instantanea)
+        return True
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+
+def cargar_dispositivos_desde_archivo(diario=None):
+    """Carga la instantánea JSON y reproduce encima el diario de operaciones pendientes."""
+    diario = diario or DiarioDispositivos()
+    ruta = diario.ruta_instantanea
+    diario._sello = _identidad_archivo(ruta)
+    dispositivos = []
+    try:
+        if os.path.exists(ruta):
+            with open(ruta, 'r', encoding='utf-8') as f:
+                dispositivos = json.load(f, object_hook=_objeto_json_a_dispositivo)
+                mostrar_mensaje(f"Datos cargados desde '{ruta}'.", "info")
         else:
-            mostrar_mensaje(f"Archivo '{NOMBRE_ARCHIVO_DATOS}' no encontrado. Se iniciará con una lista vacía.", "advertencia")
-            return []
+            mostrar_mensaje(f"Archivo '{ruta}' no encontrado. Se iniciará con una lista vacía.", "advertencia")
     except (json.JSONDecodeError, IOError) as e:
-        mostrar_mensaje(f"Error al cargar datos desde '{NOMBRE_ARCHIVO_DATOS}': {e}. Se iniciará con una lista vacía.", "error")
-        return []
+        mostrar_mensaje(f"Error al cargar datos desde '{ruta}': {e}. Se iniciará con una lista vacía.", "error")
+        dispositivos = []
 
-def guardar_dispositivos_en_archivo(dispositivos_lista):
-    """Guarda la lista de dispositivos en un archivo JSON."""
     try:
-        with open(NOMBRE_ARCHIVO_DATOS, 'w', encoding='utf-8') as f:
-            json.dump(dispositivos_lista, f, indent=4, ensure_ascii=False)
+        diario.reproducir(dispositivos)
+        if diario.operaciones:
+            mostrar_mensaje(f"{diario.operaciones} operaciones recuperadas desde el diario '{diario.ruta_diario}'.", "info")
+        if diario.operaciones >= diario.max_operaciones:
+            diario.compactar(dispositivos, desde_diario=True)
+    except (IOError, KeyError, ValueError) as e:
+        mostrar_mensaje(f"Error al reproducir el diario '{diario.ruta_diario}': {e}", "error")
+    return dispositivos
+
+def guardar_dispositivos_en_archivo(dispositivos_lista, ruta=None):
+    """Guarda la lista completa en JSON de forma atómica (archivo temporal + rename)."""
+    ruta = ruta or NOMBRE_ARCHIVO_DATOS
+    ruta_tmp = None
+    try:
+        if os.path.exists(ruta):
+            modo = os.stat(ruta).st_mode & 0o777
+        else:
+            umask = os.umask(0); os.umask(umask)
+            modo = 0o666 & ~umask
+        fd, ruta_tmp = tempfile.mkstemp(prefix=".dispositivos_", suffix=".tmp", dir=os.path.dirname(os.path.abspath(ruta)))
+        os.chmod(ruta_tmp, modo) # mkstemp crea el archivo con permisos 0600
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(list(dispositivos_lista), f, indent=4, ensure_ascii=False, default=_dispositivo_a_json)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta_tmp, ruta)
         # No mostrar mensaje de guardado exitoso aquí para no saturar, se maneja en cada función que guarda.
+        return True
     except IOError as e:
-        mostrar_mensaje(f"Error al guardar datos en '{NOMBRE_ARCHIVO_DATOS}': {e}", "error", esperar_enter=True)
+        if ruta_tmp and os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        mostrar_mensaje(f"Error al guardar datos en '{ruta}': {e}", "error", esperar_enter=True)
+        return False
+
+# ---------------- ALMACENAMIENTO (JSON O SQLITE) ----------------
+# El repositorio persiste cada cambio a través de un almacenamiento con esta interfaz:
+#   cargar()                -> lista de dispositivos (dicts)
+#   registrar(operacion)    -> persiste una operación agregar/modificar/eliminar (mismo
+#                              formato que el diario); devuelve True si conviene compactar
+#   compactar(dispositivos) -> reescribe el estado completo (cargas masivas)
+#   bloqueo                 -> BloqueoArchivo que serializa a los escritores de todos los procesos
+#   hay_cambios_externos()  -> si otro proceso guardó algo desde la última lectura (sin bloquear)
+#   cambios_externos()      -> (inventario completo o None, [operaciones]) de otros procesos
+#   cerrar()
+# AlmacenamientoJSON es el esquema de siempre (instantánea + diario). AlmacenamientoSQLite
+# guarda una fila por dispositivo en modo WAL, con índices por nombre, IP, tipo, ubicación,
+# servicio y VLAN; cada operación es una transacción de una sola fila y además permite
+# filtrar, buscar y contar directamente en SQL sin cargar el inventario (RepositorioSQLite).
+#
+# Varios operadores pueden trabajar a la vez sobre los mismos archivos, cada uno con su
+# proceso. Cada dispositivo lleva un número de VERSION que sube con cada cambio; quien
+# escribe toma el bloqueo, aplica antes lo que guardaron los demás y, si el dispositivo ya
+# no está en la versión que editó, recibe ConflictoVersion en lugar de pisar el cambio ajeno.
+class ConflictoVersion(ValueError):
+    """Otro proceso cambió el dispositivo (o tomó su nombre o IP) desde que esta sesión lo leyó."""
+
+
+class BloqueoArchivo:
+    """Bloqueo exclusivo entre procesos (fcntl.flock sobre un archivo auxiliar), reentrante.
+
+    Donde no hay fcntl (Windows) solo excluye a los hilos del mismo proceso, como antes.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._hilos = threading.RLock()
+        self._nivel = 0
+        self._archivo = None
+
+    def __enter__(self):
+        self._hilos.acquire()
+        try:
+            if self._nivel == 0 and fcntl is not None:
+                archivo = open(self.ruta, 'a')
+                try:
+                    fcntl.flock(archivo.fileno(), fcntl.LOCK_EX)
+                except OSError:
+                    archivo.close()
+                    raise
+                self._archivo = archivo
+        except BaseException:
+            self._hilos.release()
+            raise
+        self._nivel += 1
+        return self
+
+    def __exit__(self, *excepcion):
+        self._nivel -= 1
+        if self._nivel == 0 and self._archivo is not None:
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+            self._archivo.close()
+            self._archivo = None
+        self._hilos.release()
+
+
+class AlmacenamientoJSON(DiarioDispositivos):
+    """Instantánea JSON completa más diario de operaciones."""
+    nombre = "json"
+
+    def __init__(self, ruta_diario=None, ruta_instantanea=None, max_operaciones=None):
+        super().__init__(ruta_diario, ruta_instantanea, max_operaciones)
+        self.bloqueo = BloqueoArchivo(os.path.splitext(self.ruta_instantanea)[0] + ".lock")
+
+    @property
+    def descripcion(self): return self.ruta_diario
+
+    def cargar(self):
+        with self.bloqueo: # Nadie compacta mientras se lee la instantánea y el diario
+            return cargar_dispositivos_desde_archivo(self)
+
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS dispositivos (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    ip TEXT,
+    tipo TEXT,
+    ubicacion TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_dispositivos_ip ON dispositivos(ip);
+CREATE INDEX IF NOT EXISTS idx_dispositivos_tipo ON dispositivos(tipo);
+CREATE INDEX IF NOT EXISTS idx_dispositivos_ubicacion ON dispositivos(ubicacion);
+CREATE TABLE IF NOT EXISTS dispositivo_servicios (
+    dispositivo_id INTEGER NOT NULL REFERENCES dispositivos(id) ON DELETE CASCADE,
+    posicion INTEGER NOT NULL,
+    servicio TEXT NOT NULL,
+    PRIMARY KEY (dispositivo_id, posicion)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_servicios_servicio ON dispositivo_servicios(servicio, dispositivo_id);
+CREATE TABLE IF NOT EXISTS dispositivo_vlans (
+    dispositivo_id INTEGER NOT NULL REFERENCES dispositivos(id) ON DELETE CASCADE,
+    posicion INTEGER NOT NULL,
+    vlan INTEGER NOT NULL,
+    PRIMARY KEY (dispositivo_id, posicion)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_vlans_vlan ON dispositivo_vlans(vlan, dispositivo_id);
+"""
+
+# Columnas propias de la tabla; cualquier otra clave del dispositivo se guarda en 'extra' (JSON)
+COLUMNAS_SQLITE = {"TIPO": "tipo", "NOMBRE": "nombre", "IP": "ip", "UBICACION": "ubicacion"}
+# Tipo y ubicación vacíos o nulos cuentan como 'N/A', igual que en los índices en memoria
+_SQL_TIPO = "CASE WHEN tipo IS NULL OR tipo = '' THEN 'N/A' ELSE tipo END"
+_SQL_UBICACION = "CASE WHEN ubicacion IS NULL OR ubicacion = '' THEN 'N/A' ELSE ubicacion END"
+_SELECT_DISPOSITIVOS_SQLITE = """
+SELECT d.id, d.tipo, d.nombre, d.ip, d.ubicacion,
+    (SELECT json_group_array(servicio) FROM (SELECT servicio FROM dispositivo_servicios WHERE dispositivo_id = d.id ORDER BY posicion)),
+    (SELECT json_group_array(vlan) FROM (SELECT vlan FROM dispositivo_vlans WHERE dispositivo_id = d.id ORDER BY posicion)),
+    d.extra
+FROM dispositivos d"""
+
+class AlmacenamientoSQLite:
+    """Una fila por dispositivo en SQLite (modo WAL); servicios y VLANs en tablas hijas indexadas."""
+    nombre = "sqlite"
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or NOMBRE_ARCHIVO_SQLITE
+        self.descripcion = self.ruta
+        self.conexion = sqlite3.connect(self.ruta)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=FULL") # Misma durabilidad que el fsync del diario
+        self.conexion.execute("PRAGMA foreign_keys=ON")
+        self.conexion.executescript(ESQUEMA_SQLITE)
+        self.bloqueo = BloqueoArchivo(self.ruta + ".lock")
+        self._version_datos = self._leer_version_datos()
+
+    @staticmethod
+    def _dispositivo_desde_fila(fila):
+        _, tipo, nombre, ip, ubicacion, servicios, vlans, extra = fila
+        disp = {clave: valor for clave, valor in (("TIPO", tipo), ("NOMBRE", nombre), ("IP", ip), ("UBICACION", ubicacion)) if valor is not None}
+        disp["SERVICIOS"] = json.loads(servicios) if servicios else []
+        disp["VLANS"] = json.loads(vlans) if vlans else []
+        if extra:
+            disp.update(json.loads(extra))
+        return Dispositivo.desde_dict(disp)
+
+    @staticmethod
+    def _extra(disp):
+        extra = {k: v for k, v in disp.items() if k not in COLUMNAS_SQLITE and k not in ("SERVICIOS", "VLANS")}
+        return json.dumps(extra, ensure_ascii=False) if extra else None
+
+    def _reemplazar_listas(self, id_disp, servicios=None, vlans=None):
+        if servicios is not None:
+            self.conexion.execute("DELETE FROM dispositivo_servicios WHERE dispositivo_id = ?", (id_disp,))
+            self.conexion.executemany("INSERT INTO dispositivo_servicios (dispositivo_id, posicion, servicio) VALUES (?, ?, ?)",
+                                      [(id_disp, pos, serv) for pos, serv in enumerate(servicios)])
+        if vlans is not None:
+            self.conexion.execute("DELETE FROM dispositivo_vlans WHERE dispositivo_id = ?", (id_disp,))
+            self.conexion.executemany("INSERT INTO dispositivo_vlans (dispositivo_id, posicion, vlan) VALUES (?, ?, ?)",
+                                      [(id_disp, pos, vlan) for pos, vlan in enumerate(vlans)])
+
+    def _insertar(self, disp):
+        # Un alta con un nombre existente reemplaza al dispositivo, igual que al reproducir el diario
+        id_disp = self.conexion.execute(
+            "INSERT INTO dispositivos (nombre, ip, tipo, ubicacion, extra) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(nombre) DO UPDATE SET nombre = excluded.nombre, ip = excluded.ip, tipo = excluded.tipo, "
+            "ubicacion = excluded.ubicacion, extra = excluded.extra RETURNING id",
+            (disp.get("NOMBRE"), disp.get("IP"), disp.get("TIPO"), disp.get("UBICACION"), self._extra(disp))).fetchone()[0]
+        self._reemplazar_listas(id_disp, disp.get("SERVICIOS") or [], disp.get("VLANS") or [])
+
+    def _actualizar(self, id_disp, cambios):
+        columnas = {COLUMNAS_SQLITE[k]: v for k, v in cambios.items() if k in COLUMNAS_SQLITE}
+        otros = {k: v for k, v in cambios.items() if k not in COLUMNAS_SQLITE and k not in ("SERVICIOS", "VLANS")}
+        if otros:
+            fila = self.conexion.execute("SELECT extra FROM dispositivos WHERE id = ?", (id_disp,)).fetchone()
+            extra = json.loads(fila[0]) if fila and fila[0] else {}
+            extra.update(otros)
+            columnas["extra"] = json.dumps(extra, ensure_ascii=False)
+        if columnas:
+            asignaciones = ", ".join(f"{col} = ?" for col in columnas)
+            self.conexion.execute(f"UPDATE dispositivos SET {asignaciones} WHERE id = ?", (*columnas.values(), id_disp))
+        self._reemplazar_listas(id_disp, cambios.get("SERVICIOS"), cambios.get("VLANS"))
+
+    def registrar(self, operacion):
+        """Aplica la operación en una única transacción. SQLite nunca necesita compactar."""
+        tipo_op = operacion.get("op")
+        with self.conexion: # Commit al salir, rollback si algo falla
+            if tipo_op == "agregar":
+                self._insertar(operacion["dispositivo"])
+            elif tipo_op == "modificar":
+                fila = self.conexion.execute("SELECT id FROM dispositivos WHERE nombre = ?", (operacion.get("nombre"),)).fetchone()
+                if fila is not None:
+                    self._actualizar(fila[0], operacion.get("cambios", {}))
+            elif tipo_op == "eliminar":
+                self.conexion.execute("DELETE FROM dispositivos WHERE nombre = ?", (operacion.get("nombre"),))
+        return False
+
+    def compactar(self, dispositivos, desde_diario=False):
+        """Reemplaza todo el contenido por la lista dada en una sola transacción.
+
+        desde_diario se acepta por compatibilidad con AlmacenamientoJSON.compactar; aquí no
+        hay secuencia de diario que conservar.
+        """
+        por_nombre = {} # Nombres repetidos: queda el último, en la posición del primero
+        for disp in dispositivos:
+            por_nombre[disp.get("NOMBRE", "").lower()] = disp
+        filas, servicios, vlans = [], [], []
+        for id_disp, disp in enumerate(por_nombre.values(), 1):
+            filas.append((id_disp, disp.get("NOMBRE"), disp.get("IP"), disp.get("TIPO"), disp.get("UBICACION"), self._extra(disp)))
+            servicios.extend((id_disp, pos, serv) for pos, serv in enumerate(disp.get("SERVICIOS") or []))
+            vlans.extend((id_disp, pos, vlan) for pos, vlan in enumerate(disp.get("VLANS") or []))
+        try:
+            with self.conexion:
+                self.conexion.execute("DELETE FROM dispositivo_servicios")
+                self.conexion.execute("DELETE FROM dispositivo_vlans")
+                self.conexion.execute("DELETE FROM dispositivos")
+                self.conexion.executemany("INSERT INTO dispositivos (id, nombre, ip, tipo, ubicacion, extra) VALUES (?, ?, ?, ?, ?, ?)", filas)
+                self.conexion.executemany("INSERT INTO dispositivo_servicios (dispositivo_id, posicion, servicio) VALUES (?, ?, ?)", servicios)
+                self.conexion.executemany("INSERT INTO dispositivo_vlans (dispositivo_id, posicion, vlan) VALUES (?, ?, ?)", vlans)
+        except sqlite3.Error as e:
+            mostrar_mensaje(f"Error al guardar datos en '{self.ruta}': {e}", "error", esperar_enter=True)
+            return False
+        return True
+
+    def cargar(self):
+        self._version_datos = self._leer_version_datos()
+        dispositivos = [self._dispositivo_desde_fila(f) for f in self.conexion.execute(_SELECT_DISPOSITIVOS_SQLITE + " ORDER BY d.id")]
+        mostrar_mensaje(f"Datos cargados desde '{self.ruta}'.", "info")
+        return dispositivos
+
+    def _leer_version_datos(self):
+        # Cambia cuando otra conexión confirma cambios en la base (no con los commits propios)
+        return self.conexion.execute("PRAGMA data_version").fetchone()[0]
+
+    def hay_cambios_externos(self):
+        return self._leer_version_datos() != self._version_datos
+
+    def cambios_externos(self):
+        """SQLite no guarda las operaciones: si otro proceso escribió, se devuelve el inventario completo."""
+        if not self.hay_cambios_externos():
+            return None, []
+        self._version_datos = self._leer_version_datos()
+        return list(self.iterar()), []
+
+    @staticmethod
+    def _condicion_columna(columna, valor):
+        if valor == "N/A": # Igual que en los índices en memoria: vacío o ausente cuenta como N/A
+            return f"(d.{columna} IS NULL OR d.{columna} IN ('', 'N/A'))", []
+        return f"d.{columna} = ?", [valor]
+
+    def _condiciones(self, tipo=None, ubicacion=None, servicio=None, vlan=None, nombre=None, nombre_contiene=None, ip=None, con_ip=False):
+        condiciones, parametros = [], []
+        for columna, valor in (("tipo", tipo), ("ubicacion", ubicacion)):
+            if valor is not None:
+                condicion, params = self._condicion_columna(columna, valor)
+                condiciones.append(condicion); parametros.extend(params)
+        if servicio is not None:
+            condiciones.append("d.id IN (SELECT dispositivo_id FROM dispositivo_servicios WHERE servicio = ?)"); parametros.append(servicio)
+        if vlan is not None:
+            condiciones.append("d.id IN (SELECT dispositivo_id FROM dispositivo_vlans WHERE vlan = ?)"); parametros.append(vlan)
+        if nombre is not None:
+            condiciones.append("d.nombre = ?"); parametros.append(nombre.strip())
+        if nombre_contiene:
+            patron = nombre_contiene.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            condiciones.append("d.nombre LIKE ? ESCAPE '\\'"); parametros.append(f"%{patron}%")
+        if ip is not None:
+            condiciones.append("d.ip = ?"); parametros.append(ip)
+        if con_ip:
+            condiciones.append("d.ip IS NOT NULL AND d.ip NOT IN ('', 'N/A')")
+        return (" WHERE " + " AND ".join(condiciones) if condiciones else ""), parametros
+
+    def iterar(self, **filtros):
+        """Genera los dispositivos que cumplen los filtros, en orden de alta, sin cargarlos todos."""
+        donde, parametros = self._condiciones(**filtros)
+        for fila in self.conexion.execute(_SELECT_DISPOSITIVOS_SQLITE + donde + " ORDER BY d.id", parametros):
+            yield self._dispositivo_desde_fila(fila)
+
+    def contar(self, **filtros):
+        donde, parametros = self._condiciones(**filtros)
+        return self.conexion.execute("SELECT COUNT(*) FROM dispositivos d" + donde, parametros).fetchone()[0]
+
+    def conteo_por(self, campo):
+        """{valor: cantidad de dispositivos} calculado con GROUP BY (mismos valores que los índices en memoria)."""
+        consultas = {
+            "TIPO": f"SELECT {_SQL_TIPO}, COUNT(*) FROM dispositivos GROUP BY 1",
+            "UBICACION": f"SELECT {_SQL_UBICACION}, COUNT(*) FROM dispositivos GROUP BY 1",
+            "SERVICIOS": "SELECT servicio, COUNT(DISTINCT dispositivo_id) FROM dispositivo_servicios GROUP BY servicio",
+            "VLANS": "SELECT vlan, COUNT(DISTINCT dispositivo_id) FROM dispositivo_vlans GROUP BY vlan",
+        }
+        return dict(self.conexion.execute(consultas[campo]).fetchall())
+
+    def estadisticas(self):
+        """Mismo formato que calcular_estadisticas, calculado en SQL."""
+        consulta = self.conexion.execute
+        return {
+            "total": consulta("SELECT COUNT(*) FROM dispositivos").fetchone()[0],
+            "por_tipo": dict(consulta(f"SELECT {_SQL_TIPO}, COUNT(*) FROM dispositivos GROUP BY 1").fetchall()),
+            "por_ubicacion": dict(consulta(f"SELECT {_SQL_UBICACION} AS u, COUNT(*) FROM dispositivos GROUP BY 1 HAVING u <> 'N/A'").fetchall()),
+            "por_servicio": dict(consulta("SELECT servicio, COUNT(*) FROM dispositivo_servicios GROUP BY servicio").fetchall()),
+            "por_vlan": dict(consulta("SELECT vlan, COUNT(*) FROM dispositivo_vlans GROUP BY vlan").fetchall()),
+            "dispositivos_con_vlans": consulta("SELECT COUNT(DISTINCT dispositivo_id) FROM dispositivo_vlans").fetchone()[0],
+            "total_vlans_configuradas": consulta("SELECT COUNT(*) FROM dispositivo_vlans").fetchone()[0],
+        }
+
+    def cerrar(self):
+        self.conexion.close()
+
+
+def crear_almacenamiento(tipo=None, ruta=None):
+    """Crea el almacenamiento configurado ('json' o 'sqlite'); 'ruta' reemplaza al archivo por defecto."""
+    tipo = (tipo or ALMACENAMIENTO).lower()
+    if tipo == "sqlite":
+        return AlmacenamientoSQLite(ruta)
+    if tipo == "json":
+        ruta_diario = os.path.splitext(ruta)[0] + ".journal" if ruta else None
+        return AlmacenamientoJSON(ruta_diario, ruta)
+    raise ValueError(f"Almacenamiento '{tipo}' no válido. Opciones: json, sqlite")
 
 # ---------------- SISTEMA DE INICIO DE SESIÓN ----------------
 USUARIOS_PREDEFINIDOS = {
@@ -119,10 +702,10 @@ def iniciar_sesion():
             restantes = max_intentos - intentos_fallidos
             if restantes > 0:
                 mostrar_mensaje(f"Usuario o contraseña incorrectos. Intentos restantes: {restantes}", "error")
-                sleep(2)
+                pausa(2)
             else:
                 mostrar_mensaje("Demasiados intentos fallidos. El programa se cerrará.", "error")
-                sleep(3); limpiar_pantalla(); sys.exit()
+                pausa(3); limpiar_pantalla(); sys.exit()
     return False
 
 # ---------------- DEFINICIÓN DE CONSTANTES Y VALIDACIONES ----------------
@@ -130,23 +713,30 @@ SERVICIOS_VALIDOS = {'DNS': '🔍 DNS', 'DHCP': '🌐 DHCP', 'WEB': '🕸️ Ser
 TIPOS_DISPOSITIVO = {'PC': '💻 PC', 'SERVIDOR':'🖧 Servidor', 'ROUTER': '📶 Router', 'SWITCH': '🔀 Switch', 'FIREWALL': '🔥 Firewall', 'IMPRESORA': '🖨️ Impresora'}
 CAPAS_RED = {'NUCLEO': '💎 Núcleo (Core)', 'DISTRIBUCION': '📦 Distribución', 'ACCESO': '🔌 Acceso', 'N/A': 'N/A'} # N/A añadido
 
+PATRON_IP = re.compile(r'(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})')
+PATRON_NOMBRE = re.compile(r'^[a-zA-Z0-9\-\.\s_]+$')
+_VALORES_SERVICIOS = frozenset(SERVICIOS_VALIDOS.values())
+
+def ip_a_entero(ip):
+    """'10.0.0.1' -> 167772161. Lanza ValueError si no es una IPv4 con octetos 0-255."""
+    coincidencia = PATRON_IP.fullmatch(ip or "")
+    if coincidencia is None:
+        raise ValueError("Formato incorrecto. Debe ser X.X.X.X donde X es un número (0-255)")
+    entero = 0
+    for octeto_str in coincidencia.groups():
+        octeto_num = int(octeto_str)
+        if octeto_num > 255:
+            raise ValueError(f"El octeto '{octeto_num}' no es válido (debe estar entre 0-255)")
+        entero = (entero << 8) | octeto_num
+    return entero
+
+def entero_a_ip(entero):
+    return f"{entero >> 24}.{(entero >> 16) & 255}.{(entero >> 8) & 255}.{entero & 255}"
+
 def validar_ip(ip):
     if not ip: # Permite IP vacía que se tratará como "N/A"
         return True
-    if not re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', ip):
-        raise ValueError("Formato incorrecto. Debe ser X.X.X.X donde X es un número (0-255)")
-    octetos = ip.split('.')
-    if len(octetos) != 4:
-        raise ValueError("La IP debe tener exactamente 4 partes separadas por puntos")
-    for i, octeto_str in enumerate(octetos):
-        try:
-            octeto_num = int(octeto_str)
-            if not (0 <= octeto_num <= 255):
-                raise ValueError(f"El octeto '{octeto_num}' no es válido (debe estar entre 0-255)")
-        except ValueError:
-            raise ValueError(f"El octeto '{octeto_str}' no es un número válido.")
-
-    primer_octeto = int(octetos[0])
+    primer_octeto = ip_a_entero(ip) >> 24 # Un solo análisis de la cadena
     if primer_octeto == 0:
         raise ValueError("El primer octeto no puede ser 0 (red 'esta red').")
     if primer_octeto == 127:
@@ -161,7 +751,7 @@ def validar_ip(ip):
 
 
 def validar_nombre(nombre):
-    if not re.match(r'^[a-zA-Z0-9\-\.\s_]+$', nombre):
+    if not PATRON_NOMBRE.match(nombre):
         raise ValueError("Nombre contiene caracteres inválidos. Permitidos: letras, números, espacios, guiones, puntos y guiones bajos.")
     if not 3 <= len(nombre.strip()) <= 50:
         raise ValueError("El nombre debe tener entre 3 y 50 caracteres.")
@@ -169,28 +759,244 @@ def validar_nombre(nombre):
 
 def validar_servicios_lista(servicios_lista):
     for servicio in servicios_lista:
-        if servicio not in SERVICIOS_VALIDOS.values():
+        if servicio not in _VALORES_SERVICIOS:
             raise ValueError(f"Servicio inválido en la lista: {servicio}")
     return True
 
-def validar_vlans_input(vlans_str):
+def analizar_vlans(vlans_str):
+    """(VLANs ordenadas sin repetir, VLANs repetidas en el texto). Lanza ValueError si alguna es inválida."""
     if not vlans_str.strip():
-        return []
-    vlan_list_str = vlans_str.split(',')
-    vlans_int = []
-    for v_str in vlan_list_str:
+        return [], []
+    vistas, repetidas = set(), []
+    for v_str in vlans_str.split(','):
         v_str = v_str.strip()
         if not v_str.isdigit():
             raise ValueError(f"VLAN '{v_str}' no es un número válido.")
         v_int = int(v_str)
         if not (1 <= v_int <= 4094):
             raise ValueError(f"VLAN '{v_int}' fuera del rango válido (1-4094).")
-        if v_int in vlans_int:
-             mostrar_mensaje(f"VLAN '{v_int}' ya ingresada en esta lista. Se omitirá el duplicado.", "advertencia")
+        if v_int in vistas:
+            repetidas.append(v_int)
+        else:
+            vistas.add(v_int)
+    return sorted(vistas), repetidas
+
+def validar_vlans_input(vlans_str):
+    vlans, repetidas = analizar_vlans(vlans_str)
+    for v_int in repetidas:
+        mostrar_mensaje(f"VLAN '{v_int}' ya ingresada en esta lista. Se omitirá el duplicado.", "advertencia")
+    return vlans
+
+
+_TABLAS_OPCIONES = {} # id del diccionario de opciones -> (diccionario, {texto normalizado: valor})
+
+def _tabla_opciones(opciones_dict):
+    entrada = _TABLAS_OPCIONES.get(id(opciones_dict))
+    if entrada is None or entrada[0] is not opciones_dict:
+        tabla = {}
+        for clave, valor in opciones_dict.items():
+            for texto in (clave.lower(), valor.lower(), valor.split(" ", 1)[-1].lower()):
+                tabla.setdefault(texto, valor) # Ante textos repetidos gana la primera opción
+        entrada = _TABLAS_OPCIONES[id(opciones_dict)] = (opciones_dict, tabla)
+    return entrada[1]
+
+def _resolver_opcion(opciones_dict, texto, nombre_campo):
+    """Acepta la clave (ROUTER), el valor completo ('📶 Router') o la etiqueta sin ícono ('router')."""
+    if texto is None:
+        return None
+    valor = _tabla_opciones(opciones_dict).get(texto.strip().lower())
+    if valor is not None:
+        return valor
+    raise ValueError(f"{nombre_campo} '{texto}' no válido. Opciones: {', '.join(opciones_dict.keys())}")
+
+# ---------------- REPRESENTACIÓN COMPACTA DE DISPOSITIVOS ----------------
+# Cada dispositivo ocupa un objeto con __slots__ en lugar de un dict con seis listas y
+# cadenas propias: tipo y ubicación son códigos pequeños, los servicios una máscara de
+# bits, la IP un entero de 32 bits y las VLANs un bitmap (bit n = VLAN n). La interfaz
+# imita a un dict (get, [], update, items...) para que el resto del programa no cambie.
+# VERSION (cuántas veces se guardó el dispositivo) solo aparece entre las claves desde el
+# primer guardado, así los archivos y exportaciones de inventarios sin editar no cambian.
+class TablaCodigos:
+    """Tabla de valores de texto repetidos; cada dispositivo guarda solo el código."""
+    __slots__ = ("valores", "codigos")
+
+    def __init__(self, valores=()):
+        self.valores, self.codigos = [], {}
+        for valor in valores:
+            self.codigo(valor)
+
+    def codigo(self, valor):
+        """Código del valor; los valores desconocidos (p. ej. de archivos viejos) se agregan."""
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = len(self.valores)
+            self.valores.append(sys.intern(valor) if isinstance(valor, str) else valor)
+            self.codigos[valor] = codigo
+        return codigo
+
+TABLA_TIPOS = TablaCodigos(TIPOS_DISPOSITIVO.values())
+TABLA_UBICACIONES = TablaCodigos(CAPAS_RED.values())
+TABLA_SERVICIOS = TablaCodigos(SERVICIOS_VALIDOS.values())
+
+def _bits_a_posiciones(mascara):
+    """Posiciones de los bits encendidos, de menor a mayor."""
+    posiciones = []
+    while mascara:
+        bit = mascara & -mascara
+        posiciones.append(bit.bit_length() - 1)
+        mascara ^= bit
+    return posiciones
+
+class Dispositivo:
+    """Registro compacto de un dispositivo con interfaz de dict (ver sección)."""
+    __slots__ = ("nombre", "_tipo", "_ubicacion", "_ip", "_servicios", "_vlans", "version", "_extra", "_vlans_descartadas")
+    CAMPOS = ("TIPO", "NOMBRE", "IP", "UBICACION", "SERVICIOS", "VLANS")
+
+    def __init__(self, tipo="N/A", nombre="", ip="N/A", ubicacion="N/A", servicios=(), vlans=()):
+        self._extra = None # Campos desconocidos de archivos de otras versiones
+        self.version = 0
+        self["TIPO"], self["NOMBRE"], self["IP"] = tipo, nombre, ip
+        self["UBICACION"], self["SERVICIOS"], self["VLANS"] = ubicacion, servicios, vlans
+
+    @classmethod
+    def desde_dict(cls, datos):
+        if isinstance(datos, cls):
+            return datos
+        disp = cls()
+        disp.update(datos)
+        return disp
+
+    # --- Acceso tipo dict ---
+    def __getitem__(self, campo):
+        if campo == "NOMBRE":
+            return self.nombre
+        if campo == "TIPO":
+            return TABLA_TIPOS.valores[self._tipo]
+        if campo == "IP":
+            ip = self._ip
+            return "N/A" if ip is None else entero_a_ip(ip) if isinstance(ip, int) else ip
+        if campo == "UBICACION":
+            return TABLA_UBICACIONES.valores[self._ubicacion]
+        if campo == "SERVICIOS":
+            return [TABLA_SERVICIOS.valores[i] for i in _bits_a_posiciones(self._servicios)]
+        if campo == "VLANS":
+            return _bits_a_posiciones(self._vlans)
+        if campo == "VERSION" and self.version:
+            return self.version
+        if self._extra and campo in self._extra:
+            return self._extra[campo]
+        raise KeyError(campo)
+
+    def __setitem__(self, campo, valor):
+        if campo == "NOMBRE":
+            self.nombre = valor
+        elif campo == "TIPO":
+            self._tipo = TABLA_TIPOS.codigo(valor or "N/A")
+        elif campo == "IP":
+            self._ip = None
+            if valor and valor != "N/A":
+                try:
+                    entero = ip_a_entero(valor)
+                    # Solo se comprime si se puede reconstruir igual (sin ceros a la izquierda)
+                    self._ip = entero if entero_a_ip(entero) == valor else valor
+                except (TypeError, ValueError):
+                    self._ip = valor # IP no válida de un archivo viejo: se conserva el texto
+        elif campo == "UBICACION":
+            self._ubicacion = TABLA_UBICACIONES.codigo(valor or "N/A")
+        elif campo == "SERVICIOS":
+            mascara = 0
+            for servicio in valor or ():
+                mascara |= 1 << TABLA_SERVICIOS.codigo(servicio)
+            self._servicios = mascara
+        elif campo == "VLANS":
+            mascara, descartadas = 0, None
+            for vlan in valor or ():
+                try:
+                    numero = int(vlan)
+                except (TypeError, ValueError):
+                    numero = 0
+                if not 1 <= numero <= 4094: # Un valor fuera de rango de un archivo viejo no impide cargar el resto
+                    descartadas = (descartadas or ()) + (vlan,)
+                    continue
+                mascara |= 1 << numero
+            self._vlans = mascara
+            self._vlans_descartadas = descartadas
+        elif campo == "VERSION":
+            self.version = int(valor or 0)
         else:
-            vlans_int.append(v_int)
-    return sorted(list(set(vlans_int)))
+            if self._extra is None:
+                self._extra = {}
+            self._extra[campo] = valor
+
+    def get(self, campo, defecto=None):
+        try:
+            return self[campo]
+        except KeyError:
+            return defecto
+
+    def __contains__(self, campo):
+        return campo in self.CAMPOS or (campo == "VERSION" and self.version > 0) or bool(self._extra and campo in self._extra)
+
+    def keys(self):
+        return self.CAMPOS + (("VERSION",) if self.version else ()) + tuple(self._extra or ())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(campo, self[campo]) for campo in self.keys()]
+
+    def update(self, otro=(), **cambios):
+        pares = otro.items() if hasattr(otro, "items") else otro
+        for campo, valor in pares:
+            self[campo] = valor
+        for campo, valor in cambios.items():
+            self[campo] = valor
+
+    def clear(self):
+        Dispositivo.__init__(self)
+
+    def a_dict(self):
+        return {campo: self[campo] for campo in self.keys()}
+
+    @property
+    def vlans_descartadas(self):
+        """VLANs no válidas (fuera de 1-4094) que se omitieron al asignar VLANS; quien carga decide cómo avisar."""
+        return self._vlans_descartadas or ()
+
+    def __repr__(self):
+        return f"Dispositivo({self.a_dict()!r})"
+
+    # --- Accesos directos sin decodificar ---
+    @property
+    def ip_entero(self):
+        """IP como entero, o None si no tiene o no es válida."""
+        if isinstance(self._ip, int) or self._ip is None:
+            return self._ip
+        try:
+            return ip_a_entero(self._ip) # Texto conservado tal cual (p. ej. con ceros a la izquierda)
+        except ValueError:
+            return None
+
+    @property
+    def vlans_bitmap(self):
+        return self._vlans
+
+    def tiene_vlan(self, vlan):
+        return vlan >= 0 and bool(self._vlans >> vlan & 1)
+
+def _objeto_json_a_dispositivo(objeto):
+    """object_hook de json: los objetos con NOMBRE se cargan directamente como Dispositivo."""
+    return Dispositivo.desde_dict(objeto) if "NOMBRE" in objeto else objeto
 
+def _dispositivo_a_json(objeto):
+    """default de json.dump para serializar Dispositivo como el dict de siempre."""
+    if isinstance(objeto, Dispositivo):
+        return objeto.a_dict()
+    raise TypeError(f"Objeto de tipo {type(objeto).__name__} no serializable a JSON")
 
 def crear_dispositivo(tipo, nombre, ip=None, ubicacion=None, servicios=None, vlans=None): # 'capa' renombrada a 'ubicacion'
     try:
@@ -198,100 +1004,1527 @@ def crear_dispositivo(tipo, nombre, ip=None, ubicacion=None, servicios=None, vla
         if ip and ip != "N/A": validar_ip(ip)
         if servicios: validar_servicios_lista(servicios)
 
-        dispositivo_data = {
-            "TIPO": tipo,
-            "NOMBRE": nombre,
-            "IP": ip if ip else "N/A",
-            "UBICACION": ubicacion if ubicacion else "N/A", # Usando UBICACION consistentemente
-            "SERVICIOS": servicios if servicios else [],
-            "VLANS": vlans if vlans else []
-        }
-        return dispositivo_data
+        return Dispositivo(tipo, nombre, ip if ip else "N/A", ubicacion if ubicacion else "N/A", # Usando UBICACION consistentemente
+                           servicios if servicios else [], vlans if vlans else [])
     except ValueError as e:
         mostrar_mensaje(f"Error al definir datos del dispositivo: {e}", "error")
         return None
 
+# ---------------- ESTADÍSTICAS INCREMENTALES ----------------
+def _sumar_conteo(conteo, clave, delta):
+    nuevo = conteo.get(clave, 0) + delta
+    if nuevo:
+        conteo[clave] = nuevo
+    else:
+        conteo.pop(clave, None)
+
+class EstadisticasInventario:
+    """Contadores por tipo, ubicación/capa, servicio y VLAN actualizados en cada alta y baja.
+
+    El repositorio llama a registrar_alta/registrar_baja al indexar y desindexar, de modo que
+    abrir el reporte no recorre el inventario. calcular_estadisticas sigue disponible como
+    recálculo completo en una pasada para verificar que los contadores sean consistentes.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.por_tipo, self.por_ubicacion, self.por_servicio, self.por_vlan = {}, {}, {}, {}
+        self.dispositivos_con_vlans = 0
+        self.total_vlans_configuradas = 0
+
+    def _aplicar(self, disp, delta):
+        self.total += delta
+        _sumar_conteo(self.por_tipo, disp.get("TIPO", "N/A"), delta)
+        ubicacion = disp.get("UBICACION", "N/A")
+        if ubicacion != "N/A":
+            _sumar_conteo(self.por_ubicacion, ubicacion, delta)
+        for servicio in disp.get("SERVICIOS", []) or []:
+            _sumar_conteo(self.por_servicio, servicio, delta)
+        vlans = disp.get("VLANS", []) or []
+        if vlans:
+            self.dispositivos_con_vlans += delta
+            self.total_vlans_configuradas += delta * len(vlans)
+            for vlan in vlans:
+                _sumar_conteo(self.por_vlan, vlan, delta)
+
+    def registrar_alta(self, disp): self._aplicar(disp, 1)
+    def registrar_baja(self, disp): self._aplicar(disp, -1)
+
+    def como_dict(self):
+        """Mismo formato que calcular_estadisticas (copias, para no exponer los contadores)."""
+        return {
+            "total": self.total,
+            "por_tipo": dict(self.por_tipo),
+            "por_ubicacion": dict(self.por_ubicacion),
+            "por_servicio": dict(self.por_servicio),
+            "por_vlan": dict(self.por_vlan),
+            "dispositivos_con_vlans": self.dispositivos_con_vlans,
+            "total_vlans_configuradas": self.total_vlans_configuradas,
+        }
+
+    def verificar_consistencia(self, dispositivos_lista):
+        """Recalcula todo en una pasada y devuelve la lista de diferencias (vacía si coincide)."""
+        recalculado = calcular_estadisticas(dispositivos_lista)
+        actual = self.como_dict()
+        return [f"{clave}: contadores={actual[clave]!r} recalculado={recalculado[clave]!r}"
+                for clave in recalculado if recalculado[clave] != actual[clave]]
+
+
+# ---------------- ÍNDICE DE DIRECCIONES IP ----------------
+PREFIJO_SUBRED_REPORTE = 24 # Tamaño de subred usado para el reporte de utilización
+
+def _entero_ip_dispositivo(disp):
+    """IP del dispositivo como entero, o None si no tiene o no es válida."""
+    if isinstance(disp, Dispositivo):
+        return disp.ip_entero # Ya guardada como entero, sin volver a analizar el texto
+    ip = disp.get("IP")
+    if not ip or ip == "N/A":
+        return None
+    try:
+        return ip_a_entero(ip)
+    except ValueError:
+        return None
+
+def _capacidad_red(red):
+    """Direcciones asignables de la red (sin red ni broadcast, salvo en /31 y /32)."""
+    return red.num_addresses - 2 if red.prefixlen < 31 else red.num_addresses
+
+class IndiceIP:
+    """Direcciones IPv4 como enteros en un array ordenado (4 bytes por IP).
+
+    Las consultas por subred son dos búsquedas binarias. Admite valores repetidos para
+    poder detectar IPs duplicadas en inventarios cargados de archivos.
+    """
+
+    def __init__(self, enteros=()):
+        self._ips = array('I', sorted(enteros))
+
+    def __len__(self): return len(self._ips)
+
+    def agregar(self, entero):
+        bisect.insort(self._ips, entero)
+
+    def quitar(self, entero):
+        i = bisect.bisect_left(self._ips, entero)
+        if i < len(self._ips) and self._ips[i] == entero:
+            del self._ips[i]
+
+    def _limites(self, red):
+        return (bisect.bisect_left(self._ips, int(red.network_address)),
+                bisect.bisect_right(self._ips, int(red.broadcast_address)))
+
+    def en_red(self, red):
+        """Enteros (ordenados, con repetidos) de las IPs que pertenecen a la red."""
+        inicio, fin = self._limites(red)
+        return self._ips[inicio:fin]
+
+    def contar_en_red(self, red):
+        """Cantidad de direcciones distintas en uso dentro de la red."""
+        inicio, fin = self._limites(red)
+        return len(set(self._ips[inicio:fin])) if fin - inicio else 0
+
+    def siguiente_libre(self, red):
+        """Primera dirección asignable de la red que no está en uso (entero), o None si está llena."""
+        candidato, ultimo = int(red.network_address), int(red.broadcast_address)
+        if red.prefixlen < 31:
+            candidato, ultimo = candidato + 1, ultimo - 1
+        i = bisect.bisect_left(self._ips, candidato)
+        while i < len(self._ips) and self._ips[i] <= candidato: # Recorre sólo el bloque ocupado contiguo
+            if self._ips[i] == candidato:
+                candidato += 1
+            i += 1
+        return candidato if candidato <= ultimo else None
+
+    def duplicados(self):
+        """Enteros que aparecen más de una vez."""
+        return sorted({a for a, b in zip(self._ips, self._ips[1:]) if a == b})
+
+    def utilizacion(self, prefijo=PREFIJO_SUBRED_REPORTE):
+        """[(red, direcciones distintas en uso)] para cada subred /prefijo con al menos una IP."""
+        desplazamiento = 32 - prefijo
+        conteo, anterior = {}, None
+        for entero in self._ips:
+            if entero != anterior: # Los repetidos cuentan una sola vez
+                clave = entero >> desplazamiento
+                conteo[clave] = conteo.get(clave, 0) + 1
+                anterior = entero
+        return [(ipaddress.IPv4Network((clave << desplazamiento, prefijo)), usadas) for clave, usadas in conteo.items()]
+
+    @staticmethod
+    def superposiciones(redes):
+        """Pares de redes que se superponen (una contiene a la otra o comparten direcciones)."""
+        ordenadas = sorted(redes, key=lambda r: (int(r.network_address), -r.num_addresses))
+        pares = []
+        for i, red in enumerate(ordenadas):
+            fin = int(red.broadcast_address)
+            for otra in ordenadas[i + 1:]:
+                if int(otra.network_address) > fin:
+                    break
+                pares.append((red, otra))
+        return pares
+
+
+# ---------------- TOPOLOGÍA DE VLANs ----------------
+def _bitmap_vlans(disp):
+    """VLANs del dispositivo como entero (bit n = VLAN n)."""
+    if isinstance(disp, Dispositivo):
+        return disp.vlans_bitmap
+    mascara = 0
+    for vlan in disp.get("VLANS", []) or []:
+        mascara |= 1 << int(vlan)
+    return mascara
+
+def _bitset_desde_posiciones(posiciones):
+    """Arma de una vez un entero con los bits indicados (evita un OR por bit sobre enteros grandes)."""
+    if not posiciones:
+        return 0
+    datos = bytearray(max(posiciones) // 8 + 1)
+    for posicion in posiciones:
+        datos[posicion >> 3] |= 1 << (posicion & 7)
+    return int.from_bytes(datos, "little")
+
+def _posiciones_bitset(bitset):
+    """Posiciones de los bits encendidos de un entero grande, recorriendo sus bytes."""
+    datos = bitset.to_bytes((bitset.bit_length() + 7) // 8, "little")
+    return [i * 8 + bit for i, byte in enumerate(datos) if byte for bit in range(8) if byte >> bit & 1]
+
+class TopologiaVLAN:
+    """Pertenencia a VLANs en bitsets, en las dos direcciones.
+
+    Cada dispositivo ocupa una ranura y tiene un bitmap de 4094 bits con sus VLANs; cada
+    VLAN tiene un entero con un bit por ranura de dispositivo. Las preguntas cruzadas
+    (quién comparte VLAN con quién, VLANs con un solo miembro, diferencias con un switch de
+    referencia) se resuelven con AND/OR sobre enteros en lugar de comparar listas.
+    """
+
+    def __init__(self, dispositivos=()):
+        self._ranuras = {} # id(dispositivo) -> ranura
+        self._dispositivos = [] # ranura -> dispositivo (None si la ranura quedó libre)
+        self._vlans = [] # ranura -> bitmap de VLANs
+        self._libres = []
+        self.miembros = {} # vlan -> bitset de ranuras
+        posiciones = {}
+        for disp in dispositivos: # Carga inicial: cada bitset por VLAN se arma una sola vez
+            ranura = len(self._dispositivos)
+            self._ranuras[id(disp)] = ranura
+            self._dispositivos.append(disp)
+            self._vlans.append(_bitmap_vlans(disp))
+            for vlan in _bits_a_posiciones(self._vlans[ranura]):
+                posiciones.setdefault(vlan, []).append(ranura)
+        self.miembros = {vlan: _bitset_desde_posiciones(ranuras) for vlan, ranuras in posiciones.items()}
+
+    def agregar(self, disp):
+        vlans = _bitmap_vlans(disp)
+        if self._libres:
+            ranura = self._libres.pop()
+            self._dispositivos[ranura], self._vlans[ranura] = disp, vlans
+        else:
+            ranura = len(self._dispositivos)
+            self._dispositivos.append(disp)
+            self._vlans.append(vlans)
+        self._ranuras[id(disp)] = ranura
+        for vlan in _bits_a_posiciones(vlans):
+            self.miembros[vlan] = self.miembros.get(vlan, 0) | (1 << ranura)
+
+    def quitar(self, disp):
+        ranura = self._ranuras.pop(id(disp), None)
+        if ranura is None:
+            return
+        for vlan in _bits_a_posiciones(self._vlans[ranura]):
+            restante = self.miembros[vlan] & ~(1 << ranura)
+            if restante:
+                self.miembros[vlan] = restante
+            else:
+                del self.miembros[vlan]
+        self._dispositivos[ranura], self._vlans[ranura] = None, 0
+        self._libres.append(ranura)
+
+    def _de_bitset(self, bitset):
+        return [self._dispositivos[ranura] for ranura in _posiciones_bitset(bitset)]
+
+    def resumen(self):
+        return {"vlans_en_uso": len(self.miembros),
+                "dispositivos_con_vlans": sum(1 for vlans in self._vlans if vlans),
+                "miembros_por_vlan": {vlan: self.miembros[vlan].bit_count() for vlan in sorted(self.miembros)}}
+
+    def dispositivos_en(self, vlans, todas=True):
+        """Dispositivos que tienen todas las VLANs indicadas (o alguna, con todas=False)."""
+        bitsets = [self.miembros.get(vlan, 0) for vlan in vlans]
+        if not bitsets:
+            return []
+        resultado = bitsets[0]
+        for bitset in bitsets[1:]:
+            resultado = resultado & bitset if todas else resultado | bitset
+        return self._de_bitset(resultado)
+
+    def comparten_con(self, disp):
+        """[(otro dispositivo, VLANs en común)] de quienes comparten al menos una VLAN con disp."""
+        ranura = self._ranuras.get(id(disp))
+        if ranura is None:
+            return []
+        propias, vecinos = self._vlans[ranura], 0
+        for vlan in _bits_a_posiciones(propias):
+            vecinos |= self.miembros[vlan]
+        vecinos &= ~(1 << ranura)
+        return [(self._dispositivos[otra], _bits_a_posiciones(self._vlans[otra] & propias)) for otra in _posiciones_bitset(vecinos)]
+
+    def vlans_con_un_miembro(self):
+        """{vlan: dispositivo} de las VLANs configuradas en un único dispositivo (posible error)."""
+        return {vlan: self._dispositivos[bitset.bit_length() - 1]
+                for vlan, bitset in sorted(self.miembros.items()) if bitset.bit_count() == 1}
+
+    def divergencias(self, referencia, comparar_con):
+        """[(dispositivo, VLANs que le faltan, VLANs que sobran)] respecto de la referencia, solo los que difieren."""
+        base = _bitmap_vlans(referencia)
+        resultado = []
+        for disp in comparar_con:
+            if disp is referencia:
+                continue
+            ranura = self._ranuras.get(id(disp))
+            vlans = self._vlans[ranura] if ranura is not None else _bitmap_vlans(disp)
+            if vlans != base:
+                resultado.append((disp, _bits_a_posiciones(base & ~vlans), _bits_a_posiciones(vlans & ~base)))
+        return resultado
+
+
+# ---------------- CONSULTAS MULTICAMPO ----------------
+# Sintaxis de búsqueda: términos separados por espacios, todos deben cumplirse (AND).
+#   tipo:switch  ubicacion:distribucion  servicio:DHCP  vlan:20  ip:10.2.0.0/16  nombre:SW*
+# Un término admite varios valores separados por coma (OR): tipo:switch,router. Las IP
+# aceptan una dirección, una red CIDR o comodines (10.2.*). En el nombre, '*' y '?' son
+# comodines anclados al nombre completo; sin comodines se busca como subcadena. Un término
+# sin campo también busca en el nombre (compatible con la búsqueda de siempre).
+CAMPOS_CONSULTA = {"tipo": "TIPO", "ubicacion": "UBICACION", "ubicación": "UBICACION", "capa": "UBICACION",
+                   "servicio": "SERVICIOS", "vlan": "VLANS", "ip": "IP", "nombre": "NOMBRE"}
+MARCA_INICIO_NOMBRE, MARCA_FIN_NOMBRE = "\x02", "\x03" # Delimitan el nombre en el índice de trigramas
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+def _trigramas_nombre(nombre):
+    """Trigramas del nombre en minúsculas con marcas de inicio y fin (permiten buscar prefijos)."""
+    return _trigramas(MARCA_INICIO_NOMBRE + nombre.lower() + MARCA_FIN_NOMBRE)
+
+def _patron_nombre(texto):
+    """Devuelve (regex, trigramas requeridos) para una búsqueda por nombre."""
+    texto = texto.lower()
+    if "*" in texto or "?" in texto:
+        regex = re.compile("".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in texto) + r"\Z")
+        literal = MARCA_INICIO_NOMBRE + texto + MARCA_FIN_NOMBRE
+    else:
+        regex = re.compile(".*" + re.escape(texto))
+        literal = texto
+    trigramas = set()
+    for fragmento in re.split(r"[*?]", literal):
+        trigramas |= _trigramas(fragmento)
+    return regex, trigramas
+
+def _red_consulta(texto):
+    """'10.2.0.0/16', '10.2.0.5' o '10.2.*' -> ipaddress.IPv4Network."""
+    if "*" in texto:
+        octetos = texto.split(".")
+        fijos = []
+        for octeto in octetos:
+            if octeto == "*": break
+            fijos.append(octeto)
+        if len(octetos) > 4 or any(o != "*" for o in octetos[len(fijos):]):
+            raise ValueError(f"IP '{texto}' no válida: los comodines deben ir al final (p. ej. 10.2.*).")
+        texto = ".".join(fijos + ["0"] * (4 - len(fijos))) + f"/{8 * len(fijos)}"
+    try:
+        return ipaddress.IPv4Network(texto, strict=False)
+    except ValueError:
+        raise ValueError(f"IP o red '{texto}' no válida.")
+
+def _valor_consulta(campo, texto):
+    if campo == "TIPO": return _resolver_opcion(TIPOS_DISPOSITIVO, texto, "Tipo")
+    if campo == "UBICACION": return _resolver_opcion(CAPAS_RED, texto, "Ubicación")
+    if campo == "SERVICIOS": return _resolver_opcion(SERVICIOS_VALIDOS, texto, "Servicio")
+    if campo == "VLANS":
+        if not texto.isdigit() or not 1 <= int(texto) <= 4094:
+            raise ValueError(f"VLAN '{texto}' no válida (1-4094).")
+        return int(texto)
+    if campo == "IP": return _red_consulta(texto)
+    return _patron_nombre(texto)
+
+def analizar_consulta(texto):
+    """Convierte el texto de búsqueda en una lista de (campo, [valores]). Lanza ValueError si no es válido."""
+    terminos = []
+    for token in shlex.split(texto): # Comillas para nombres con espacios: nombre:"core 1"
+        campo_txt, separador, valor_txt = token.partition(":")
+        if separador:
+            campo = CAMPOS_CONSULTA.get(campo_txt.lower())
+            if campo is None:
+                raise ValueError(f"Campo '{campo_txt}' no reconocido. Campos: tipo, ubicacion, servicio, vlan, ip, nombre.")
+        else:
+            campo, valor_txt = "NOMBRE", token
+        valores = [_valor_consulta(campo, v.strip()) for v in valor_txt.split(",") if v.strip()]
+        if not valores:
+            raise ValueError(f"Falta el valor en '{token}'.")
+        terminos.append((campo, valores))
+    return terminos
+
+def _valor_coincide(disp, campo, valor):
+    if campo in ("TIPO", "UBICACION"):
+        return (disp.get(campo) or "N/A") == valor
+    if campo in ("SERVICIOS", "VLANS"):
+        return valor in (disp.get(campo) or [])
+    if campo == "IP":
+        try:
+            return ipaddress.IPv4Address(disp.get("IP")) in valor
+        except ValueError:
+            return False
+    return valor[0].match(disp.get("NOMBRE", "").lower()) is not None
+
+def _intersectar(grupos):
+    """Dispositivos presentes en todos los grupos {id: dispositivo}, partiendo del más chico."""
+    grupos = sorted(grupos, key=len)
+    claves = grupos[0].keys()
+    for grupo in grupos[1:]: # El conjunto de candidatos sólo se achica
+        claves = [clave for clave in claves if clave in grupo]
+        if not claves: break
+    return [grupos[0][clave] for clave in claves]
+
+def coincide_consulta(disp, terminos):
+    """Evalúa la consulta sobre un solo dispositivo (sin índices)."""
+    return all(any(_valor_coincide(disp, campo, v) for v in valores) for campo, valores in terminos)
+
+
+# ---------------- REPOSITORIO DE DISPOSITIVOS (ÍNDICES) ----------------
+def _comprobar_version(disp, actual, esperada):
+    """Lanza ConflictoVersion si 'actual' (el dispositivo como está guardado ahora) no es la versión editada."""
+    nombre = disp.get("NOMBRE")
+    if actual is None:
+        raise ConflictoVersion(f"Otro usuario eliminó o renombró '{nombre}' mientras se editaba.")
+    if actual.get("VERSION", 0) != esperada:
+        raise ConflictoVersion(f"Otro usuario modificó '{nombre}' mientras se editaba "
+                               f"(versión {esperada} → {actual.get('VERSION', 0)}); vuelva a cargarlo.")
+
+def _comprobar_unicidad(repositorio, datos, excluir=None):
+    """Lanza ConflictoVersion si otro usuario tomó el nombre o la IP de 'datos' desde la última lectura."""
+    nombre, ip = datos.get("NOMBRE"), datos.get("IP")
+    if nombre and repositorio.nombre_en_uso(nombre, excluir=excluir):
+        raise ConflictoVersion(f"Otro usuario guardó un dispositivo llamado '{nombre}'.")
+    otro = repositorio.ip_en_uso(ip, excluir=excluir) if ip and ip != "N/A" else None
+    if otro is not None:
+        raise ConflictoVersion(f"Otro usuario asignó la IP {ip} a '{otro.get('NOMBRE')}'.")
+
+_generaciones_inventario = itertools.count(1) # Común a todos los repositorios: un número nunca se repite
+
+class RepositorioDispositivos:
+    """Envuelve la lista de dispositivos y mantiene índices hash para búsquedas y unicidad.
+
+    Se comporta como una secuencia (len, iteración, índice) para que el código que recorre
+    la lista siga funcionando; toda alta, baja o modificación debe pasar por sus métodos
+    para que los índices se mantengan al día. Si recibe un almacenamiento (JSON con diario o
+    SQLite), cada cambio se persiste como una operación en él en lugar de reescribir todo,
+    con el bloqueo del almacenamiento tomado y después de aplicar lo que guardaron otros
+    procesos (ver sincronizar).
+    """
+    CAMPOS_INDEXADOS = ("TIPO", "UBICACION", "SERVICIOS", "VLANS")
+
+    def __init__(self, dispositivos=None, almacenamiento=None):
+        self.almacenamiento = almacenamiento
+        self.estadisticas = EstadisticasInventario()
+        self.dispositivos = []
+        self._por_nombre = {} # nombre en minúsculas -> dispositivo
+        self._por_ip = {} # ip (entero) -> dispositivo
+        self.indice_ip = None # IndiceIP; se arma de una vez al terminar la carga inicial
+        self._indices = {campo: {} for campo in self.CAMPOS_INDEXADOS} # campo -> valor -> {id: dispositivo}
+        self._trigramas = None # trigrama del nombre -> {id: dispositivo}; se arma en la primera búsqueda por nombre
+        self._topologia_vlan = None # TopologiaVLAN; se arma la primera vez que se consulta
+        self.generacion = next(_generaciones_inventario) # Cambia con cada alta, baja o modificación (ETag de la API)
+        for disp in dispositivos or []:
+            self.dispositivos.append(disp)
+            self._indexar(disp)
+        self._reconstruir_indice_ip()
+
+    def __len__(self): return len(self.dispositivos)
+    def __iter__(self): return iter(self.dispositivos)
+    def __getitem__(self, indice): return self.dispositivos[indice]
+
+    @staticmethod
+    def _valores_campo(disp, campo):
+        valor = disp.get(campo)
+        if campo in ("SERVICIOS", "VLANS"):
+            return valor or []
+        return [valor if valor else "N/A"]
+
+    def _indexar(self, disp):
+        nombre = disp.get("NOMBRE", "")
+        if nombre:
+            self._por_nombre[nombre.lower()] = disp
+        if self._trigramas is not None:
+            for trigrama in _trigramas_nombre(nombre):
+                self._trigramas.setdefault(trigrama, {})[id(disp)] = disp
+        entero = _entero_ip_dispositivo(disp)
+        if entero is not None:
+            self._por_ip[entero] = disp
+            if self.indice_ip is not None:
+                self.indice_ip.agregar(entero)
+        if self._topologia_vlan is not None:
+            self._topologia_vlan.agregar(disp)
+        for campo, indice in self._indices.items():
+            for valor in self._valores_campo(disp, campo):
+                indice.setdefault(valor, {})[id(disp)] = disp
+        self.estadisticas.registrar_alta(disp)
+        self.generacion = next(_generaciones_inventario)
+
+    def _desindexar(self, disp):
+        nombre = disp.get("NOMBRE", "")
+        if self._por_nombre.get(nombre.lower()) is disp:
+            del self._por_nombre[nombre.lower()]
+        for trigrama in _trigramas_nombre(nombre) if self._trigramas is not None else ():
+            grupo = self._trigramas.get(trigrama)
+            if grupo is not None:
+                grupo.pop(id(disp), None)
+                if not grupo:
+                    del self._trigramas[trigrama]
+        entero = _entero_ip_dispositivo(disp)
+        if entero is not None:
+            if self._por_ip.get(entero) is disp:
+                del self._por_ip[entero]
+            if self.indice_ip is not None:
+                self.indice_ip.quitar(entero)
+        if self._topologia_vlan is not None:
+            self._topologia_vlan.quitar(disp)
+        for campo, indice in self._indices.items():
+            for valor in self._valores_campo(disp, campo):
+                grupo = indice.get(valor)
+                if grupo is not None:
+                    grupo.pop(id(disp), None)
+                    if not grupo:
+                        del indice[valor]
+        self.estadisticas.registrar_baja(disp)
+        self.generacion = next(_generaciones_inventario)
+
+    def _reconstruir_indice_ip(self):
+        self.indice_ip = IndiceIP(e for e in map(_entero_ip_dispositivo, self.dispositivos) if e is not None)
+
+    def _registrar(self, operacion):
+        if self.almacenamiento is None:
+            return
+        try:
+            if self.almacenamiento.registrar(operacion):
+                self.almacenamiento.compactar(self.dispositivos, desde_diario=True)
+        except (IOError, sqlite3.Error) as e:
+            mostrar_mensaje(f"Error al guardar el cambio en '{self.almacenamiento.descripcion}': {e}", "error", esperar_enter=True)
+
+    @contextlib.contextmanager
+    def _escritura(self):
+        """Bloqueo del almacenamiento con el repositorio al día; da cuántos cambios ajenos se aplicaron."""
+        if self.almacenamiento is None:
+            yield 0
+            return
+        with self.almacenamiento.bloqueo:
+            yield self._aplicar_cambios_externos()
+
+    def sincronizar(self):
+        """Aplica lo que otros procesos guardaron desde la última lectura; devuelve cuántos cambios había.
+
+        Normalmente son solo las operaciones nuevas del diario; se recarga todo únicamente si
+        otro proceso compactó operaciones que esta sesión no había leído.
+        """
+        if self.almacenamiento is None or not self.almacenamiento.hay_cambios_externos():
+            return 0
+        with self.almacenamiento.bloqueo:
+            return self._aplicar_cambios_externos()
+
+    def _aplicar_cambios_externos(self):
+        completos, operaciones = self.almacenamiento.cambios_externos()
+        if completos is not None:
+            self._recargar(completos)
+            return len(completos)
+        for operacion in operaciones:
+            self._aplicar_operacion(operacion)
+        return len(operaciones)
+
+    def _recargar(self, dispositivos):
+        """Reemplaza el contenido y rearma los índices; los dispositivos que siguen existiendo
+        conservan su objeto, para que las ediciones abiertas sobre ellos sigan siendo válidas."""
+        reutilizados = []
+        for disp in dispositivos:
+            previo = self._por_nombre.get(disp.get("NOMBRE", "").lower())
+            if previo is not None:
+                previo.clear(); previo.update(disp)
+                disp = previo
+            reutilizados.append(disp)
+        self.__init__(reutilizados, self.almacenamiento)
+
+    def _aplicar_operacion(self, operacion):
+        """Aplica en memoria una operación que otro proceso ya guardó (no se vuelve a registrar)."""
+        tipo_op = operacion.get("op")
+        if tipo_op == "agregar":
+            nuevo = Dispositivo.desde_dict(operacion["dispositivo"])
+            existente = self.obtener_por_nombre(nuevo.get("NOMBRE"))
+            if existente is None:
+                self.dispositivos.append(nuevo)
+                self._indexar(nuevo)
+                return
+            self._desindexar(existente)
+            existente.clear(); existente.update(nuevo)
+            self._indexar(existente)
+        elif tipo_op == "modificar":
+            disp = self.obtener_por_nombre(operacion.get("nombre"))
+            if disp is not None:
+                self._desindexar(disp)
+                disp.update(operacion.get("cambios", {}))
+                self._indexar(disp)
+        elif tipo_op == "eliminar":
+            disp = self.obtener_por_nombre(operacion.get("nombre"))
+            if disp is not None:
+                self._quitar(disp)
+
+    def _quitar(self, disp):
+        for i, actual in enumerate(self.dispositivos):
+            if actual is disp:
+                del self.dispositivos[i]
+                break
+        else:
+            return False
+        self._desindexar(disp)
+        return True
+
+    def _verificar_version(self, disp, esperada, externos):
+        actual = disp
+        if externos and self.obtener_por_nombre(disp.get("NOMBRE")) is not disp:
+            actual = None # Otro proceso lo eliminó o lo renombró
+        _comprobar_version(disp, actual, esperada)
+
+    def agregar(self, disp):
+        with self._escritura() as externos:
+            if externos:
+                _comprobar_unicidad(self, disp)
+            disp["VERSION"] = 1
+            self.dispositivos.append(disp)
+            self._indexar(disp)
+            self._registrar({"op": "agregar", "dispositivo": disp})
+        return disp
+
+    def modificar(self, disp, cambios, version=None):
+        """Aplica un dict de cambios {CAMPO: valor} al dispositivo y reindexa.
+
+        'version' es la VERSION del dispositivo sobre la que se prepararon los cambios (por
+        defecto, la que tenía al llamar); si otro proceso lo guardó después, se lanza
+        ConflictoVersion y no se cambia nada.
+        """
+        esperada = disp.get("VERSION", 0) if version is None else version
+        with self._escritura() as externos:
+            self._verificar_version(disp, esperada, externos)
+            if externos:
+                _comprobar_unicidad(self, cambios, excluir=disp)
+            nombre_anterior = disp.get("NOMBRE")
+            cambios = dict(cambios, VERSION=esperada + 1)
+            self._desindexar(disp)
+            disp.update(cambios)
+            self._indexar(disp)
+            self._registrar({"op": "modificar", "nombre": nombre_anterior, "cambios": cambios})
+        return disp
+
+    def eliminar(self, disp, version=None):
+        """Quita el dispositivo; False si ya no estaba (p. ej. otro usuario lo eliminó antes)."""
+        esperada = disp.get("VERSION", 0) if version is None else version
+        with self._escritura() as externos:
+            if externos and self.obtener_por_nombre(disp.get("NOMBRE")) is not disp:
+                return False
+            _comprobar_version(disp, disp, esperada)
+            if not self._quitar(disp):
+                return False
+            self._registrar({"op": "eliminar", "nombre": disp.get("NOMBRE")})
+        return True
+
+    @contextlib.contextmanager
+    def operacion_masiva(self):
+        """Suspende el almacenamiento durante una carga masiva y persiste todo una sola vez al final.
+
+        El bloqueo se mantiene durante toda la operación para que nadie escriba en medio.
+        """
+        with self._escritura():
+            almacenamiento, self.almacenamiento = self.almacenamiento, None
+            self.indice_ip = None # Se reconstruye una sola vez al final en lugar de insertar ordenado cada IP
+            self._topologia_vlan = None # Se vuelve a armar en la próxima consulta
+            try:
+                yield self
+            finally:
+                self._reconstruir_indice_ip()
+                self.almacenamiento = almacenamiento
+                if almacenamiento is not None:
+                    almacenamiento.compactar(self.dispositivos)
+
+    def obtener_por_nombre(self, nombre):
+        return self._por_nombre.get((nombre or "").lower())
+
+    def obtener_por_ip(self, ip):
+        try:
+            return self._por_ip.get(ip_a_entero(ip))
+        except ValueError:
+            return None
+
+    def nombre_en_uso(self, nombre, excluir=None):
+        """Indica si otro dispositivo (distinto de 'excluir') ya usa ese nombre, sin distinguir mayúsculas."""
+        encontrado = self.obtener_por_nombre(nombre)
+        return encontrado is not None and encontrado is not excluir
+
+    def ip_en_uso(self, ip, excluir=None):
+        """Devuelve el dispositivo que ya usa la IP (distinto de 'excluir') o None."""
+        encontrado = self.obtener_por_ip(ip)
+        return encontrado if encontrado is not excluir else None
+
+    def siguiente_ip_libre(self, red):
+        """Primera IP asignable libre de la red (texto), o None si no quedan."""
+        entero = self.indice_ip.siguiente_libre(red)
+        return entero_a_ip(entero) if entero is not None else None
+
+    def ips_duplicadas(self):
+        """{ip: [nombres]} de las IPs asignadas a más de un dispositivo."""
+        duplicadas = set(map(entero_a_ip, self.indice_ip.duplicados()))
+        if not duplicadas:
+            return {}
+        resultado = {}
+        for disp in self.dispositivos:
+            if disp.get("IP") in duplicadas:
+                resultado.setdefault(disp.get("IP"), []).append(disp.get("NOMBRE"))
+        return resultado
+
+    def utilizacion_subredes(self, prefijo=PREFIJO_SUBRED_REPORTE, redes=None):
+        """[{red, usadas, capacidad, utilizacion, siguiente_libre}] para las redes dadas o, si no se
+        indican, para cada subred /prefijo con dispositivos."""
+        if redes is None:
+            pares = self.indice_ip.utilizacion(prefijo)
+        else:
+            pares = [(red, self.indice_ip.contar_en_red(red)) for red in redes]
+        resultado = []
+        for red, usadas in sorted(pares, key=lambda par: int(par[0].network_address)):
+            capacidad = _capacidad_red(red)
+            resultado.append({"red": str(red), "usadas": usadas, "capacidad": capacidad,
+                              "utilizacion": round(100 * usadas / capacidad, 1) if capacidad else 0.0,
+                              "siguiente_libre": self.siguiente_ip_libre(red)})
+        return resultado
+
+    def topologia_vlan(self):
+        """TopologiaVLAN del inventario, armada en la primera llamada y mantenida al día después."""
+        if self._topologia_vlan is None:
+            self._topologia_vlan = TopologiaVLAN(self.dispositivos)
+        return self._topologia_vlan
+
+    def divergencias_vlan(self, referencia):
+        """Diferencias de VLANs de los dispositivos del mismo tipo que la referencia."""
+        mismo_tipo = self._indices["TIPO"].get(referencia.get("TIPO") or "N/A", {}).values()
+        return self.topologia_vlan().divergencias(referencia, sorted(mismo_tipo, key=lambda d: d.get("NOMBRE", "").lower()))
+
+    def con_ip(self):
+        if not self._por_ip:
+            return []
+        return [d for d in self.dispositivos if d.get("IP") and d.get("IP") != "N/A"]
+
+    def filtrar(self, tipo=None, ubicacion=None, servicio=None, vlan=None):
+        """Intersecta los índices secundarios; los criterios en None no filtran."""
+        criterios = [(campo, valor) for campo, valor in (("TIPO", tipo), ("UBICACION", ubicacion), ("SERVICIOS", servicio), ("VLANS", vlan)) if valor is not None]
+        if not criterios:
+            return list(self.dispositivos)
+        return _intersectar([self._indices[campo].get(valor, {}) for campo, valor in criterios])
+
+    def iterar(self, tipo=None, ubicacion=None, servicio=None, vlan=None):
+        """Como filtrar, pero sin copiar la lista cuando no hay criterios (exportaciones)."""
+        if tipo is None and ubicacion is None and servicio is None and vlan is None:
+            return iter(self.dispositivos)
+        return iter(self.filtrar(tipo, ubicacion, servicio, vlan))
+
+    def _coincidencias_nombre(self, patron):
+        """{id: dispositivo} cuyo nombre cumple el patrón (regex, trigramas) de _patron_nombre."""
+        regex, trigramas = patron
+        if trigramas: # Candidatos: intersección de los trigramas; luego se confirma con la regex
+            if self._trigramas is None:
+                self._trigramas = {}
+                for disp in self._por_nombre.values():
+                    for trigrama in _trigramas_nombre(disp.get("NOMBRE", "")):
+                        self._trigramas.setdefault(trigrama, {})[id(disp)] = disp
+            candidatos = _intersectar([self._trigramas.get(t, {}) for t in trigramas])
+        else: # Patrón de menos de tres caracteres: se recorren los nombres
+            candidatos = self._por_nombre.values()
+        return {id(d): d for d in candidatos if regex.match(d.get("NOMBRE", "").lower())}
+
+    def _candidatos(self, campo, valor):
+        if campo in self._indices:
+            return self._indices[campo].get(valor, {})
+        if campo == "NOMBRE":
+            return self._coincidencias_nombre(valor)
+        # campo IP: búsqueda binaria en el índice ordenado
+        encontrados = (self._por_ip.get(e) for e in self.indice_ip.en_red(valor))
+        return {id(d): d for d in encontrados if d is not None}
+
+    def consultar(self, terminos):
+        """Evalúa una consulta de analizar_consulta intersectando los índices; resultado ordenado por nombre."""
+        if not terminos:
+            return sorted(self.dispositivos, key=lambda d: d.get("NOMBRE", "").lower())
+        grupos = []
+        for campo, valores in terminos:
+            if len(valores) == 1:
+                grupos.append(self._candidatos(campo, valores[0]))
+            else: # Varios valores del mismo campo: unión
+                union = {}
+                for valor in valores:
+                    union.update(self._candidatos(campo, valor))
+                grupos.append(union)
+        return sorted(_intersectar(grupos), key=lambda d: d.get("NOMBRE", "").lower())
+
+    def buscar_por_nombre(self, texto):
+        """Dispositivos cuyo nombre contiene el texto, sin distinguir mayúsculas."""
+        return list(self._coincidencias_nombre(_patron_nombre(texto or "")).values())
+
+    def dispositivos_por(self, campo, valor):
+        """Dispositivos cuyo campo indexado contiene el valor (p. ej. todos los de la VLAN 20)."""
+        return list(self._indices[campo].get(valor, {}).values())
+
+    def conteo_por(self, campo):
+        """Devuelve {valor: cantidad de dispositivos} para un campo indexado."""
+        return {valor: len(grupo) for valor, grupo in self._indices[campo].items()}
+
+
+class EstadisticasSQLite(EstadisticasInventario):
+    """Estadísticas calculadas en SQL en cada consulta (no hay contadores en memoria)."""
+
+    def __init__(self, almacenamiento):
+        super().__init__()
+        self.almacenamiento = almacenamiento
+
+    def como_dict(self):
+        return self.almacenamiento.estadisticas()
+
+
+class RepositorioSQLite:
+    """Vista del inventario sobre AlmacenamientoSQLite que no lo carga en memoria.
+
+    Ofrece la parte de la interfaz de RepositorioDispositivos que usan los comandos de la
+    línea de comandos (filtrar, buscar, unicidad, alta/baja/modificación, estadísticas),
+    resolviendo cada consulta en SQL. Los dispositivos devueltos son copias: para cambiarlos
+    hay que pasar por modificar().
+    """
+    CAMPOS_FILTRO = {"TIPO": "tipo", "UBICACION": "ubicacion", "SERVICIOS": "servicio", "VLANS": "vlan"}
+
+    def __init__(self, almacenamiento):
+        self.almacenamiento = almacenamiento
+        self.estadisticas = EstadisticasSQLite(almacenamiento)
+
+    def __len__(self): return self.almacenamiento.contar()
+    def __iter__(self): return self.almacenamiento.iterar()
+
+    def sincronizar(self):
+        return 0 # Cada consulta ya lee la base
+
+    def agregar(self, disp):
+        with self.almacenamiento.bloqueo:
+            _comprobar_unicidad(self, disp)
+            disp["VERSION"] = 1
+            self.almacenamiento.registrar({"op": "agregar", "dispositivo": disp})
+        return disp
+
+    def modificar(self, disp, cambios, version=None):
+        """Como RepositorioDispositivos.modificar: ConflictoVersion si la base ya tiene otra versión."""
+        esperada = disp.get("VERSION", 0) if version is None else version
+        nombre_anterior = disp.get("NOMBRE")
+        with self.almacenamiento.bloqueo:
+            _comprobar_version(disp, self.obtener_por_nombre(nombre_anterior), esperada)
+            _comprobar_unicidad(self, cambios, excluir=disp)
+            cambios = dict(cambios, VERSION=esperada + 1)
+            disp.update(cambios)
+            self.almacenamiento.registrar({"op": "modificar", "nombre": nombre_anterior, "cambios": cambios})
+        return disp
+
+    def eliminar(self, disp, version=None):
+        esperada = disp.get("VERSION", 0) if version is None else version
+        with self.almacenamiento.bloqueo:
+            actual = self.obtener_por_nombre(disp.get("NOMBRE"))
+            if actual is None:
+                return False
+            _comprobar_version(disp, actual, esperada)
+            self.almacenamiento.registrar({"op": "eliminar", "nombre": disp.get("NOMBRE")})
+        return True
+
+    def obtener_por_nombre(self, nombre):
+        return next(self.almacenamiento.iterar(nombre=nombre or ""), None)
+
+    def obtener_por_ip(self, ip):
+        return next(self.almacenamiento.iterar(ip=ip), None)
+
+    @staticmethod
+    def _es_el_mismo(disp, otro):
+        return otro is not None and disp.get("NOMBRE", "").lower() == otro.get("NOMBRE", "").lower()
+
+    def nombre_en_uso(self, nombre, excluir=None):
+        encontrado = self.obtener_por_nombre(nombre)
+        return encontrado is not None and not self._es_el_mismo(encontrado, excluir)
+
+    def ip_en_uso(self, ip, excluir=None):
+        encontrado = self.obtener_por_ip(ip)
+        return encontrado if encontrado is not None and not self._es_el_mismo(encontrado, excluir) else None
+
+    def con_ip(self):
+        return list(self.almacenamiento.iterar(con_ip=True))
+
+    def iterar(self, tipo=None, ubicacion=None, servicio=None, vlan=None):
+        return self.almacenamiento.iterar(tipo=tipo, ubicacion=ubicacion, servicio=servicio, vlan=vlan)
+
+    def filtrar(self, tipo=None, ubicacion=None, servicio=None, vlan=None):
+        return list(self.iterar(tipo, ubicacion, servicio, vlan))
+
+    def buscar_por_nombre(self, texto):
+        return list(self.almacenamiento.iterar(nombre_contiene=texto or ""))
+
+    def consultar(self, terminos):
+        """Los términos de un solo valor por tipo, ubicación, servicio o VLAN se filtran en SQL; el resto en Python."""
+        filtros = {}
+        for campo, valores in terminos:
+            clave = self.CAMPOS_FILTRO.get(campo)
+            if clave is not None and len(valores) == 1 and clave not in filtros:
+                filtros[clave] = valores[0]
+        encontrados = [d for d in self.almacenamiento.iterar(**filtros) if coincide_consulta(d, terminos)]
+        return sorted(encontrados, key=lambda d: d.get("NOMBRE", "").lower())
+
+    def dispositivos_por(self, campo, valor):
+        return list(self.almacenamiento.iterar(**{self.CAMPOS_FILTRO[campo]: valor}))
+
+    def conteo_por(self, campo):
+        return self.almacenamiento.conteo_por(campo)
+
+
+# ---------------- INSTANTÁNEA BINARIA (MMAP) ----------------
+# Copia compilada y de solo lectura del inventario para consultas sin cargar el JSON. Se
+# genera con 'compile-snapshot' y se abre con mmap: solo se leen las páginas de los
+# registros consultados, el arranque no depende del tamaño del inventario y varias
+# sesiones del mismo equipo comparten la copia en la caché de páginas del sistema.
+# Estructura (enteros en el orden de bytes del equipo, secciones alineadas a 8 bytes):
+#   cabecera        FORMATO_CABECERA_INSTANTANEA (incluye el sello del JSON y del diario)
+#   registros       8 x uint32 por dispositivo: nombre, tipo, ip, ubicación, servicios y
+#                   extra (ids en la tabla de cadenas), inicio y cantidad de VLANs
+#   cadenas         uint64 de desplazamientos (n + 1) y los textos UTF-8 sin repetir
+#   vlans           uint16 consecutivas
+#   índice nombres  uint32: registros ordenados por nombre en minúsculas
+#   índice IPs      uint32: IPs ordenadas y a continuación el registro de cada una
+# Los servicios se guardan unidos por SEPARADOR_INSTANTANEA y los campos desconocidos como
+# JSON en 'extra'. El sello permite descartar una instantánea vieja: si el JSON o el diario
+# cambiaron desde que se compiló, se vuelve a usar el almacenamiento normal.
+MAGIA_INSTANTANEA = b"DISPSNAP"
+VERSION_INSTANTANEA = 1
+FORMATO_CABECERA_INSTANTANEA = struct.Struct("<8sHHII8Q4q")
+CAMPOS_REGISTRO_INSTANTANEA = 8
+SEPARADOR_INSTANTANEA = "\x1f"
+
+def ruta_instantanea_binaria(almacenamiento):
+    """dispositivos_red.json -> dispositivos_red.snap (junto al JSON del almacenamiento)."""
+    return os.path.splitext(almacenamiento.ruta_instantanea)[0] + ".snap"
+
+def _sello_archivo(ruta):
+    try:
+        estado = os.stat(ruta)
+        return estado.st_mtime_ns, estado.st_size
+    except FileNotFoundError:
+        return 0, 0
+
+def sello_almacenamiento(almacenamiento):
+    """(mtime, tamaño) del JSON y del diario: cambia con cualquier alta, baja, modificación o compactación."""
+    return _sello_archivo(almacenamiento.ruta_instantanea) + _sello_archivo(almacenamiento.ruta_diario)
+
+def _alinear(f):
+    relleno = -f.tell() % 8
+    f.write(b"\0" * relleno)
+    return f.tell()
+
+def compilar_instantanea(dispositivos, ruta, sello=(0, 0, 0, 0)):
+    """Escribe la instantánea binaria de forma atómica (temporal + rename). Devuelve la cantidad de registros."""
+    ids, cadenas = {"": 0}, [b""]
+
+    def id_cadena(texto):
+        texto = "" if texto is None else str(texto)
+        if texto not in ids:
+            ids[texto] = len(cadenas)
+            cadenas.append(texto.encode("utf-8"))
+        return ids[texto]
+
+    registros, vlans, nombres, ips = array("I"), array("H"), [], []
+    for i, disp in enumerate(dispositivos):
+        lista_vlans = disp.get("VLANS") or []
+        extra = {campo: valor for campo, valor in disp.items() if campo not in Dispositivo.CAMPOS}
+        registros.extend((id_cadena(disp.get("NOMBRE")), id_cadena(disp.get("TIPO")), id_cadena(disp.get("IP")),
+                          id_cadena(disp.get("UBICACION")), id_cadena(SEPARADOR_INSTANTANEA.join(disp.get("SERVICIOS") or [])),
+                          id_cadena(json.dumps(extra, ensure_ascii=False) if extra else ""), len(vlans), len(lista_vlans)))
+        vlans.extend(lista_vlans)
+        nombres.append((disp.get("NOMBRE", "").lower(), i))
+        entero = _entero_ip_dispositivo(disp)
+        if entero is not None:
+            ips.append((entero, i))
+    total = len(nombres)
+    indice_nombres = array("I", (i for _, i in sorted(nombres)))
+    ips.sort()
+    indice_ips = array("I", (entero for entero, _ in ips))
+    indice_ips.extend(i for _, i in ips)
+    desplazamientos, posicion = array("Q", [0]), 0
+    for texto in cadenas:
+        posicion += len(texto)
+        desplazamientos.append(posicion)
+
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, ruta_tmp = tempfile.mkstemp(prefix=".instantanea_", suffix=".tmp", dir=directorio)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * FORMATO_CABECERA_INSTANTANEA.size)
+            secciones = []
+            for bloque in (registros, desplazamientos, b"".join(cadenas), vlans, indice_nombres, indice_ips):
+                secciones.append(_alinear(f))
+                f.write(bloque if isinstance(bloque, bytes) else bloque.tobytes())
+            f.seek(0)
+            f.write(FORMATO_CABECERA_INSTANTANEA.pack(MAGIA_INSTANTANEA, VERSION_INSTANTANEA, sys.byteorder == "little",
+                                                     total, len(cadenas), *secciones, len(ips), len(vlans), *sello))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta_tmp, ruta)
+    except BaseException:
+        os.remove(ruta_tmp)
+        raise
+    return total
+
+class InstantaneaMmap:
+    """Inventario de solo lectura sobre una instantánea compilada, abierta con mmap.
+
+    Ofrece la parte de consulta de la interfaz de RepositorioDispositivos (iteración, búsqueda
+    por nombre e IP, filtros y consultas multicampo). Cada dispositivo se decodifica al pedirlo
+    y es una copia: los cambios se hacen sobre el almacenamiento normal.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, "rb") as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        vistas = []
+        try:
+            if len(self._mapa) < FORMATO_CABECERA_INSTANTANEA.size:
+                raise ValueError(f"'{ruta}' no es una instantánea de dispositivos.")
+            (magia, version, little_endian, self._total, total_cadenas, inicio_registros, inicio_desplazamientos,
+             self._inicio_cadenas, inicio_vlans, inicio_nombres, inicio_ips, total_ips, total_vlans,
+             *sello) = FORMATO_CABECERA_INSTANTANEA.unpack_from(self._mapa)
+            if magia != MAGIA_INSTANTANEA or version != VERSION_INSTANTANEA:
+                raise ValueError(f"'{ruta}' no es una instantánea de dispositivos (versión {VERSION_INSTANTANEA}).")
+            if bool(little_endian) != (sys.byteorder == "little"):
+                raise ValueError(f"'{ruta}' se compiló en un equipo con otro orden de bytes; vuelva a compilarla.")
+            self.sello = tuple(sello)
+            danada = ValueError(f"'{ruta}' está truncada o dañada; vuelva a compilarla con compile-snapshot.")
+            secciones = ((inicio_registros, self._total * CAMPOS_REGISTRO_INSTANTANEA * 4), (inicio_desplazamientos, (total_cadenas + 1) * 8),
+                         (inicio_vlans, total_vlans * 2), (inicio_nombres, self._total * 4), (inicio_ips, total_ips * 8))
+            if any(inicio < FORMATO_CABECERA_INSTANTANEA.size or inicio + tamano > len(self._mapa) for inicio, tamano in secciones):
+                raise danada
+            vista = memoryview(self._mapa)
+            vistas.append(vista)
+
+            def seccion(inicio, tamano, formato):
+                tipada = vista[inicio:inicio + tamano].cast(formato)
+                vistas.append(tipada)
+                return tipada
+
+            # Vistas tipadas sobre el mapa: indexarlas lee directamente de la página, sin copiar
+            self._registros = seccion(inicio_registros, self._total * CAMPOS_REGISTRO_INSTANTANEA * 4, "I")
+            self._desplazamientos = seccion(inicio_desplazamientos, (total_cadenas + 1) * 8, "Q")
+            self._vlans = seccion(inicio_vlans, total_vlans * 2, "H")
+            self._por_nombre = seccion(inicio_nombres, self._total * 4, "I")
+            self._ips = seccion(inicio_ips, total_ips * 4, "I")
+            self._ips_registro = seccion(inicio_ips + total_ips * 4, total_ips * 4, "I")
+            if self._inicio_cadenas < FORMATO_CABECERA_INSTANTANEA.size or self._inicio_cadenas + self._desplazamientos[-1] > len(self._mapa):
+                raise danada
+            vista.release()
+        except (ValueError, TypeError, struct.error):
+            for abierta in reversed(vistas):
+                abierta.release() # mmap no se puede cerrar mientras haya vistas abiertas
+            self._mapa.close()
+            raise
+        self._cadenas = {} # Caché de textos repetidos (tipos, ubicaciones, servicios)
+
+    @classmethod
+    def abrir_si_vigente(cls, almacenamiento):
+        """La instantánea del almacenamiento JSON si existe y coincide con el JSON y el diario actuales; si no, None."""
+        if not isinstance(almacenamiento, AlmacenamientoJSON):
+            return None
+        ruta = ruta_instantanea_binaria(almacenamiento)
+        if not os.path.exists(ruta):
+            return None
+        try:
+            instantanea = cls(ruta)
+        except (OSError, ValueError):
+            return None
+        if instantanea.sello != sello_almacenamiento(almacenamiento):
+            instantanea.cerrar()
+            return None
+        return instantanea
+
+    def cerrar(self):
+        if self._mapa is None:
+            return
+        for vista in (self._registros, self._desplazamientos, self._vlans, self._por_nombre, self._ips, self._ips_registro):
+            vista.release() # mmap no se puede cerrar mientras haya vistas abiertas
+        self._mapa.close()
+        self._mapa = None
+
+    def _texto(self, id_cadena):
+        return self._mapa[self._inicio_cadenas + self._desplazamientos[id_cadena]:
+                          self._inicio_cadenas + self._desplazamientos[id_cadena + 1]].decode("utf-8")
+
+    def _cadena(self, id_cadena):
+        """Texto de la tabla de cadenas; los que se repiten entre registros quedan en caché."""
+        texto = self._cadenas.get(id_cadena)
+        if texto is None:
+            texto = self._texto(id_cadena)
+            if len(self._cadenas) < 4096:
+                self._cadenas[id_cadena] = texto
+        return texto
+
+    def _campo(self, indice, campo):
+        return self._registros[indice * CAMPOS_REGISTRO_INSTANTANEA + campo]
+
+    def _nombre(self, indice):
+        return self._texto(self._campo(indice, 0)) # Los nombres no se repiten: sin caché
+
+    def _dispositivo(self, indice):
+        base = indice * CAMPOS_REGISTRO_INSTANTANEA
+        id_nombre, id_tipo, id_ip, id_ubicacion, id_servicios, id_extra, inicio_vlans, total_vlans = self._registros[base:base + CAMPOS_REGISTRO_INSTANTANEA]
+        servicios = self._cadena(id_servicios)
+        disp = Dispositivo(self._cadena(id_tipo), self._nombre(indice), self._cadena(id_ip), self._cadena(id_ubicacion),
+                           servicios.split(SEPARADOR_INSTANTANEA) if servicios else [],
+                           self._vlans[inicio_vlans:inicio_vlans + total_vlans].tolist())
+        if id_extra:
+            disp.update(json.loads(self._cadena(id_extra)))
+        return disp
+
+    def __len__(self): return self._total
+    def __iter__(self): return (self._dispositivo(i) for i in range(self._total))
+
+    def obtener_por_nombre(self, nombre):
+        buscado = (nombre or "").lower()
+        bajo, alto = 0, self._total
+        while bajo < alto: # Búsqueda binaria sobre el índice de nombres
+            medio = (bajo + alto) // 2
+            if self._nombre(self._por_nombre[medio]).lower() < buscado:
+                bajo = medio + 1
+            else:
+                alto = medio
+        if bajo < self._total and self._nombre(self._por_nombre[bajo]).lower() == buscado:
+            return self._dispositivo(self._por_nombre[bajo])
+        return None
+
+    def _rango_ips(self, primero, ultimo):
+        return bisect.bisect_left(self._ips, primero), bisect.bisect_right(self._ips, ultimo)
+
+    def obtener_por_ip(self, ip):
+        try:
+            entero = ip_a_entero(ip)
+        except ValueError:
+            return None
+        inicio, fin = self._rango_ips(entero, entero)
+        return self._dispositivo(self._ips_registro[inicio]) if inicio < fin else None
+
+    def en_red(self, red):
+        """Dispositivos con IP dentro de la red, en orden de IP (usa el índice de IPs)."""
+        return [self._dispositivo(self._ips_registro[i]) for i in range(*self._rango_red(red))]
+
+    def _rango_red(self, red):
+        return self._rango_ips(int(red.network_address), int(red.broadcast_address))
+
+    def nombre_en_uso(self, nombre, excluir=None):
+        encontrado = self.obtener_por_nombre(nombre)
+        return encontrado is not None and not RepositorioSQLite._es_el_mismo(encontrado, excluir)
+
+    def ip_en_uso(self, ip, excluir=None):
+        encontrado = self.obtener_por_ip(ip)
+        return encontrado if encontrado is not None and not RepositorioSQLite._es_el_mismo(encontrado, excluir) else None
+
+    def con_ip(self):
+        return [self._dispositivo(i) for i in sorted(self._ips_registro)]
+
+    def iterar(self, tipo=None, ubicacion=None, servicio=None, vlan=None):
+        for i in range(self._total):
+            # Tipo y ubicación se comparan antes de decodificar el registro completo
+            if tipo is not None and self._cadena(self._campo(i, 1)) != tipo:
+                continue
+            if ubicacion is not None and (self._cadena(self._campo(i, 3)) or "N/A") != ubicacion:
+                continue
+            disp = self._dispositivo(i)
+            if servicio is not None and servicio not in disp["SERVICIOS"]:
+                continue
+            if vlan is not None and vlan not in disp["VLANS"]:
+                continue
+            yield disp
+
+    def filtrar(self, tipo=None, ubicacion=None, servicio=None, vlan=None):
+        return list(self.iterar(tipo, ubicacion, servicio, vlan))
+
+    def consultar(self, terminos):
+        """Los términos de IP se resuelven con el índice de IPs (igual que RepositorioDispositivos); el resto, registro por registro."""
+        candidatos = None
+        for campo, valores in terminos:
+            if campo == "IP":
+                en_redes = {self._ips_registro[i] for red in valores for i in range(*self._rango_red(red))}
+                candidatos = en_redes if candidatos is None else candidatos & en_redes
+        otros = [(campo, valores) for campo, valores in terminos if campo != "IP"]
+        indices = range(self._total) if candidatos is None else sorted(candidatos)
+        encontrados = [d for d in map(self._dispositivo, indices) if coincide_consulta(d, otros)]
+        return sorted(encontrados, key=lambda d: d.get("NOMBRE", "").lower())
+
+    def buscar_por_nombre(self, texto):
+        return self.consultar([("NOMBRE", [_valor_consulta("NOMBRE", texto)])])
+
+
+# ---------------- EDICIÓN TRANSACCIONAL DE DISPOSITIVOS ----------------
+# Los cambios de una sesión de edición se acumulan en EdicionDispositivo sin tocar el
+# dispositivo ni el almacenamiento, y se confirman juntos con una sola llamada a
+# modificar() del repositorio (una línea del diario o una transacción SQLite). Cada paso
+# guarda solo los campos que cambió como (campo, valor anterior, valor nuevo), lo que
+# alcanza para deshacerlo y rehacerlo sin copiar el dispositivo completo. La edición
+# recuerda la VERSION con la que empezó: si otro usuario guarda el dispositivo antes,
+# confirmar() lanza ConflictoVersion en lugar de pisar sus cambios.
+EDICION_MAX_DESHACER = 100 # Pasos que se pueden deshacer en una sesión de edición
+
+class EdicionDispositivo:
+    """Cambios pendientes sobre un dispositivo, con pilas de deshacer y rehacer."""
+
+    def __init__(self, repositorio, disp, max_pasos=EDICION_MAX_DESHACER):
+        self.repositorio = repositorio
+        self.dispositivo = disp
+        self.version = disp.get("VERSION", 0) # Versión sobre la que se preparan los cambios
+        self._pendientes = {} # campo -> valor nuevo (solo los que difieren del dispositivo)
+        self._deshacer = deque(maxlen=max_pasos)
+        self._rehacer = []
+
+    def get(self, campo, defecto=None):
+        """Valor del campo con los cambios pendientes aplicados."""
+        if campo in self._pendientes:
+            return self._pendientes[campo]
+        return self.dispositivo.get(campo, defecto)
+
+    def vista(self):
+        """Dict del dispositivo tal como quedaría al confirmar (para mostrarlo)."""
+        datos = dict(self.dispositivo.items())
+        datos.update(self._pendientes)
+        return datos
+
+    @property
+    def cambios(self):
+        return dict(self._pendientes)
+
+    @property
+    def puede_deshacer(self): return bool(self._deshacer)
+
+    @property
+    def puede_rehacer(self): return bool(self._rehacer)
+
+    def _fijar(self, campo, valor):
+        if valor == self.dispositivo.get(campo):
+            self._pendientes.pop(campo, None) # Volvió al valor guardado: no hay nada que escribir
+        else:
+            self._pendientes[campo] = valor
+
+    def cambiar(self, cambios):
+        """Prepara un dict {CAMPO: valor} como un solo paso. Devuelve False si no cambia nada."""
+        paso = tuple((campo, self.get(campo), valor) for campo, valor in cambios.items() if self.get(campo) != valor)
+        if not paso:
+            return False
+        for campo, _, nuevo in paso:
+            self._fijar(campo, nuevo)
+        self._deshacer.append(paso)
+        self._rehacer.clear()
+        return True
+
+    def deshacer(self):
+        """Revierte el último paso y lo devuelve (o None si no hay)."""
+        if not self._deshacer:
+            return None
+        paso = self._deshacer.pop()
+        for campo, anterior, _ in paso:
+            self._fijar(campo, anterior)
+        self._rehacer.append(paso)
+        return paso
+
+    def rehacer(self):
+        """Vuelve a aplicar el último paso deshecho y lo devuelve (o None si no hay)."""
+        if not self._rehacer:
+            return None
+        paso = self._rehacer.pop()
+        for campo, _, nuevo in paso:
+            self._fijar(campo, nuevo)
+        self._deshacer.append(paso)
+        return paso
+
+    def confirmar(self, sobrescribir=False):
+        """Aplica todos los cambios pendientes con una sola escritura. Devuelve True si había cambios.
+
+        Con sobrescribir=True se guardan sobre la versión actual aunque otro usuario la haya cambiado.
+        """
+        if not self._pendientes:
+            return False
+        version = None if sobrescribir else self.version
+        self.repositorio.modificar(self.dispositivo, dict(self._pendientes), version=version)
+        self.version = self.dispositivo.get("VERSION", 0)
+        self.descartar()
+        return True
+
+    def descartar(self):
+        self._pendientes.clear()
+        self._deshacer.clear()
+        self._rehacer.clear()
+
+def _texto_valor_edicion(valor):
+    if isinstance(valor, (list, tuple)):
+        return ", ".join(map(str, valor)) or "Ninguno"
+    return str(valor if valor not in (None, "") else "N/A")
+
+def describir_paso_edicion(paso):
+    """'CAMPO: anterior → nuevo' para cada campo de un paso de edición."""
+    return "; ".join(f"{campo}: {_texto_valor_edicion(anterior)} → {_texto_valor_edicion(nuevo)}" for campo, anterior, nuevo in paso)
+
+def confirmar_edicion_interactiva(edicion):
+    """Confirma la edición; si otro usuario guardó el dispositivo antes, muestra cómo quedó y
+    pregunta si sobrescribirlo. Devuelve True si se guardaron los cambios."""
+    try:
+        return edicion.confirmar()
+    except ConflictoVersion as e:
+        mostrar_mensaje(str(e), "advertencia")
+    disp = edicion.dispositivo
+    if edicion.repositorio.obtener_por_nombre(disp.get("NOMBRE")) is not disp:
+        edicion.descartar()
+        mostrar_mensaje("El dispositivo ya no existe; los cambios se descartaron.", "error", esperar_enter=True)
+        return False
+    print(f"{Color.BOLD}Versión guardada por el otro usuario:{Color.END}")
+    print(formatear_dispositivo_para_mostrar(disp))
+    respuesta = input(f"{Color.YELLOW}❓ ¿Guardar igualmente sus cambios ({', '.join(edicion.cambios)}) sobre esta versión? (s/n): {Color.END}").strip().lower()
+    if respuesta != 's':
+        edicion.descartar()
+        mostrar_mensaje("Cambios descartados.", "info"); pausa(1)
+        return False
+    try:
+        return edicion.confirmar(sobrescribir=True)
+    except ConflictoVersion as e: # Otro usuario volvió a guardarlo en medio
+        mostrar_mensaje(f"{e} Los cambios no se guardaron.", "error", esperar_enter=True)
+        return False
+
+
 # ---------------- FUNCIONES DE MENÚ Y NAVEGACIÓN ----------------
-def push_menu_history(menu_function): menu_history.append(menu_function)
-def pop_menu_history():
-    if len(menu_history) > 1: menu_history.pop()
-    elif len(menu_history) == 1: return menu_history[0]
-    return menu_history[-1] if menu_history else None
+# La navegación es un bucle plano (ejecutar_bucle_menus): cada pantalla es una función sin
+# argumentos que se ejecuta y devuelve qué hacer a continuación, en lugar de llamar a la
+# siguiente pantalla. Así la profundidad de la pila de Python se mantiene constante sin
+# importar cuánto dure la sesión. Una pantalla puede devolver:
+#   - otra pantalla (función) -> se apila y se muestra
+#   - NAV_VOLVER              -> se vuelve a la pantalla anterior
+#   - NAV_PRINCIPAL           -> se vuelve al menú principal
+#   - NAV_REPETIR             -> se vuelve a mostrar la misma pantalla
+#   - NAV_SALIR               -> termina el bucle
+class AccionNavegacion:
+    """Acción que una pantalla devuelve al bucle de menús."""
+    def __init__(self, nombre): self.nombre = nombre
+    def __repr__(self): return f"<{self.nombre}>"
+
+NAV_VOLVER = AccionNavegacion("volver")
+NAV_PRINCIPAL = AccionNavegacion("principal")
+NAV_REPETIR = AccionNavegacion("repetir")
+NAV_SALIR = AccionNavegacion("salir")
 
 
 def ir_a_menu_principal():
-    global menu_history
-    if menu_history:
-        menu_principal_func = menu_history[0]
-        menu_history = [menu_principal_func]
-        mostrar_barra_progreso(0.5, "Volviendo al Menú Principal...")
-        menu_principal_func()
-    else:
-        mostrar_mensaje("Error: No se encuentra el menú principal en el historial.", "error")
-        main()
+    mostrar_barra_progreso(0.5, "Volviendo al Menú Principal...")
+    return NAV_PRINCIPAL
 
 def salir_del_programa():
     mostrar_titulo("SALIR DEL PROGRAMA")
     confirmar = input(f"{Color.YELLOW}❓ ¿Está seguro de que desea salir? (s/n): {Color.END}").lower()
     if confirmar == 's':
         mostrar_barra_progreso(1, "Cerrando sesión y saliendo...", sufijo="¡Hasta pronto! 👋")
-        limpiar_pantalla(); sys.exit()
+        limpiar_pantalla()
+        return NAV_SALIR
     else:
-        mostrar_mensaje("Operación cancelada.", "info"); sleep(1)
-        if menu_history: menu_history[-1]()
-        else: main()
+        mostrar_mensaje("Operación cancelada.", "info"); pausa(1)
+        return NAV_REPETIR
 
-def mostrar_opciones_navegacion(menu_actual_func, es_menu_principal=False):
+def mostrar_opciones_navegacion(es_menu_principal=False):
+    """Muestra las opciones de navegación y lee la opción del usuario.
+
+    Devuelve una AccionNavegacion si se eligió navegar, o el texto ingresado en otro caso.
+    """
     print(f"\n{Color.BLUE}{'─' * 70}{Color.END}")
     opciones_nav = {}
     if not es_menu_principal and len(menu_history) > 1:
-        opciones_nav['b'] = (f"{Color.YELLOW}b. ⬅️ Volver al Menú Anterior{Color.END}", lambda: pop_menu_history()())
+        opciones_nav['b'] = f"{Color.YELLOW}b. ⬅️ Volver al Menú Anterior{Color.END}"
     if not es_menu_principal:
-        opciones_nav['m'] = (f"{Color.YELLOW}m. 🏠 Volver al Menú Principal{Color.END}", ir_a_menu_principal)
-    opciones_nav['s'] = (f"{Color.YELLOW}s. 🚪 Salir del Programa (Directo){Color.END}", salir_del_programa)
-
-    if not opciones_nav and es_menu_principal:
-        print(f"{Color.BLUE}{'─' * 70}{Color.END}")
-        return input(f"{Color.GREEN}↳ Seleccione una opción del menú: {Color.END}").strip().lower()
+        opciones_nav['m'] = f"{Color.YELLOW}m. 🏠 Volver al Menú Principal{Color.END}"
+    opciones_nav['s'] = f"{Color.YELLOW}s. 🚪 Salir del Programa (Directo){Color.END}"
 
-    for _, (texto, _) in opciones_nav.items(): print(texto)
+    for texto in opciones_nav.values(): print(texto)
     print(f"{Color.BLUE}{'─' * 70}{Color.END}")
 
+    prompt_partes = ["↳ Seleccione opción del menú", f"o navegación ({', '.join(opciones_nav)})"]
+    opcion_input = input(f"{Color.GREEN}{' '.join(prompt_partes)}: {Color.END}").strip().lower()
+
+    if opcion_input == 'b' and 'b' in opciones_nav:
+        mostrar_barra_progreso(0.5, "Volviendo...")
+        return NAV_VOLVER
+    if opcion_input == 'm' and 'm' in opciones_nav:
+        return ir_a_menu_principal()
+    if opcion_input == 's':
+        return salir_del_programa()
+    return opcion_input
+
+
+def _registrar_error_menu(pantalla):
+    import traceback
+    with open("error_log_menu.txt", "a", encoding='utf-8') as f_error_menu:
+        f_error_menu.write(f"\n--- Error en Menú: {datetime.now()} ---\n")
+        f_error_menu.write(f"Menu function: {getattr(pantalla, '__name__', 'lambda')}\n")
+        traceback.print_exc(file=f_error_menu)
+
+def ejecutar_bucle_menus(pantalla_principal):
+    """Despacha pantallas hasta que alguna devuelva NAV_SALIR. La pila de Python no crece."""
+    global menu_history
+    menu_history = [pantalla_principal]
     while True:
-        prompt_partes = ["↳ Seleccione opción del menú"]
-        nav_keys = list(opciones_nav.keys())
-        if nav_keys: prompt_partes.append(f"o navegación ({', '.join(nav_keys)})")
-
-        opcion_input = input(f"{Color.GREEN}{' '.join(prompt_partes)}: {Color.END}").strip().lower()
-
-        if opcion_input in opciones_nav:
-            _, funcion_nav = opciones_nav[opcion_input]
-            if funcion_nav.__code__.co_name == "<lambda>":
-                funcion_destino = pop_menu_history()
-                if funcion_destino:
-                    mostrar_barra_progreso(0.5, "Volviendo...")
-                    funcion_destino()
-                    return None
-                else:
-                    mostrar_mensaje("No hay menú anterior o error de navegación.", "info")
-                    sleep(1)
-                    menu_actual_func()
-                    return None
-            else:
-                funcion_nav()
-                return None
-        else:
-            return opcion_input
+        pantalla = menu_history[-1]
+        try:
+            accion = pantalla()
+        except EOFError: # Entrada cerrada (p. ej. stdin redirigido agotado): terminar limpiamente
+            return
+        except Exception as e_menu: # Captura errores dentro de una función de menú
+            mostrar_mensaje(f"Error inesperado en la función del menú: {e_menu}", "error", esperar_enter=True)
+            _registrar_error_menu(pantalla)
+            # Volver al menú principal en caso de error en un submenú; si falla el principal, se reintenta
+            accion = NAV_PRINCIPAL
+
+        if accion is NAV_SALIR:
+            return
+        elif accion is NAV_VOLVER:
+            if len(menu_history) > 1:
+                menu_history.pop()
+        elif accion is NAV_PRINCIPAL:
+            del menu_history[1:]
+        elif callable(accion):
+            menu_history.append(accion)
+        # NAV_REPETIR (o None): se vuelve a ejecutar la misma pantalla
 
 
 # ------------------- FUNCIONALIDAD DE PING (MEJORADA) -------------------
+PING_CONCURRENCIA_POR_DEFECTO = 32 # Máximo de pings simultáneos en un barrido
+PING_TIMEOUT_POR_DEFECTO = 5 # Segundos de espera por host en un barrido
+
+def _comando_ping(ip_address, conteo=4, timeout=None):
+    """Construye el comando ping adecuado para el sistema operativo."""
+    sistema = platform.system().lower()
+    param_conteo = '-n' if sistema == 'windows' else '-c'
+    comando = ['ping', param_conteo, str(conteo)]
+    if timeout:
+        if sistema == 'windows':
+            comando += ['-w', str(int(timeout * 1000))] # Windows espera milisegundos
+        elif sistema == 'linux':
+            comando += ['-W', str(int(timeout))]
+    comando.append(ip_address)
+    return comando
+
+# Analizador de la salida de ping: una sola expresión regular recorre la salida una vez y
+# reconoce respuestas individuales, resúmenes y avisos de iputils (Linux), BusyBox, BSD/macOS
+# y Windows en inglés y español. El resultado es un ResultadoPing con los conteos, la pérdida,
+# los RTT de cada respuesta y el mínimo/promedio/máximo/desviación.
+PATRON_SALIDA_PING = re.compile(r"""
+      (?:time|tiempo)[=<]\s*(?P<rtt>\d+(?:\.\d+)?)\s*ms?                   # 64 bytes from ...: time=0.045 ms / tiempo<1m
+      (?P<duplicada>\s*\(DUP!\))?                                         # respuesta repetida: no es un eco nuevo
+    | (?P<tx>\d+)\ packets\ transmitted,\ (?P<rx>\d+)\ (?:packets\ )?received
+      (?:,\ \+?\d+\ (?:duplicates|errors))*                               # iputils/BSD: +1 duplicates, +4 errors; BusyBox sin '+'
+      ,\ (?P<perdida>\d+(?:\.\d+)?)%\ packet\ loss                          # resumen iputils / BusyBox / BSD
+    | (?:rtt|round-trip)\ min/avg/max(?:/(?:mdev|stddev))?\ =\ 
+      (?P<min>[\d.]+)/(?P<prom>[\d.]+)/(?P<max>[\d.]+)(?:/(?P<desv>[\d.]+))?
+    | (?:Sent|enviados)\ =\ (?P<wtx>\d+),\ (?:Received|recibidos)\ =\ (?P<wrx>\d+),
+      \ (?:Lost|perdidos)\ =\ \d+\s*\((?P<wperdida>\d+)%                     # resumen de Windows
+    | (?:Minimum|Mínimo)\ =\ (?P<wmin>\d+)ms,\ (?:Maximum|Máximo)\ =\ (?P<wmax>\d+)ms,
+      \ (?:Average|Media)\ =\ (?P<wprom>\d+)ms
+    | (?P<inalcanzable>unreachable|inaccesible)
+""", re.VERBOSE | re.IGNORECASE)
+
+class ResultadoPing:
+    """Resultado estructurado de una ejecución de ping (ver analizar_salida_ping)."""
+    __slots__ = ("transmitidos", "recibidos", "perdida", "rtts", "rtt_min", "rtt_prom", "rtt_max", "rtt_desv", "inalcanzable")
+
+    def __init__(self):
+        self.transmitidos = self.recibidos = self.perdida = None
+        self.rtt_min = self.rtt_prom = self.rtt_max = self.rtt_desv = None
+        self.rtts = [] # RTT de cada respuesta, en ms
+        self.inalcanzable = False # Algún "Destination host unreachable"
+
+    @property
+    def reconocido(self):
+        """False si la salida no tenía ningún dato reconocible (formato desconocido o vacía)."""
+        return self.transmitidos is not None or bool(self.rtts) or self.inalcanzable
+
+    @property
+    def respuestas(self):
+        """Respuestas de eco reales. Windows cuenta como 'recibido' el aviso de host inaccesible."""
+        if self.rtts:
+            return len(self.rtts)
+        return 0 if self.inalcanzable else (self.recibidos or 0)
+
+    @property
+    def alcanzable(self):
+        return self.respuestas > 0
+
+    def como_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+    def __repr__(self):
+        return f"ResultadoPing({self.como_dict()!r})"
+
+def analizar_salida_ping(salida):
+    """Analiza la salida de ping en una pasada y devuelve un ResultadoPing."""
+    resultado = ResultadoPing()
+    for coincidencia in PATRON_SALIDA_PING.finditer(salida or ""):
+        grupo = coincidencia.lastgroup
+        datos = coincidencia.groupdict()
+        if datos["rtt"] is not None:
+            if datos["duplicada"] is None:
+                resultado.rtts.append(float(datos["rtt"]))
+        elif datos["tx"] is not None:
+            resultado.transmitidos, resultado.recibidos = int(datos["tx"]), int(datos["rx"])
+            resultado.perdida = float(datos["perdida"])
+        elif datos["min"] is not None:
+            resultado.rtt_min, resultado.rtt_prom, resultado.rtt_max = float(datos["min"]), float(datos["prom"]), float(datos["max"])
+            resultado.rtt_desv = float(datos["desv"]) if datos["desv"] is not None else None
+        elif datos["wtx"] is not None:
+            resultado.transmitidos, resultado.recibidos = int(datos["wtx"]), int(datos["wrx"])
+            resultado.perdida = float(datos["wperdida"])
+        elif datos["wmin"] is not None:
+            resultado.rtt_min, resultado.rtt_prom, resultado.rtt_max = float(datos["wmin"]), float(datos["wprom"]), float(datos["wmax"])
+        elif grupo == "inalcanzable":
+            resultado.inalcanzable = True
+
+    rtts = resultado.rtts
+    if rtts: # Lo que el resumen no trae (desviación en Windows y BusyBox, o todo si falta el resumen) se calcula
+        if resultado.rtt_min is None:
+            resultado.rtt_min, resultado.rtt_max = min(rtts), max(rtts)
+            resultado.rtt_prom = sum(rtts) / len(rtts)
+        if resultado.rtt_desv is None:
+            promedio = sum(rtts) / len(rtts)
+            resultado.rtt_desv = round(math.sqrt(sum((r - promedio) ** 2 for r in rtts) / len(rtts)), 3)
+    if resultado.transmitidos: # Pérdida real: Windows informa 0% aunque las "respuestas" sean avisos de inaccesible
+        resultado.perdida = round(100 * (1 - min(resultado.respuestas, resultado.transmitidos) / resultado.transmitidos), 1)
+    return resultado
+
+def estado_ping(resultado, codigo_retorno, timeout=None):
+    """(estado, detalle) de una ejecución: 'alcanzable', 'inalcanzable' o 'timeout'."""
+    if resultado.alcanzable or (codigo_retorno == 0 and not resultado.reconocido):
+        detalle = f"Responde ({resultado.rtt_prom:.2f} ms)" if resultado.rtt_prom is not None else "Responde"
+        return "alcanzable", detalle
+    if resultado.inalcanzable:
+        return "inalcanzable", "Host de destino inaccesible"
+    if codigo_retorno in (0, 1):
+        return "timeout", f"Sin respuesta en {timeout}s" if timeout else "Sin respuesta"
+    return "inalcanzable", f"Código de retorno {codigo_retorno}"
+
+def _texto_ms_ping(valor):
+    return f"{valor:.3f}" if valor is not None else "-"
+
 def hacer_ping(ip_address):
     if not ip_address or ip_address == "N/A":
         mostrar_mensaje("Este dispositivo no tiene una IP asignada para hacer ping.", "advertencia", esperar_enter=True)
         return
 
-    param_conteo = '-n' if platform.system().lower() == 'windows' else '-c'
-    comando = ['ping', param_conteo, '4', ip_address]
+    comando = _comando_ping(ip_address)
 
     mostrar_titulo(f"PING A {ip_address}")
     print(f"{Color.CYAN}Ejecutando comando: {' '.join(comando)}{Color.END}\n")
@@ -307,35 +2540,20 @@ def hacer_ping(ip_address):
             print(f"{Color.RED}Salida de Error:{Color.END}\n{resultado_proceso.stderr}")
         print(f"{Color.BLUE}{'-'*31} FIN SALIDA PING {'-'*31}{Color.END}\n")
 
-        if resultado_proceso.returncode == 0:
-            fallo_logico = False
-            if platform.system().lower() != 'windows':
-                if "0 received" in resultado_proceso.stdout or \
-                   "100.0% packet loss" in resultado_proceso.stdout or \
-                   "100% packet loss" in resultado_proceso.stdout:
-                    fallo_logico = True
-            elif platform.system().lower() == 'windows':
-                 if "Host de destino inaccesible." in resultado_proceso.stdout or \
-                    "Destination host unreachable." in resultado_proceso.stdout or \
-                    "Tiempo de espera agotado para esta solicitud." in resultado_proceso.stdout or \
-                    "Request timed out." in resultado_proceso.stdout or \
-                    "inaccesible" in resultado_proceso.stdout.lower() or \
-                    "unreachable" in resultado_proceso.stdout.lower():
-                    if "recibidos = 0" in resultado_proceso.stdout or "Received = 0" in resultado_proceso.stdout:
-                         fallo_logico = True
-                 elif 'ttl=' not in resultado_proceso.stdout.lower():
-                        match_perdida_total = re.search(r"(perdidos|Lost)\s*=\s*4\s*\(100%\s*(pérdida|loss)\)", resultado_proceso.stdout)
-                        if match_perdida_total:
-                            fallo_logico = True
-                 elif 'bytes=' not in resultado_proceso.stdout.lower() and 'tiempo=' not in resultado_proceso.stdout.lower() and 'time=' not in resultado_proceso.stdout.lower():
-                             fallo_logico = True
-
-            if fallo_logico:
-                 mostrar_mensaje(f"⚠️  PING a {ip_address} PARECE HABER FALLADO (posible pérdida total de paquetes o host inalcanzable), aunque el comando finalizó sin error del sistema.", "advertencia")
-            else:
-                mostrar_mensaje(f"✅ PING a {ip_address} EXITOSO (código de retorno del sistema: {resultado_proceso.returncode}).", "exito")
+        resultado = analizar_salida_ping(resultado_proceso.stdout)
+        if resultado.transmitidos is not None:
+            print(f"{Color.CYAN}Paquetes:{Color.END} enviados {resultado.transmitidos}, respuestas {resultado.respuestas}, pérdida {resultado.perdida:g}%")
+        if resultado.rtt_min is not None:
+            print(f"{Color.CYAN}RTT (ms):{Color.END} mín {_texto_ms_ping(resultado.rtt_min)} / prom {_texto_ms_ping(resultado.rtt_prom)} / "
+                  f"máx {_texto_ms_ping(resultado.rtt_max)} / desv {_texto_ms_ping(resultado.rtt_desv)}\n")
+
+        estado, detalle = estado_ping(resultado, resultado_proceso.returncode)
+        if estado == "alcanzable":
+            mostrar_mensaje(f"✅ PING a {ip_address} EXITOSO: {detalle}.", "exito")
+        elif resultado_proceso.returncode == 0:
+            mostrar_mensaje(f"⚠️  PING a {ip_address} PARECE HABER FALLADO ({detalle.lower()}), aunque el comando finalizó sin error del sistema.", "advertencia")
         else:
-            mostrar_mensaje(f"❌ PING a {ip_address} FALLIDO (código de retorno del sistema: {resultado_proceso.returncode}). El host podría ser inalcanzable o la red tener problemas.", "error")
+            mostrar_mensaje(f"❌ PING a {ip_address} FALLIDO ({detalle.lower()}; código de retorno del sistema: {resultado_proceso.returncode}). El host podría ser inalcanzable o la red tener problemas.", "error")
 
     except subprocess.TimeoutExpired:
         mostrar_mensaje(f"❌ PING a {ip_address} FALLIDO: Tiempo de espera agotado (10 segundos).", "error")
@@ -347,32 +2565,627 @@ def hacer_ping(ip_address):
     input(f"{Color.GREEN}Presione Enter para continuar...{Color.END}")
 
 
+def _sondear(ip_address, timeout, conteo):
+    """Ejecuta ping sin interacción y devuelve (estado, detalle, ResultadoPing)."""
+    comando = _comando_ping(ip_address, conteo, timeout)
+    try:
+        resultado_proceso = subprocess.run(comando, capture_output=True, text=True, timeout=timeout * conteo + 2, check=False, errors='replace')
+    except subprocess.TimeoutExpired:
+        return "timeout", f"Sin respuesta en {timeout}s", ResultadoPing()
+    except FileNotFoundError:
+        return "error", "El comando 'ping' no se encontró en el sistema", ResultadoPing()
+    except OSError as e:
+        return "error", str(e), ResultadoPing()
+
+    resultado = analizar_salida_ping(resultado_proceso.stdout)
+    estado, detalle = estado_ping(resultado, resultado_proceso.returncode, timeout)
+    return estado, detalle, resultado
+
+def sondear_ip(ip_address, timeout=PING_TIMEOUT_POR_DEFECTO, conteo=1):
+    """Hace ping a una IP sin interacción y devuelve (estado, detalle).
+
+    Estados posibles: 'alcanzable', 'inalcanzable', 'timeout' o 'error'.
+    """
+    estado, detalle, _ = _sondear(ip_address, timeout, conteo)
+    return estado, detalle
+
+
+def _resultado_barrido(disp, timeout, conteo):
+    estado, detalle, resultado = _sondear(disp.get("IP"), timeout, conteo)
+    perdida = resultado.perdida
+    if perdida is None and estado != "error":
+        perdida = 0.0 if estado == "alcanzable" else 100.0
+    return {"NOMBRE": disp.get("NOMBRE"), "IP": disp.get("IP"), "ESTADO": estado, "DETALLE": detalle,
+            "PERDIDA": perdida, "RTT_MIN": resultado.rtt_min, "RTT_PROM": resultado.rtt_prom, "RTT_MAX": resultado.rtt_max}
+
+def barrido_ping(dispositivos, concurrencia=PING_CONCURRENCIA_POR_DEFECTO, timeout=PING_TIMEOUT_POR_DEFECTO, al_completar=None, conteo=1):
+    """Hace ping a todos los dispositivos con IP usando un pool acotado de hilos.
+
+    Los resultados se entregan a 'al_completar(resultado, hechos, total)' a medida que terminan
+    y se devuelven como lista de dicts con NOMBRE, IP, ESTADO, DETALLE, PERDIDA (%) y
+    RTT_MIN/RTT_PROM/RTT_MAX (ms, None si no hubo respuesta).
+    """
+    objetivos = [d for d in dispositivos if d.get("IP") and d.get("IP") != "N/A"]
+    resultados = []
+    if not objetivos:
+        return resultados
+
+    max_hilos = max(1, min(int(concurrencia), len(objetivos)))
+    from concurrent.futures import ThreadPoolExecutor, as_completed # Diferido: sólo lo necesita el barrido
+    with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+        futuros = [pool.submit(_resultado_barrido, d, timeout, conteo) for d in objetivos]
+        for futuro in as_completed(futuros):
+            resultado = futuro.result()
+            resultados.append(resultado)
+            if al_completar:
+                al_completar(resultado, len(resultados), len(objetivos))
+    return resultados
+
+
+ESTADOS_PING = {
+    "alcanzable": (Color.GREEN, "✅ Alcanzables"),
+    "inalcanzable": (Color.RED, "❌ Inalcanzables"),
+    "timeout": (Color.YELLOW, "⏱️ Tiempo agotado"),
+    "error": (Color.PURPLE, "💥 Errores"),
+}
+
+def _mostrar_resumen_barrido(resultados):
+    print(f"\n{Color.BLUE}{'═' * 70}{Color.END}")
+    print(f"{Color.BOLD}{Color.PURPLE}{'RESUMEN DEL BARRIDO'.center(70)}{Color.END}")
+    print(f"{Color.BLUE}{'═' * 70}{Color.END}")
+    for estado, (color, etiqueta) in ESTADOS_PING.items():
+        del_estado = [r for r in resultados if r["ESTADO"] == estado]
+        print(f"{color}{Color.BOLD}{etiqueta}: {len(del_estado)}{Color.END}")
+        if estado != "alcanzable":
+            for r in sorted(del_estado, key=lambda x: x["NOMBRE"] or ""):
+                print(f"   {r['NOMBRE']:<30} {r['IP']:<16} {r['DETALLE']}")
+    print(f"{Color.BLUE}{'─' * 70}{Color.END}")
+    print(f"{Color.CYAN}Total de hosts probados:{Color.END} {len(resultados)}")
+
+
+def _pedir_entero(prompt, valor_defecto, minimo=1):
+    while True:
+        valor = input(f"{Color.GREEN}↳ {prompt} (Enter = {valor_defecto}): {Color.END}").strip()
+        if not valor:
+            return valor_defecto
+        if valor.isdigit() and int(valor) >= minimo:
+            return int(valor)
+        mostrar_mensaje(f"Ingrese un número entero mayor o igual a {minimo}.", "error")
+
+
+def _filtrar_dispositivos_para_barrido(dispositivos_lista):
+    """Permite acotar el barrido por tipo, ubicación/capa o parte del nombre."""
+    con_ip = lambda dispositivos: [d for d in dispositivos if d.get("IP") and d.get("IP") != "N/A"]
+    print(f"\n{Color.BOLD}Filtrar dispositivos por:{Color.END}")
+    print(f"{Color.YELLOW}1.{Color.END} Tipo de dispositivo")
+    print(f"{Color.YELLOW}2.{Color.END} Ubicación/Capa de red")
+    print(f"{Color.YELLOW}3.{Color.END} Nombre (o parte del nombre)")
+    opcion = input(f"{Color.GREEN}↳ Opción (1-3, Enter para cancelar): {Color.END}").strip()
+    if opcion == "1":
+        tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el tipo:", "Tipo", permitir_cancelar=True)
+        return con_ip(dispositivos_lista.filtrar(tipo=tipo)) if tipo else None
+    if opcion == "2":
+        ubicacion = seleccionar_opcion_menu(CAPAS_RED, "Seleccione la ubicación/capa:", "Ubicación/Capa", permitir_cancelar=True)
+        return con_ip(dispositivos_lista.filtrar(ubicacion=ubicacion)) if ubicacion else None
+    if opcion == "3":
+        texto = input(f"{Color.GREEN}↳ Texto a buscar en el nombre: {Color.END}").strip().lower()
+        return [d for d in dispositivos_lista.con_ip() if texto in d.get("NOMBRE", "").lower()] if texto else None
+    return None
+
+
+def ejecutar_barrido_interactivo(dispositivos_con_ip, titulo="🌐 PING A TODOS LOS DISPOSITIVOS"):
+    mostrar_titulo(titulo)
+    if not dispositivos_con_ip:
+        mostrar_mensaje("No hay dispositivos que coincidan para hacer ping.", "advertencia", esperar_enter=True)
+        return
+    concurrencia = _pedir_entero("Pings simultáneos", PING_CONCURRENCIA_POR_DEFECTO)
+    timeout = _pedir_entero("Timeout por host en segundos", PING_TIMEOUT_POR_DEFECTO)
+    print(f"\n{Color.CYAN}Probando {len(dispositivos_con_ip)} dispositivos ({concurrencia} en paralelo, timeout {timeout}s)...{Color.END}\n")
+
+    def _mostrar_resultado(resultado, hechos, total):
+        color, _ = ESTADOS_PING[resultado["ESTADO"]]
+        print(f"{Color.DARKCYAN}[{hechos}/{total}]{Color.END} {color}{resultado['ESTADO'].upper():<13}{Color.END} {resultado['NOMBRE']} ({resultado['IP']}) - {resultado['DETALLE']}", flush=True)
+
+    resultados = barrido_ping(dispositivos_con_ip, concurrencia, timeout, al_completar=_mostrar_resultado)
+    _mostrar_resumen_barrido(resultados)
+    input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+
+
 def menu_ping_dispositivo(dispositivos_lista):
-    current_menu_func = lambda: menu_ping_dispositivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     while True:
         mostrar_titulo("🌐 PROBAR CONECTIVIDAD (PING)")
-        dispositivos_con_ip = [d for d in dispositivos_lista if d.get("IP") and d.get("IP") != "N/A"]
+        dispositivos_con_ip = dispositivos_lista.con_ip()
         if not dispositivos_con_ip:
             mostrar_mensaje("No hay dispositivos con IPs asignadas para hacer ping.", "advertencia", esperar_enter=True)
-            pop_menu_history()(); return
+            return NAV_VOLVER
 
         print(f"{Color.BOLD}Seleccione un dispositivo para hacer PING:{Color.END}")
         for i, d in enumerate(dispositivos_con_ip, 1):
             print(f"{Color.YELLOW}{i}.{Color.END} {d.get('NOMBRE')} ({d.get('IP')})")
+        print(f"{Color.YELLOW}t.{Color.END} 📡 Ping a todos los dispositivos")
+        print(f"{Color.YELLOW}f.{Color.END} 🎯 Ping por filtro (tipo, ubicación o nombre)")
+        print(f"{Color.YELLOW}o.{Color.END} 📈 Monitoreo continuo (historial, disponibilidad y latencias)")
 
-        opcion = mostrar_opciones_navegacion(current_menu_func)
+        opcion = mostrar_opciones_navegacion()
 
-        if opcion is None: return
+        if isinstance(opcion, AccionNavegacion): return opcion
+
+        if opcion == "t":
+            ejecutar_barrido_interactivo(dispositivos_con_ip)
+            continue
+        if opcion == "o":
+            return lambda: monitor_conectividad_interactivo(dispositivos_lista)
+        if opcion == "f":
+            filtrados = _filtrar_dispositivos_para_barrido(dispositivos_lista)
+            if filtrados is not None:
+                ejecutar_barrido_interactivo(filtrados, "🎯 PING POR FILTRO")
+            continue
 
         try:
             opcion_num = int(opcion)
             if 1 <= opcion_num <= len(dispositivos_con_ip):
                 hacer_ping(dispositivos_con_ip[opcion_num - 1].get("IP"))
             else:
-                mostrar_mensaje(f"Opción inválida. Debe ser entre 1 y {len(dispositivos_con_ip)} o una opción de navegación.", "error"); sleep(2)
+                mostrar_mensaje(f"Opción inválida. Debe ser entre 1 y {len(dispositivos_con_ip)} o una opción de navegación.", "error"); pausa(2)
         except ValueError:
-            mostrar_mensaje("Entrada inválida. Por favor, ingrese un número o una opción de navegación.", "error"); sleep(2)
+            mostrar_mensaje("Entrada inválida. Por favor, ingrese un número o una opción de navegación.", "error"); pausa(2)
+
+
+# ---------------- SONDEO EN PROCESO (ICMP/TCP CON ASYNCIO) ----------------
+# Alternativa al comando ping para barridos grandes: un solo bucle asyncio mantiene miles de
+# sondeos en vuelo sin crear procesos. Usa sockets ICMP de datagrama (sin privilegios; Linux
+# los permite si el grupo del usuario está en net.ipv4.ping_group_range) y, si el sistema no
+# los permite, un intento de conexión TCP al puerto indicado: tanto la conexión aceptada como
+# el rechazo (RST) prueban que el host está en línea.
+SONDEO_PUERTO_TCP_POR_DEFECTO = 22 # SSH: suele estar abierto o rechazar en equipos de red
+SONDEO_CONCURRENCIA_POR_DEFECTO = 512 # Sondeos simultáneos (cada TCP ocupa un descriptor)
+SONDEO_METODOS = ("auto", "icmp", "tcp")
+_ERRNOS_INALCANZABLE = {errno.EHOSTUNREACH, errno.ENETUNREACH}
+
+def _checksum_icmp(datos):
+    if len(datos) % 2:
+        datos += b"\0"
+    suma = sum(struct.unpack(f"!{len(datos) // 2}H", datos))
+    suma = (suma >> 16) + (suma & 0xFFFF)
+    suma += suma >> 16
+    return ~suma & 0xFFFF
+
+def abrir_socket_icmp():
+    """Socket ICMP de datagrama no bloqueante, o None si el sistema no lo permite."""
+    import socket
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except OSError: # PermissionError si el grupo no está en ping_group_range; EPROTONOSUPPORT en otros sistemas
+        return None
+    sock.setblocking(False)
+    try: # Con miles de sondeos en vuelo las respuestas llegan en ráfagas; un buffer chico las descarta
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    except OSError:
+        pass
+    return sock
+
+class SondeadorAsincrono:
+    """Sondeos ICMP o TCP multiplexados en un bucle asyncio.
+
+    Con ICMP, todas las solicitudes salen por un único socket y las respuestas se reparten a
+    su sondeo por número de secuencia (el kernel asigna el identificador al socket).
+    """
+
+    def __init__(self, timeout=PING_TIMEOUT_POR_DEFECTO, puerto_tcp=SONDEO_PUERTO_TCP_POR_DEFECTO,
+                 concurrencia=SONDEO_CONCURRENCIA_POR_DEFECTO, metodo="auto"):
+        if metodo not in SONDEO_METODOS:
+            raise ValueError(f"Método de sondeo '{metodo}' no válido. Opciones: {', '.join(SONDEO_METODOS)}")
+        self.timeout, self.puerto_tcp, self.concurrencia, self.metodo = timeout, puerto_tcp, concurrencia, metodo
+        self._icmp = None
+        self._pendientes = {} # secuencia -> (ip, futuro)
+        self._secuencia = 0
+
+    def _leer_icmp(self):
+        while True:
+            try:
+                datos, (origen, _) = self._icmp.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError: # Error ICMP asíncrono (p. ej. inaccesible) sin datos asociados
+                continue
+            if datos and datos[0] >> 4 == 4 and len(datos) >= 20: # Algunos sistemas entregan también la cabecera IP
+                datos = datos[(datos[0] & 0x0F) * 4:]
+            if len(datos) < 8 or datos[0] != 0: # Solo respuestas de eco (tipo 0)
+                continue
+            secuencia = struct.unpack("!H", datos[6:8])[0]
+            ip, futuro = self._pendientes.get(secuencia, (None, None))
+            if futuro is not None and ip == origen and not futuro.done():
+                futuro.set_result(time.perf_counter())
+
+    async def _sondear_icmp(self, ip):
+        import asyncio
+        bucle = asyncio.get_running_loop()
+        self._secuencia = (self._secuencia + 1) & 0xFFFF
+        secuencia = self._secuencia
+        carga = struct.pack("!d", time.time())
+        paquete = struct.pack("!BBHHH", 8, 0, 0, 0, secuencia) + carga
+        paquete = paquete[:2] + struct.pack("!H", _checksum_icmp(paquete)) + paquete[4:]
+        futuro = bucle.create_future()
+        self._pendientes[secuencia] = (ip, futuro)
+        try:
+            inicio = time.perf_counter()
+            self._icmp.sendto(paquete, (ip, 0))
+            llegada = await asyncio.wait_for(futuro, self.timeout)
+            return "alcanzable", (llegada - inicio) * 1000
+        except asyncio.TimeoutError:
+            return "timeout", None
+        except OSError as e:
+            return ("inalcanzable" if e.errno in _ERRNOS_INALCANZABLE else "error"), None
+        finally:
+            self._pendientes.pop(secuencia, None)
+
+    async def _sondear_tcp(self, ip):
+        import asyncio
+        inicio = time.perf_counter()
+        try:
+            _, escritor = await asyncio.wait_for(asyncio.open_connection(ip, self.puerto_tcp), self.timeout)
+            escritor.close()
+        except ConnectionRefusedError: # El host respondió con RST: está en línea aunque el puerto esté cerrado
+            pass
+        except asyncio.TimeoutError:
+            return "timeout", None
+        except OSError as e:
+            return ("inalcanzable" if e.errno in _ERRNOS_INALCANZABLE else "error"), None
+        return "alcanzable", (time.perf_counter() - inicio) * 1000
+
+    async def _sondear_dispositivo(self, disp, limite, conteo):
+        async with limite:
+            sondeo = self._sondear_icmp if self._icmp is not None else self._sondear_tcp
+            estados, rtts = [], []
+            for _ in range(conteo):
+                estado, rtt = await sondeo(disp.get("IP"))
+                estados.append(estado)
+                if rtt is not None:
+                    rtts.append(rtt)
+        metodo = "icmp" if self._icmp is not None else f"tcp/{self.puerto_tcp}"
+        estado = "alcanzable" if rtts else next((e for e in ("inalcanzable", "error") if e in estados), "timeout")
+        detalles = {"alcanzable": f"Responde ({sum(rtts) / len(rtts):.2f} ms, {metodo})" if rtts else "",
+                    "inalcanzable": "Host de destino inaccesible", "timeout": f"Sin respuesta en {self.timeout}s ({metodo})",
+                    "error": f"No se pudo sondear ({metodo})"}
+        return {"NOMBRE": disp.get("NOMBRE"), "IP": disp.get("IP"), "ESTADO": estado, "DETALLE": detalles[estado],
+                "PERDIDA": round(100 * (1 - len(rtts) / conteo), 1),
+                "RTT_MIN": round(min(rtts), 3) if rtts else None, "RTT_PROM": round(sum(rtts) / len(rtts), 3) if rtts else None,
+                "RTT_MAX": round(max(rtts), 3) if rtts else None, "METODO": metodo}
+
+    async def _ejecutar(self, objetivos, conteo, al_completar):
+        import asyncio
+        bucle = asyncio.get_running_loop()
+        if self.metodo != "tcp":
+            self._icmp = abrir_socket_icmp()
+            if self._icmp is None and self.metodo == "icmp":
+                raise OSError("El sistema no permite sockets ICMP sin privilegios (ver net.ipv4.ping_group_range).")
+        if self._icmp is not None:
+            bucle.add_reader(self._icmp.fileno(), self._leer_icmp)
+        limite = asyncio.Semaphore(max(1, int(self.concurrencia)))
+        resultados = []
+        try:
+            for tarea in asyncio.as_completed([self._sondear_dispositivo(d, limite, conteo) for d in objetivos]):
+                resultado = await tarea
+                resultados.append(resultado)
+                if al_completar:
+                    al_completar(resultado, len(resultados), len(objetivos))
+        finally:
+            if self._icmp is not None:
+                bucle.remove_reader(self._icmp.fileno())
+                self._icmp.close()
+                self._icmp = None
+        return resultados
+
+    def sondear(self, dispositivos, conteo=1, al_completar=None):
+        """Sondea los dispositivos con IP; misma forma de resultado que barrido_ping, más METODO."""
+        import asyncio
+        objetivos = [d for d in dispositivos if d.get("IP") and d.get("IP") != "N/A"]
+        if not objetivos:
+            return []
+        return asyncio.run(self._ejecutar(objetivos, max(1, int(conteo)), al_completar))
+
+def barrido_sondeo(dispositivos, concurrencia=SONDEO_CONCURRENCIA_POR_DEFECTO, timeout=PING_TIMEOUT_POR_DEFECTO,
+                   al_completar=None, conteo=1, puerto_tcp=SONDEO_PUERTO_TCP_POR_DEFECTO, metodo="auto"):
+    """Como barrido_ping, pero con el sondeador en proceso en lugar de un proceso ping por host."""
+    return SondeadorAsincrono(timeout, puerto_tcp, concurrencia, metodo).sondear(dispositivos, conteo, al_completar)
+
+
+# ---------------- MONITOREO CONTINUO DE CONECTIVIDAD ----------------
+# El monitor repite el barrido de ping cada cierto intervalo en un hilo de fondo y guarda
+# cada resultado en una serie temporal binaria de solo anexado: registros de 13 bytes
+# (segundo, IP como entero, RTT promedio en ms o NaN, pérdida %). Las muestras más viejas
+# que la retención cruda se resumen por hora (muestras, respuestas, p50/p95/p99/máximo) en
+# un segundo archivo, que a su vez se recorta a la retención agregada.
+NOMBRE_SERIE_MONITOR = "monitor_red" # Prefijo de monitor_red.crudo.bin y monitor_red.horas.bin
+MONITOR_INTERVALO_POR_DEFECTO = 60 # Segundos entre barridos
+MONITOR_RETENCION_CRUDA_HORAS = 48 # Muestras individuales que se conservan
+MONITOR_RETENCION_AGREGADA_DIAS = 90 # Resúmenes por hora que se conservan
+MONITOR_VENTANA_REPORTE_HORAS = 24 # Período por defecto del reporte
+
+FORMATO_MUESTRA = struct.Struct("<IIfB") # instante, ip, rtt, pérdida
+FORMATO_HORA = struct.Struct("<IIHHffff") # hora, ip, muestras, respondidas, p50, p95, p99, máximo
+
+def _percentil(ordenados, p):
+    """Percentil p (0-100) con interpolación lineal sobre una lista ya ordenada."""
+    if not ordenados:
+        return None
+    posicion = (len(ordenados) - 1) * p / 100
+    i = int(posicion)
+    if i + 1 >= len(ordenados):
+        return ordenados[-1]
+    return ordenados[i] + (ordenados[i + 1] - ordenados[i]) * (posicion - i)
+
+class SerieLatencias:
+    """Serie temporal en disco de los resultados del monitor (ver sección)."""
+
+    def __init__(self, ruta_base=None, retencion_cruda_horas=None, retencion_agregada_dias=None):
+        base = ruta_base or NOMBRE_SERIE_MONITOR
+        self.ruta_cruda = base + ".crudo.bin"
+        self.ruta_horas = base + ".horas.bin"
+        self.retencion_cruda = 3600 * (retencion_cruda_horas or MONITOR_RETENCION_CRUDA_HORAS)
+        self.retencion_agregada = 86400 * (retencion_agregada_dias or MONITOR_RETENCION_AGREGADA_DIAS)
+        self._cerrojo = threading.Lock() # El hilo del monitor escribe mientras la interfaz lee
+
+    def registrar(self, muestras, instante=None):
+        """Anexa [(ip entero, rtt ms o None, pérdida %)] con un mismo instante."""
+        instante = int(time.time() if instante is None else instante)
+        datos = b"".join(FORMATO_MUESTRA.pack(instante, ip, math.nan if rtt is None else rtt, min(100, int(round(perdida))))
+                         for ip, rtt, perdida in muestras)
+        if not datos:
+            return
+        with self._cerrojo, open(self.ruta_cruda, "ab") as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _leer(ruta, formato):
+        try:
+            with open(ruta, "rb") as f:
+                datos = f.read()
+        except FileNotFoundError:
+            return []
+        completos = len(datos) - len(datos) % formato.size # Un registro a medio escribir se ignora
+        return list(formato.iter_unpack(memoryview(datos)[:completos]))
+
+    @staticmethod
+    def _reescribir(ruta, formato, registros):
+        fd, ruta_tmp = tempfile.mkstemp(prefix=".monitor_", suffix=".tmp", dir=os.path.dirname(os.path.abspath(ruta)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(b"".join(formato.pack(*r) for r in registros))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(ruta_tmp, ruta)
+        except OSError:
+            if os.path.exists(ruta_tmp):
+                os.remove(ruta_tmp)
+            raise
+
+    def compactar(self, ahora=None):
+        """Resume por hora las muestras crudas vencidas y recorta ambos archivos. Devuelve las muestras resumidas."""
+        ahora = int(time.time() if ahora is None else ahora)
+        limite_crudo = ahora - self.retencion_cruda
+        limite_crudo -= limite_crudo % 3600 # Solo se resumen horas completas
+        limite_horas = ahora - self.retencion_agregada
+        with self._cerrojo:
+            crudas = self._leer(self.ruta_cruda, FORMATO_MUESTRA)
+            vencidas = [m for m in crudas if m[0] < limite_crudo]
+            if not vencidas:
+                return 0
+            grupos = {}
+            for instante, ip, rtt, _ in vencidas:
+                grupos.setdefault((instante - instante % 3600, ip), []).append(rtt)
+            horas = [h for h in self._leer(self.ruta_horas, FORMATO_HORA) if h[0] >= limite_horas]
+            for (hora, ip), rtts in sorted(grupos.items()):
+                if hora < limite_horas:
+                    continue
+                respuestas = sorted(r for r in rtts if not math.isnan(r))
+                percentiles = [_percentil(respuestas, p) for p in (50, 95, 99)] if respuestas else [math.nan] * 3
+                horas.append((hora, ip, min(len(rtts), 65535), min(len(respuestas), 65535), *percentiles,
+                              respuestas[-1] if respuestas else math.nan))
+            self._reescribir(self.ruta_horas, FORMATO_HORA, horas)
+            self._reescribir(self.ruta_cruda, FORMATO_MUESTRA, [m for m in crudas if m[0] >= limite_crudo])
+        return len(vencidas)
+
+    def resumen(self, horas=MONITOR_VENTANA_REPORTE_HORAS, ahora=None):
+        """{ip entero: métricas} del período: muestras, disponibilidad %, p50/p95/p99/máximo (ms),
+        si la última muestra fue una caída y desde cuándo, y el inicio de la última caída.
+
+        Con muestras crudas los percentiles son exactos; si el período incluye horas ya
+        resumidas se combinan los percentiles por hora ponderados ('aproximado': True).
+        """
+        desde = int(time.time() if ahora is None else ahora) - int(horas * 3600)
+        with self._cerrojo:
+            crudas = self._leer(self.ruta_cruda, FORMATO_MUESTRA)
+            resumidas = self._leer(self.ruta_horas, FORMATO_HORA)
+        acumulado = {}
+        def _nuevo():
+            return {"muestras": 0, "respondidas": 0, "rtts": [], "horas": [], "rtt_max": None,
+                    "caido_desde": None, "ultima_caida": None, "ultima_muestra": None}
+        for hora, ip, muestras, respondidas, p50, p95, p99, maximo in resumidas:
+            if hora + 3600 <= desde:
+                continue
+            datos = acumulado.setdefault(ip, _nuevo())
+            datos["muestras"] += muestras
+            datos["respondidas"] += respondidas
+            if respondidas:
+                datos["horas"].append((respondidas, p50, p95, p99))
+                datos["rtt_max"] = max(datos["rtt_max"] or 0.0, maximo)
+        for instante, ip, rtt, _ in crudas: # Las muestras crudas están en orden de llegada
+            if instante < desde:
+                continue
+            datos = acumulado.setdefault(ip, _nuevo())
+            datos["muestras"] += 1
+            datos["ultima_muestra"] = instante
+            if math.isnan(rtt):
+                if datos["caido_desde"] is None:
+                    datos["caido_desde"] = datos["ultima_caida"] = instante
+            else:
+                datos["respondidas"] += 1
+                datos["rtts"].append(rtt)
+                datos["rtt_max"] = max(datos["rtt_max"] or 0.0, rtt)
+                datos["caido_desde"] = None
+
+        resultado = {}
+        for ip, datos in acumulado.items():
+            rtts = sorted(datos["rtts"])
+            percentiles = {}
+            for indice, p in enumerate((50, 95, 99), 1):
+                partes = [(len(rtts), _percentil(rtts, p))] if rtts else []
+                partes += [(h[0], h[indice]) for h in datos["horas"]]
+                total = sum(peso for peso, _ in partes)
+                percentiles[f"p{p}"] = round(sum(peso * valor for peso, valor in partes) / total, 3) if total else None
+            resultado[ip] = {"muestras": datos["muestras"],
+                             "disponibilidad": round(100 * datos["respondidas"] / datos["muestras"], 2) if datos["muestras"] else None,
+                             **percentiles,
+                             "rtt_max": round(datos["rtt_max"], 3) if datos["rtt_max"] is not None else None,
+                             "caido": datos["caido_desde"] is not None, "caido_desde": datos["caido_desde"],
+                             "ultima_caida": datos["ultima_caida"], "ultima_muestra": datos["ultima_muestra"],
+                             "aproximado": bool(datos["horas"])}
+        return resultado
+
+
+class MonitorConectividad:
+    """Barridos de ping periódicos en un hilo de fondo; cada resultado se agrega a la serie.
+
+    Recuerda el último estado de cada IP para registrar caídas y recuperaciones en 'cambios'.
+    """
+
+    def __init__(self, dispositivos, serie=None, intervalo=MONITOR_INTERVALO_POR_DEFECTO,
+                 concurrencia=PING_CONCURRENCIA_POR_DEFECTO, timeout=PING_TIMEOUT_POR_DEFECTO, barrido=barrido_ping):
+        self.dispositivos = dispositivos
+        self.barrido = barrido # barrido_ping o barrido_sondeo (mismo formato de resultados)
+        self.serie = serie or SerieLatencias()
+        self.intervalo, self.concurrencia, self.timeout = intervalo, concurrencia, timeout
+        self.ciclos = 0
+        self.ultimo_error = None
+        self.cambios = deque(maxlen=200) # (instante, nombre, ip, "caída" | "recuperación")
+        self._caidos = {} # ip -> True si la última muestra fue una caída
+        self._ultima_compactacion = 0.0
+        self._detener = threading.Event()
+        self._hilo = None
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def ejecutar_ciclo(self):
+        """Un barrido completo: sondea, registra en la serie y compacta como mucho una vez por hora."""
+        resultados = self.barrido(self.dispositivos.con_ip(), self.concurrencia, self.timeout)
+        instante = time.time()
+        muestras = []
+        for r in resultados:
+            try:
+                ip = ip_a_entero(r["IP"])
+            except ValueError:
+                continue
+            caido = r["ESTADO"] != "alcanzable"
+            muestras.append((ip, None if caido else r["RTT_PROM"] or 0.0, 100.0 if r["PERDIDA"] is None else r["PERDIDA"]))
+            if self._caidos.get(r["IP"], caido) != caido:
+                self.cambios.append((instante, r["NOMBRE"], r["IP"], "caída" if caido else "recuperación"))
+            self._caidos[r["IP"]] = caido
+        self.serie.registrar(muestras, instante)
+        self.ciclos += 1
+        if instante - self._ultima_compactacion >= 3600:
+            self.serie.compactar(instante)
+            self._ultima_compactacion = instante
+        return resultados
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            inicio = time.monotonic()
+            try:
+                self.ejecutar_ciclo()
+                self.ultimo_error = None
+            except Exception as e: # Disco lleno, serie dañada, resultado inesperado: el hilo sigue y se reintenta en el próximo ciclo
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+            self._detener.wait(max(0.0, self.intervalo - (time.monotonic() - inicio)))
+
+    def iniciar(self):
+        if self.activo:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="monitor-conectividad", daemon=True)
+        self._hilo.start()
+
+    def detener(self, esperar=True):
+        self._detener.set()
+        if esperar and self._hilo is not None:
+            self._hilo.join()
+        self._hilo = None
+
+
+def _fecha_corta(instante):
+    return datetime.fromtimestamp(instante).strftime("%Y-%m-%d %H:%M:%S") if instante else "-"
+
+def resumen_monitor_por_dispositivo(dispositivos_lista, serie=None, horas=MONITOR_VENTANA_REPORTE_HORAS):
+    """[métricas con NOMBRE e IP] del monitor, de menor a mayor disponibilidad."""
+    filas = []
+    for ip, metricas in (serie or SerieLatencias()).resumen(horas).items():
+        texto_ip = entero_a_ip(ip)
+        disp = dispositivos_lista.obtener_por_ip(texto_ip)
+        filas.append({"NOMBRE": disp.get("NOMBRE") if disp is not None else None, "IP": texto_ip, **metricas})
+    return sorted(filas, key=lambda f: (f["disponibilidad"] if f["disponibilidad"] is not None else 101, f["NOMBRE"] or ""))
+
+def _texto_ms(valor):
+    return f"{valor:.1f}" if valor is not None else "-"
+
+def _imprimir_filas_monitor(filas, maximo=None):
+    print(f"  {Color.BOLD}{'Dispositivo':<24} {'IP':<16} {'Disp.%':>7} {'p50':>7} {'p95':>7} {'p99':>7}  Estado{Color.END}")
+    for f in filas[:maximo]:
+        color = Color.RED if f["caido"] else Color.GREEN
+        estado = f"caído desde {_fecha_corta(f['caido_desde'])}" if f["caido"] else "en línea"
+        print(f"  {_recortar(f['NOMBRE'] or '(sin inventario)', 24):<24} {f['IP']:<16} {f['disponibilidad'] or 0:>7.2f} "
+              f"{_texto_ms(f['p50']):>7} {_texto_ms(f['p95']):>7} {_texto_ms(f['p99']):>7}  {color}{estado}{Color.END}")
+    if maximo is not None and len(filas) > maximo:
+        print(f"  {Color.DARKCYAN}... y {len(filas) - maximo} dispositivos más.{Color.END}")
+
+_monitor = None # MonitorConectividad de la sesión interactiva
+
+def monitor_conectividad_interactivo(dispositivos_lista):
+    global _monitor
+    while True:
+        mostrar_titulo("📈 MONITOREO CONTINUO DE CONECTIVIDAD")
+        activo = _monitor is not None and _monitor.activo
+        if activo:
+            print(f"{Color.GREEN}● Monitor activo{Color.END}: cada {_monitor.intervalo}s, {_monitor.ciclos} barridos realizados.")
+            if _monitor.ultimo_error:
+                print(f"{Color.RED}Último error del monitoreo: {_monitor.ultimo_error}{Color.END}")
+        else:
+            print(f"{Color.YELLOW}○ Monitor detenido{Color.END}")
+
+        filas = resumen_monitor_por_dispositivo(dispositivos_lista)
+        print(f"\n{Color.BOLD}{Color.PURPLE}📊 ÚLTIMAS {MONITOR_VENTANA_REPORTE_HORAS} HORAS (latencias en ms):{Color.END}")
+        if filas:
+            _imprimir_filas_monitor(filas, 30)
+        else:
+            print(f"  {Color.DARKCYAN}Todavía no hay mediciones guardadas.{Color.END}")
+        if _monitor is not None and _monitor.cambios:
+            print(f"\n{Color.BOLD}{Color.PURPLE}🔔 CAMBIOS DE ESTADO RECIENTES:{Color.END}")
+            for instante, nombre, ip, cambio in list(_monitor.cambios)[-10:]:
+                color = Color.RED if cambio == "caída" else Color.GREEN
+                print(f"  {_fecha_corta(instante)}  {color}{cambio:<12}{Color.END} {nombre} ({ip})")
+
+        print(f"\n{Color.YELLOW}i.{Color.END} {'⏹️ Detener' if activo else '▶️ Iniciar'} el monitor en segundo plano")
+        print(f"{Color.YELLOW}a.{Color.END} 🔄 Actualizar")
+        opcion = mostrar_opciones_navegacion()
+        if isinstance(opcion, AccionNavegacion): return opcion
+
+        if opcion == "i" and activo:
+            _monitor.detener(esperar=False)
+            mostrar_mensaje("Monitor detenido (el barrido en curso termina en segundo plano).", "info"); pausa(1)
+        elif opcion == "i":
+            if not dispositivos_lista.con_ip():
+                mostrar_mensaje("No hay dispositivos con IP para monitorear.", "advertencia"); pausa(2)
+                continue
+            intervalo = _pedir_entero("Segundos entre barridos", MONITOR_INTERVALO_POR_DEFECTO, minimo=5)
+            concurrencia = _pedir_entero("Pings simultáneos", PING_CONCURRENCIA_POR_DEFECTO)
+            _monitor = MonitorConectividad(dispositivos_lista, intervalo=intervalo, concurrencia=concurrencia)
+            _monitor.iniciar()
+            mostrar_mensaje("Monitor iniciado. Puede seguir usando el programa mientras mide.", "exito"); pausa(1)
+        elif opcion != "a":
+            mostrar_mensaje(f"Opción '{opcion}' no válida.", "error"); pausa(2)
 
 
 # ---------------- FUNCIONES DE GESTIÓN DE DISPOSITIVOS ----------------
@@ -400,11 +3213,15 @@ def seleccionar_opcion_menu(opciones_dict, titulo_seleccion, prompt_usuario, per
         except ValueError:
             mostrar_mensaje("Entrada numérica inválida.", "error")
 
-def ingresar_ip_interactivo(dispositivos_lista, dispositivo_actual=None):
-    """ Permite ingresar una IP, validarla y verificar unicidad (excepto para el dispositivo_actual)."""
+def ingresar_ip_interactivo(dispositivos_lista, dispositivo_actual=None, ip_actual=None):
+    """ Permite ingresar una IP, validarla y verificar unicidad (excepto para el dispositivo_actual).
+
+    Si se ingresa una red (p. ej. 10.0.0.0/24) se propone la siguiente IP libre de esa red.
+    ip_actual reemplaza a la IP guardada del dispositivo (p. ej. un cambio aún sin guardar).
+    """
     while True:
-        valor_actual_ip = dispositivo_actual.get("IP", "N/A") if dispositivo_actual else "N/A"
-        prompt = f"{Color.GREEN}↳ Ingrese la dirección IP del dispositivo (Actual: {valor_actual_ip}, Enter para mantener o si no aplica): {Color.END}" if dispositivo_actual else f"{Color.GREEN}↳ Ingrese la dirección IP del dispositivo (Enter si no aplica): {Color.END}"
+        valor_actual_ip = ip_actual or (dispositivo_actual.get("IP", "N/A") if dispositivo_actual else "N/A")
+        prompt = f"{Color.GREEN}↳ Ingrese la dirección IP del dispositivo (Actual: {valor_actual_ip}, Enter para mantener o si no aplica; una red X.X.X.X/NN asigna la siguiente libre): {Color.END}" if dispositivo_actual else f"{Color.GREEN}↳ Ingrese la dirección IP del dispositivo (Enter si no aplica; una red X.X.X.X/NN asigna la siguiente libre): {Color.END}"
 
         ip = input(prompt).strip()
 
@@ -414,35 +3231,40 @@ def ingresar_ip_interactivo(dispositivos_lista, dispositivo_actual=None):
         if not ip: # Para agregar nuevo dispositivo o si se borra la IP en modificación
             return "N/A"
         try:
+            if "/" in ip: # Asignación automática dentro de una subred
+                red = _red_consulta(ip)
+                ip = dispositivos_lista.siguiente_ip_libre(red)
+                if ip is None:
+                    raise ValueError(f"No quedan direcciones libres en {red}.")
+                if input(f"{Color.GREEN}La siguiente IP libre en {red} es {ip}. ¿Usarla? (s/n): {Color.END}").strip().lower() != 's':
+                    continue
             validar_ip(ip)
             if ip != "N/A":
-                for disp in dispositivos_lista:
-                    if disp is dispositivo_actual: # No comparar consigo mismo si se está modificando
-                        continue
-                    if disp.get("IP") == ip:
-                        raise ValueError(f"La IP '{ip}' ya está asignada al dispositivo '{disp.get('NOMBRE')}'. Use una IP única.")
+                disp = dispositivos_lista.ip_en_uso(ip, excluir=dispositivo_actual) # No comparar consigo mismo si se está modificando
+                if disp is not None:
+                    libre = dispositivos_lista.siguiente_ip_libre(ipaddress.IPv4Network(f"{ip}/{PREFIJO_SUBRED_REPORTE}", strict=False))
+                    sugerencia = f" Siguiente libre en la misma /{PREFIJO_SUBRED_REPORTE}: {libre}." if libre else ""
+                    raise ValueError(f"La IP '{ip}' ya está asignada al dispositivo '{disp.get('NOMBRE')}'. Use una IP única.{sugerencia}")
             return ip
         except ValueError as e:
             mostrar_mensaje(f"{str(e)}", "error")
-            if "Formato incorrecto" in str(e) or "Octeto" in str(e):
-                print(f"{Color.YELLOW}💡 Ejemplos: 192.168.1.10, 10.0.0.5{Color.END}")
+            if "Formato incorrecto" in str(e) or "octeto" in str(e):
+                print(f"{Color.YELLOW}💡 Ejemplos: 192.168.1.10, 10.0.0.5, o 10.0.0.0/24 para la siguiente libre{Color.END}")
 
 
 def agregar_dispositivo_interactivo(dispositivos_lista):
-    current_menu_func = lambda: agregar_dispositivo_interactivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("📱 AGREGAR NUEVO DISPOSITIVO")
 
     tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el tipo de dispositivo:", "Tipo", permitir_cancelar=True)
     if tipo is None:
-        pop_menu_history()(); return
+        return NAV_VOLVER
 
     nombre = ""
     while not nombre:
         temp_nombre = input(f"{Color.GREEN}↳ Nombre del dispositivo (3-50 caract.): {Color.END}").strip()
         try:
             validar_nombre(temp_nombre)
-            if any(d.get("NOMBRE","").lower() == temp_nombre.lower() for d in dispositivos_lista):
+            if dispositivos_lista.nombre_en_uso(temp_nombre):
                 mostrar_mensaje(f"El nombre '{temp_nombre}' ya existe. Intente con otro.", "advertencia")
             else:
                 nombre = temp_nombre
@@ -454,7 +3276,7 @@ def agregar_dispositivo_interactivo(dispositivos_lista):
     # Todos los dispositivos pueden tener IP opcionalmente
     ip_asignada = ingresar_ip_interactivo(dispositivos_lista)
     if ip_asignada is None: # Esto no debería pasar con la lógica actual de ingresar_ip_interactivo
-        pop_menu_history()(); return
+        return NAV_VOLVER
 
 
     ubicacion_asignada = "N/A" # Usamos 'ubicacion' en lugar de 'capa'
@@ -463,7 +3285,7 @@ def agregar_dispositivo_interactivo(dispositivos_lista):
         ubicacion_sel = seleccionar_opcion_menu(CAPAS_RED, "Seleccione la ubicación/capa de red:", "Ubicación/Capa", permitir_cancelar=True)
         if ubicacion_sel is None:
             mostrar_mensaje("Se asignará 'N/A' a la ubicación/capa de red.", "info")
-            sleep(1)
+            pausa(1)
         else:
             ubicacion_asignada = ubicacion_sel
     else: # Para otros tipos de dispositivo, preguntar si se desea añadir ubicación
@@ -530,14 +3352,17 @@ def agregar_dispositivo_interactivo(dispositivos_lista):
     nuevo_disp = crear_dispositivo(tipo, nombre, ip_asignada, ubicacion_asignada, servicios_sel_list, vlans_list)
 
     if nuevo_disp:
-        dispositivos_lista.append(nuevo_disp)
-        guardar_dispositivos_en_archivo(dispositivos_lista) # <<< GUARDAR DATOS
+        try:
+            dispositivos_lista.agregar(nuevo_disp) # El repositorio lo persiste en el almacenamiento
+        except ConflictoVersion as e: # Otro usuario guardó el mismo nombre o IP mientras se completaba el formulario
+            mostrar_mensaje(f"{e} El dispositivo no se agregó.", "error", esperar_enter=True)
+            return NAV_VOLVER
         mostrar_mensaje(f"Dispositivo '{nombre}' agregado exitosamente!", "exito")
         mostrar_barra_progreso(1, "Guardando datos del dispositivo...", sufijo="¡Dispositivo guardado!")
     else:
-        mostrar_mensaje("No se pudo agregar el dispositivo debido a errores previos.", "error"); sleep(2)
+        mostrar_mensaje("No se pudo agregar el dispositivo debido a errores previos.", "error"); pausa(2)
 
-    pop_menu_history()();
+    return NAV_VOLVER
 
 
 def formatear_dispositivo_para_mostrar(disp_data, numero=None):
@@ -573,59 +3398,143 @@ def formatear_dispositivo_para_mostrar(disp_data, numero=None):
     return f"\n{separador}\n" + "\n".join(partes) + f"\n{separador}"
 
 
+TAMANO_PAGINA_DETALLE = 10 # Dispositivos por página en la vista detallada
+TAMANO_PAGINA_COMPACTA = 40 # Dispositivos por página en la vista de tabla compacta
+CAMPOS_ORDENABLES = {"nombre": "NOMBRE", "tipo": "TIPO", "ip": "IP", "ubicacion": "UBICACION", "servicios": "SERVICIOS", "vlans": "VLANS"}
+
+def _recortar(texto, ancho):
+    texto = str(texto)
+    return texto if len(texto) <= ancho else texto[:ancho - 1] + "…"
+
+def formatear_dispositivo_compacto(disp_data, numero):
+    """Una línea por dispositivo para la vista de tabla."""
+    servicios_str = ", ".join(disp_data.get('SERVICIOS', [])) or "-"
+    vlans_str = ",".join(map(str, disp_data.get('VLANS', []))) or "-"
+    return (f"{Color.YELLOW}{numero:>7}{Color.END} {_recortar(disp_data.get('NOMBRE', 'N/A'), 24):<24} "
+            f"{_recortar(disp_data.get('TIPO', 'N/A'), 14):<14} {disp_data.get('IP', 'N/A'):<15} "
+            f"{_recortar(disp_data.get('UBICACION', 'N/A'), 18):<18} {_recortar(servicios_str, 22):<22} {_recortar(vlans_str, 16)}")
+
+def _clave_orden_ip(disp):
+    """Orden numérico de IP; después las IPs no válidas de archivos antiguos (como texto) y al final los sin IP."""
+    entero = _entero_ip_dispositivo(disp)
+    if entero is not None:
+        return (0, entero, "")
+    ip = disp.get("IP") or "N/A"
+    return (2, 0, "") if ip == "N/A" else (1, 0, ip.lower())
+
+def _clave_orden(campo):
+    if campo == "IP":
+        return _clave_orden_ip
+    if campo in ("SERVICIOS", "VLANS"):
+        return lambda d: (len(d.get(campo, [])), d.get(campo, []))
+    return lambda d: str(d.get(campo, "N/A")).lower()
+
+def _iterar_ventana(dispositivos_lista, orden, inicio, fin):
+    """Genera (número, dispositivo) sólo para la ventana visible, sin recorrer el resto."""
+    indices = range(inicio, min(fin, len(dispositivos_lista))) if orden is None else orden[inicio:fin]
+    for posicion, indice in enumerate(indices, inicio + 1):
+        yield posicion, dispositivos_lista[indice]
+
 def mostrar_dispositivos(dispositivos_lista, titulo_menu="📜 MOSTRAR TODOS LOS DISPOSITIVOS"):
-    current_menu_func = lambda: mostrar_dispositivos(dispositivos_lista, titulo_menu)
-    push_menu_history(current_menu_func)
     mostrar_titulo(titulo_menu)
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para mostrar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return NAV_VOLVER
 
-    for i, disp_data in enumerate(dispositivos_lista, 1):
-        print(formatear_dispositivo_para_mostrar(disp_data, i))
+    pagina = 0
+    modo_compacto = False
+    orden = None # Lista de índices ordenados; None = orden de registro
+    campo_orden, descendente = None, False
 
-    print(f"\n{Color.GREEN}Presione Enter o seleccione una opción de navegación para volver...{Color.END}")
-    opcion = mostrar_opciones_navegacion(current_menu_func)
-    if opcion is None: return
-    elif opcion == "" or opcion.lower() == "enter":
-        pop_menu_history()()
-        return
-    else:
-        mostrar_mensaje("Volviendo al menú anterior...", "info"); sleep(1)
-        pop_menu_history()()
+    while True:
+        tamano_pagina = TAMANO_PAGINA_COMPACTA if modo_compacto else TAMANO_PAGINA_DETALLE
+        total = len(dispositivos_lista)
+        total_paginas = max(1, -(-total // tamano_pagina))
+        pagina = min(max(pagina, 0), total_paginas - 1)
+        inicio = pagina * tamano_pagina
+
+        mostrar_titulo(titulo_menu)
+        if modo_compacto:
+            print(f"{Color.BOLD}{'N°':>7} {'NOMBRE':<24} {'TIPO':<14} {'IP':<15} {'UBICACIÓN/CAPA':<18} {'SERVICIOS':<22} VLANs{Color.END}")
+            for numero, disp_data in _iterar_ventana(dispositivos_lista, orden, inicio, inicio + tamano_pagina):
+                print(formatear_dispositivo_compacto(disp_data, numero))
+        else:
+            for numero, disp_data in _iterar_ventana(dispositivos_lista, orden, inicio, inicio + tamano_pagina):
+                print(formatear_dispositivo_para_mostrar(disp_data, numero))
+
+        descripcion_orden = f"{campo_orden.lower()} {'↓' if descendente else '↑'}" if campo_orden else "registro"
+        print(f"\n{Color.CYAN}Página {pagina + 1} de {total_paginas} · {total} dispositivos · Orden: {descripcion_orden} · Vista: {'compacta' if modo_compacto else 'detallada'}{Color.END}")
+        print(f"{Color.DARKCYAN}n = siguiente · p = anterior · g <página> = ir a página · o <{'|'.join(CAMPOS_ORDENABLES)}> = ordenar · c = cambiar vista · Enter = volver{Color.END}")
+        opcion = mostrar_opciones_navegacion()
+        if isinstance(opcion, AccionNavegacion): return opcion
+
+        comando, _, argumento = opcion.partition(" ")
+        argumento = argumento.strip()
+        if opcion == "" or opcion.lower() == "enter":
+            return NAV_VOLVER
+        elif comando == "n":
+            pagina += 1
+        elif comando == "p":
+            pagina -= 1
+        elif comando == "g" or comando.isdigit():
+            destino = argumento if comando == "g" else comando
+            if destino.isdigit() and 1 <= int(destino) <= total_paginas:
+                pagina = int(destino) - 1
+            else:
+                mostrar_mensaje(f"Página inválida. Debe ser entre 1 y {total_paginas}.", "error"); pausa(1)
+        elif comando == "o":
+            campo = CAMPOS_ORDENABLES.get(argumento.lower())
+            if campo is None:
+                mostrar_mensaje(f"Campo de orden inválido. Opciones: {', '.join(CAMPOS_ORDENABLES)}", "error"); pausa(1)
+                continue
+            descendente = (not descendente) if campo == campo_orden else False # Repetir el campo invierte el orden
+            campo_orden = campo
+            clave = _clave_orden(campo)
+            orden = sorted(range(total), key=lambda i: clave(dispositivos_lista[i]), reverse=descendente)
+            pagina = 0
+        elif comando == "c":
+            primer_visible = inicio
+            modo_compacto = not modo_compacto
+            pagina = primer_visible // (TAMANO_PAGINA_COMPACTA if modo_compacto else TAMANO_PAGINA_DETALLE)
+        else:
+            mostrar_mensaje("Comando no reconocido.", "error"); pausa(1)
 
 
 def buscar_dispositivo(dispositivos_lista):
-    current_menu_func = lambda: buscar_dispositivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("🔍 BUSCAR DISPOSITIVO")
 
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para buscar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return NAV_VOLVER
 
-    nombre_buscar = input(f"{Color.GREEN}↳ Ingrese el nombre (o parte del nombre) a buscar (Enter para cancelar): {Color.END}").strip()
+    print(f"{Color.CYAN}Puede buscar por parte del nombre o combinar campos, por ejemplo:{Color.END}")
+    print("  tipo:switch ubicacion:distribucion vlan:20 servicio:DHCP")
+    print("  ip:10.2.0.0/16 nombre:SW*   (varios valores con coma: tipo:switch,router)\n")
+    nombre_buscar = input(f"{Color.GREEN}↳ Ingrese el nombre o la consulta a buscar (Enter para cancelar): {Color.END}").strip()
     if not nombre_buscar:
-        mostrar_mensaje("Búsqueda cancelada.", "info"); sleep(1)
-        pop_menu_history()(); return
+        mostrar_mensaje("Búsqueda cancelada.", "info"); pausa(1)
+        return NAV_VOLVER
 
-    nombre_buscar_lower = nombre_buscar.lower()
-    encontrados = [d for d in dispositivos_lista if nombre_buscar_lower in d.get("NOMBRE", "").lower()]
+    try:
+        encontrados = dispositivos_lista.consultar(analizar_consulta(nombre_buscar))
+    except ValueError as e:
+        mostrar_mensaje(f"Consulta inválida: {e}", "error", esperar_enter=True)
+        return NAV_REPETIR
 
     if encontrados:
         mostrar_barra_progreso(0.5, "Buscando dispositivos...")
-        # Llamar a una función que no reinicie el historial para la sub-vista de resultados
-        _mostrar_resultados_busqueda(encontrados, f"✨ RESULTADOS DE BÚSQUEDA PARA '{nombre_buscar}'", current_menu_func)
+        # La sub-vista de resultados se apila sobre la búsqueda; al volver se puede buscar de nuevo
+        return lambda: _mostrar_resultados_busqueda(encontrados, f"✨ RESULTADOS DE BÚSQUEDA PARA '{nombre_buscar}'")
     else:
-        mostrar_mensaje(f"No se encontraron dispositivos con el nombre '{nombre_buscar}'.", "advertencia", esperar_enter=True)
-        pop_menu_history()();
+        mostrar_mensaje(f"No se encontraron dispositivos para '{nombre_buscar}'.", "advertencia", esperar_enter=True)
+        return NAV_VOLVER
 
-def _mostrar_resultados_busqueda(dispositivos_encontrados, titulo, menu_anterior_func):
-    """Función auxiliar para mostrar resultados sin afectar tanto el historial principal."""
+def _mostrar_resultados_busqueda(dispositivos_encontrados, titulo):
+    """Pantalla de resultados; al terminar vuelve a la búsqueda o al menú principal."""
     mostrar_titulo(titulo)
     if not dispositivos_encontrados: # doble chequeo
         mostrar_mensaje("No hay dispositivos para mostrar.", "advertencia", esperar_enter=True)
-        menu_anterior_func(); return # Vuelve al menú de búsqueda
+        return NAV_VOLVER # Vuelve al menú de búsqueda
 
     for i, disp_data in enumerate(dispositivos_encontrados, 1):
         print(formatear_dispositivo_para_mostrar(disp_data, i))
@@ -634,22 +3543,20 @@ def _mostrar_resultados_busqueda(dispositivos_encontrados, titulo, menu_anterior
     while True:
         opcion = input(f"{Color.GREEN}↳ Opción: {Color.END}").strip().lower()
         if opcion == "":
-            menu_anterior_func(); return
+            return NAV_VOLVER
         elif opcion == "m":
-            ir_a_menu_principal(); return
+            return ir_a_menu_principal()
         else:
             mostrar_mensaje("Opción inválida.", "error")
 
 
 # <<< NUEVA FUNCIÓN PARA MODIFICAR DISPOSITIVO >>>
 def modificar_dispositivo_interactivo(dispositivos_lista):
-    current_menu_func = lambda: modificar_dispositivo_interactivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("✏️ MODIFICAR DISPOSITIVO")
 
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para modificar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return NAV_VOLVER
 
     print(f"{Color.BOLD}Seleccione el dispositivo a modificar:{Color.END}\n")
     for i, d in enumerate(dispositivos_lista, 1):
@@ -659,23 +3566,24 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
     try:
         num_in = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (0-{len(dispositivos_lista)}): {Color.END}").strip()
         if num_in == "0":
-            mostrar_mensaje("Modificación cancelada.", "info"); sleep(1)
-            pop_menu_history()(); return
+            mostrar_mensaje("Modificación cancelada.", "info"); pausa(1)
+            return NAV_VOLVER
 
         idx_sel = int(num_in) - 1
         if not (0 <= idx_sel < len(dispositivos_lista)):
-            mostrar_mensaje("Número de dispositivo inválido.", "error"); sleep(2)
-            # No salir del menú de modificar, permitir reintentar la selección del dispositivo
-            # modificar_dispositivo_interactivo(dispositivos_lista) # Esto crea recursión, mejor bucle o re-llamar desde el menú principal
-            return # Volverá a llamar al menú de modificar desde el bucle principal si es necesario
+            mostrar_mensaje("Número de dispositivo inválido.", "error"); pausa(2)
+            # No salir del menú de modificar: el bucle de menús vuelve a mostrar esta pantalla
+            return NAV_REPETIR
 
         disp_a_modificar = dispositivos_lista[idx_sel]
-        nombre_original = disp_a_modificar.get("NOMBRE")
-        modificado = False
+        # Los cambios se acumulan en la edición y se guardan todos juntos al finalizar
+        edicion = EdicionDispositivo(dispositivos_lista, disp_a_modificar)
 
         while True: # Bucle para modificar múltiples atributos del mismo dispositivo
-            mostrar_titulo(f"✏️ MODIFICANDO: {nombre_original}")
-            print(formatear_dispositivo_para_mostrar(disp_a_modificar))
+            mostrar_titulo(f"✏️ MODIFICANDO: {edicion.get('NOMBRE')}")
+            print(formatear_dispositivo_para_mostrar(edicion.vista()))
+            if edicion.cambios:
+                print(f"{Color.YELLOW}Cambios sin guardar: {', '.join(edicion.cambios)}{Color.END}")
             print(f"\n{Color.BOLD}¿Qué desea modificar?{Color.END}")
             print(f"{Color.YELLOW}1.{Color.END} Nombre")
             print(f"{Color.YELLOW}2.{Color.END} Dirección IP")
@@ -683,9 +3591,13 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
             print(f"{Color.YELLOW}4.{Color.END} Ubicación/Capa de Red")
             print(f"{Color.YELLOW}5.{Color.END} Servicios (Agregar/Eliminar)") # Combinar con agregar_servicio_a_dispositivo
             print(f"{Color.YELLOW}6.{Color.END} VLANs (Agregar/Eliminar)")
-            print(f"{Color.YELLOW}0.{Color.END} Finalizar Modificación de este Dispositivo")
+            print(f"{Color.YELLOW}7.{Color.END} Deshacer último cambio{'' if edicion.puede_deshacer else ' (no hay)'}")
+            print(f"{Color.YELLOW}8.{Color.END} Rehacer{'' if edicion.puede_rehacer else ' (no hay)'}")
+            print(f"{Color.YELLOW}9.{Color.END} Descartar cambios y salir")
+            print(f"{Color.YELLOW}0.{Color.END} Guardar y Finalizar Modificación de este Dispositivo")
 
-            op_mod = input(f"\n{Color.GREEN}↳ Seleccione una opción (0-6): {Color.END}").strip()
+            op_mod = input(f"\n{Color.GREEN}↳ Seleccione una opción (0-9): {Color.END}").strip()
+            cambiado = False
 
             if op_mod == "0":
                 break # Salir del bucle de modificación de atributos
@@ -693,98 +3605,101 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
             elif op_mod == "1": # Modificar Nombre
                 nuevo_nombre = ""
                 while not nuevo_nombre:
-                    temp_nombre = input(f"{Color.GREEN}↳ Nuevo nombre (Actual: {disp_a_modificar.get('NOMBRE', 'N/A')}, Enter para mantener): {Color.END}").strip()
+                    temp_nombre = input(f"{Color.GREEN}↳ Nuevo nombre (Actual: {edicion.get('NOMBRE', 'N/A')}, Enter para mantener): {Color.END}").strip()
                     if not temp_nombre: # Mantener actual
-                        nuevo_nombre = disp_a_modificar.get('NOMBRE')
+                        nuevo_nombre = edicion.get('NOMBRE')
                         break
                     try:
                         validar_nombre(temp_nombre)
-                        if temp_nombre.lower() != disp_a_modificar.get('NOMBRE','').lower() and \
-                           any(d.get("NOMBRE","").lower() == temp_nombre.lower() for d in dispositivos_lista if d is not disp_a_modificar):
+                        if dispositivos_lista.nombre_en_uso(temp_nombre, excluir=disp_a_modificar):
                             mostrar_mensaje(f"El nombre '{temp_nombre}' ya existe para otro dispositivo.", "advertencia")
                         else:
                             nuevo_nombre = temp_nombre
                             break
                     except ValueError as e:
                         mostrar_mensaje(str(e), "error")
-                if nuevo_nombre != disp_a_modificar.get('NOMBRE'):
-                    disp_a_modificar["NOMBRE"] = nuevo_nombre
-                    modificado = True
-                    nombre_original = nuevo_nombre # Actualizar para el título
+                cambiado = edicion.cambiar({"NOMBRE": nuevo_nombre})
 
             elif op_mod == "2": # Modificar IP
-                nueva_ip = ingresar_ip_interactivo(dispositivos_lista, dispositivo_actual=disp_a_modificar)
-                if nueva_ip is not None and nueva_ip != disp_a_modificar.get('IP'):
-                    disp_a_modificar["IP"] = nueva_ip
-                    modificado = True
+                nueva_ip = ingresar_ip_interactivo(dispositivos_lista, dispositivo_actual=disp_a_modificar, ip_actual=edicion.get('IP', 'N/A'))
+                if nueva_ip is not None:
+                    cambiado = edicion.cambiar({"IP": nueva_ip})
 
             elif op_mod == "3": # Modificar Tipo
-                nuevo_tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el nuevo tipo:", "Tipo", permitir_cancelar=True, valor_actual=disp_a_modificar.get('TIPO'))
-                if nuevo_tipo and nuevo_tipo != disp_a_modificar.get('TIPO'):
-                    disp_a_modificar["TIPO"] = nuevo_tipo
-                    modificado = True
+                nuevo_tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el nuevo tipo:", "Tipo", permitir_cancelar=True, valor_actual=edicion.get('TIPO'))
+                if nuevo_tipo and edicion.cambiar({"TIPO": nuevo_tipo}):
+                    cambiado = True
                     # Podría ser necesario re-evaluar campos dependientes del tipo (ej. Servicios, Ubicación)
                     mostrar_mensaje("El tipo ha cambiado. Considere revisar Servicios y Ubicación/Capa.", "info")
 
-
             elif op_mod == "4": # Modificar Ubicación/Capa
-                nueva_ubicacion = seleccionar_opcion_menu(CAPAS_RED, "Seleccione la nueva ubicación/capa:", "Ubicación/Capa", permitir_cancelar=True, valor_actual=disp_a_modificar.get('UBICACION'))
-                if nueva_ubicacion is not None and nueva_ubicacion != disp_a_modificar.get('UBICACION'): # Si es None, usuario canceló
-                     disp_a_modificar["UBICACION"] = nueva_ubicacion if nueva_ubicacion else "N/A" # Si cancela, puede querer N/A o mantener
-                     modificado = True
-                elif nueva_ubicacion is None and input(f"{Color.YELLOW}¿Desea establecer la ubicación como 'N/A'? (s/n, Enter para cancelar cambio): {Color.END}").lower() == 's':
-                    disp_a_modificar["UBICACION"] = "N/A"
-                    modificado = True
-
+                nueva_ubicacion = seleccionar_opcion_menu(CAPAS_RED, "Seleccione la nueva ubicación/capa:", "Ubicación/Capa", permitir_cancelar=True, valor_actual=edicion.get('UBICACION'))
+                if nueva_ubicacion is not None: # Si es None, usuario canceló
+                    cambiado = edicion.cambiar({"UBICACION": nueva_ubicacion if nueva_ubicacion else "N/A"})
+                elif input(f"{Color.YELLOW}¿Desea establecer la ubicación como 'N/A'? (s/n, Enter para cancelar cambio): {Color.END}").lower() == 's':
+                    cambiado = edicion.cambiar({"UBICACION": "N/A"})
 
             elif op_mod == "5": # Modificar Servicios
-                _modificar_servicios_para_dispositivo(disp_a_modificar, dispositivos_lista) # Llama a función auxiliar
-                # La función auxiliar ya guarda si hay cambios
-                modificado = True # Asumimos que pudo haber modificación
+                cambiado = _modificar_servicios_para_dispositivo(edicion)
 
             elif op_mod == "6": # Modificar VLANs
-                _modificar_vlans_para_dispositivo(disp_a_modificar, dispositivos_lista) # Llama a función auxiliar
-                # La función auxiliar ya guarda si hay cambios
-                modificado = True # Asumimos que pudo haber modificación
+                cambiado = _modificar_vlans_para_dispositivo(edicion)
+
+            elif op_mod in ("7", "8"): # Deshacer / Rehacer
+                paso = edicion.deshacer() if op_mod == "7" else edicion.rehacer()
+                if paso is None:
+                    mostrar_mensaje(f"No hay cambios para {'deshacer' if op_mod == '7' else 'rehacer'}.", "info")
+                else:
+                    mostrar_mensaje(f"{'Deshecho' if op_mod == '7' else 'Rehecho'}: {describir_paso_edicion(paso)}", "exito")
+                pausa(1)
+
+            elif op_mod == "9": # Descartar
+                if edicion.cambios:
+                    edicion.descartar()
+                    mostrar_mensaje("Cambios descartados. El dispositivo quedó como estaba.", "info")
+                else:
+                    mostrar_mensaje("No había cambios pendientes.", "info")
+                pausa(1)
+                return NAV_VOLVER
 
             else:
-                mostrar_mensaje("Opción de modificación inválida.", "error"); sleep(1)
-
-            if modificado: # Guardar después de cada cambio de atributo si se confirma el cambio
-                guardar_dispositivos_en_archivo(dispositivos_lista)
-                mostrar_mensaje(f"Atributo del dispositivo '{disp_a_modificar.get('NOMBRE')}' actualizado.", "exito")
-                sleep(1) # Pequeña pausa para ver el mensaje
-                # modificado = False # Resetear para la siguiente iteración del bucle de atributos
-
-        if modificado: # Si hubo alguna modificación general al dispositivo.
-            mostrar_barra_progreso(0.5, "Guardando cambios finales del dispositivo...")
-            # El guardado ya se hizo dentro del bucle por atributo. Este es más un mensaje final.
-            mostrar_mensaje(f"Dispositivo '{disp_a_modificar.get('NOMBRE')}' modificado exitosamente.", "exito")
+                mostrar_mensaje("Opción de modificación inválida.", "error"); pausa(1)
+
+            if cambiado: # Queda pendiente hasta guardar
+                mostrar_mensaje(f"Cambio preparado para '{edicion.get('NOMBRE')}' (se guardará al finalizar).", "exito")
+                pausa(1) # Pequeña pausa para ver el mensaje
+
+        cambios = edicion.cambios
+        if cambios:
+            mostrar_barra_progreso(0.5, "Guardando cambios del dispositivo...")
+            # Una sola escritura (una línea del diario o una transacción) para todos los campos
+            if confirmar_edicion_interactiva(edicion):
+                mostrar_mensaje(f"Dispositivo '{disp_a_modificar.get('NOMBRE')}' modificado exitosamente ({', '.join(cambios)}).", "exito")
         else:
             mostrar_mensaje("No se realizaron cambios en el dispositivo.", "info")
-        sleep(1)
+        pausa(1)
 
     except ValueError:
-        mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error"); sleep(2)
+        mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error"); pausa(2)
     except Exception as e:
         mostrar_mensaje(f"Error inesperado durante la modificación: {e}", "error", esperar_enter=True)
 
-    pop_menu_history()();
+    return NAV_VOLVER
 # <<< FIN NUEVA FUNCIÓN PARA MODIFICAR DISPOSITIVO >>>
 
 
-def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
-    """Función auxiliar para gestionar servicios de un dispositivo específico."""
-    tipo_key = next((k for k,v in TIPOS_DISPOSITIVO.items() if v == disp_mod.get("TIPO")), None)
+def _modificar_servicios_para_dispositivo(edicion):
+    """Función auxiliar para gestionar servicios de un dispositivo; los cambios quedan pendientes en la edición."""
+    tipo_key = next((k for k,v in TIPOS_DISPOSITIVO.items() if v == edicion.get("TIPO")), None)
     if tipo_key not in ['SERVIDOR', 'ROUTER', 'FIREWALL']:
-        mostrar_mensaje(f"Los servicios no suelen aplicar directamente al tipo '{disp_mod.get('TIPO')}'.", "advertencia", esperar_enter=True)
+        mostrar_mensaje(f"Los servicios no suelen aplicar directamente al tipo '{edicion.get('TIPO')}'.", "advertencia", esperar_enter=True)
         return False # No hubo cambios
 
-    servicios_actuales = disp_mod.get("SERVICIOS", [])
+    servicios_actuales = list(edicion.get("SERVICIOS") or []) # Copia: la edición guarda el valor anterior para deshacer
     hubo_cambios = False
 
     while True:
-        mostrar_titulo(f"MODIFICAR SERVICIOS DE: {disp_mod.get('NOMBRE')}")
+        mostrar_titulo(f"MODIFICAR SERVICIOS DE: {edicion.get('NOMBRE')}")
         print(f"{Color.DARKCYAN}Servicios actuales: {', '.join(servicios_actuales) or 'Ninguno'}{Color.END}")
         print(f"{Color.YELLOW}1.{Color.END} Agregar servicio(s)")
         print(f"{Color.YELLOW}2.{Color.END} Eliminar servicio(s)")
@@ -794,7 +3709,7 @@ def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
         if op_serv == "0": break
 
         elif op_serv == "1": # Agregar
-            print(f"\n{Color.BOLD}🛠️  Agregar nuevos servicios a '{disp_mod.get('NOMBRE')}':{Color.END}")
+            print(f"\n{Color.BOLD}🛠️  Agregar nuevos servicios a '{edicion.get('NOMBRE')}':{Color.END}")
             servicios_opciones_list = list(SERVICIOS_VALIDOS.items())
             servicios_disponibles_para_agregar = {k:v for k,v in SERVICIOS_VALIDOS.items() if v not in servicios_actuales}
 
@@ -837,7 +3752,8 @@ def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
 
             if valido and nuevos_servicios_temp:
                 servicios_actuales.extend(nuevos_servicios_temp)
-                disp_mod["SERVICIOS"] = sorted(list(set(servicios_actuales)))
+                edicion.cambiar({"SERVICIOS": sorted(list(set(servicios_actuales)))})
+                servicios_actuales = list(edicion.get("SERVICIOS"))
                 hubo_cambios = True
                 mostrar_mensaje(f"Servicios {', '.join(nuevos_servicios_temp)} agregados.", "exito")
 
@@ -846,7 +3762,7 @@ def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
                 mostrar_mensaje("No hay servicios asignados para eliminar.", "info", esperar_enter=True)
                 continue
 
-            print(f"\n{Color.BOLD}🗑️  Eliminar servicios de '{disp_mod.get('NOMBRE')}':{Color.END}")
+            print(f"\n{Color.BOLD}🗑️  Eliminar servicios de '{edicion.get('NOMBRE')}':{Color.END}")
             for i, serv in enumerate(servicios_actuales, 1):
                 print(f"{Color.YELLOW}{i}.{Color.END} {serv}")
 
@@ -871,25 +3787,25 @@ def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
                 # Eliminar en orden inverso de índice para no afectar los índices restantes
                 for idx_to_remove in sorted(servicios_a_eliminar_idx, reverse=True):
                     servicios_eliminados_nombres.append(servicios_actuales.pop(idx_to_remove))
-                disp_mod["SERVICIOS"] = sorted(list(set(servicios_actuales))) # Asegurar orden y unicidad
+                edicion.cambiar({"SERVICIOS": sorted(list(set(servicios_actuales)))}) # Asegurar orden y unicidad
+                servicios_actuales = list(edicion.get("SERVICIOS"))
                 hubo_cambios = True
                 mostrar_mensaje(f"Servicios {', '.join(reversed(servicios_eliminados_nombres))} eliminados.", "exito")
         else:
             mostrar_mensaje("Opción inválida.", "error")
 
         if hubo_cambios:
-            guardar_dispositivos_en_archivo(dispositivos_lista_global)
-            sleep(1)
+            pausa(1)
     return hubo_cambios
 
 
-def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
-    """Función auxiliar para gestionar VLANs de un dispositivo específico."""
-    vlans_actuales = disp_mod.get("VLANS", [])
+def _modificar_vlans_para_dispositivo(edicion):
+    """Función auxiliar para gestionar VLANs de un dispositivo; los cambios quedan pendientes en la edición."""
+    vlans_actuales = list(edicion.get("VLANS") or []) # Copia: la edición guarda el valor anterior para deshacer
     hubo_cambios_vlan = False
 
     while True:
-        mostrar_titulo(f"MODIFICAR VLANS DE: {disp_mod.get('NOMBRE')}")
+        mostrar_titulo(f"MODIFICAR VLANS DE: {edicion.get('NOMBRE')}")
         print(f"{Color.DARKCYAN}VLANs actuales: {', '.join(map(str, vlans_actuales)) or 'Ninguna'}{Color.END}")
         print(f"{Color.YELLOW}1.{Color.END} Agregar VLAN(s)")
         print(f"{Color.YELLOW}2.{Color.END} Eliminar VLAN(s)")
@@ -899,7 +3815,7 @@ def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
         if op_vlan == "0": break
 
         elif op_vlan == "1": # Agregar VLANs
-            print(f"\n{Color.BOLD}🔗 Agregar VLANs a '{disp_mod.get('NOMBRE')}':{Color.END}")
+            print(f"\n{Color.BOLD}🔗 Agregar VLANs a '{edicion.get('NOMBRE')}':{Color.END}")
             print(f"{Color.DARKCYAN}Puede ingresar varias VLANs separadas por comas (ej: 10,20,30).{Color.END}")
             while True:
                 vlans_input_str = input(f"{Color.GREEN}↳ Ingrese VLANs a agregar (1-4094, sep. por coma, Enter para cancelar): {Color.END}").strip()
@@ -910,7 +3826,8 @@ def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
 
                     if vlans_realmente_nuevas:
                         vlans_actuales.extend(vlans_realmente_nuevas)
-                        disp_mod["VLANS"] = sorted(list(set(vlans_actuales))) # Asegurar orden y unicidad
+                        edicion.cambiar({"VLANS": sorted(list(set(vlans_actuales)))}) # Asegurar orden y unicidad
+                        vlans_actuales = list(edicion.get("VLANS"))
                         hubo_cambios_vlan = True
                         mostrar_mensaje(f"VLANs {', '.join(map(str, vlans_realmente_nuevas))} agregadas.", "exito")
                     elif nuevas_vlans_list: # Si ingresó VLANs pero ya existían todas
@@ -926,7 +3843,7 @@ def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
                 mostrar_mensaje("No hay VLANs asignadas para eliminar.", "info", esperar_enter=True)
                 continue
 
-            print(f"\n{Color.BOLD}🗑️  Eliminar VLANs de '{disp_mod.get('NOMBRE')}':{Color.END}")
+            print(f"\n{Color.BOLD}🗑️  Eliminar VLANs de '{edicion.get('NOMBRE')}':{Color.END}")
             # Mostrar VLANs actuales con un número para facilitar la selección
             for i, vlan_val in enumerate(vlans_actuales, 1):
                 print(f"{Color.YELLOW}{i}.{Color.END} VLAN {vlan_val}")
@@ -959,7 +3876,8 @@ def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
                         vlans_eliminadas_nombres.append(str(vlan_val_to_remove))
 
                 if vlans_eliminadas_nombres:
-                    disp_mod["VLANS"] = sorted(list(set(vlans_actuales))) # Asegurar orden y unicidad
+                    edicion.cambiar({"VLANS": sorted(list(set(vlans_actuales)))}) # Asegurar orden y unicidad
+                    vlans_actuales = list(edicion.get("VLANS"))
                     hubo_cambios_vlan = True
                     mostrar_mensaje(f"VLANs {', '.join(vlans_eliminadas_nombres)} eliminadas.", "exito")
                 else:
@@ -968,8 +3886,7 @@ def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
             mostrar_mensaje("Opción inválida.", "error")
 
         if hubo_cambios_vlan:
-            guardar_dispositivos_en_archivo(dispositivos_lista_global)
-            sleep(1)
+            pausa(1)
     return hubo_cambios_vlan
 
 
@@ -978,13 +3895,11 @@ def agregar_servicio_a_dispositivo(dispositivos_lista): # Esta función puede se
     # ya incluye manejo de servicios. Esta función se vuelve un poco redundante.
     # Se podría llamar a _modificar_servicios_para_dispositivo desde aquí o refactorizar.
 
-    current_menu_func = lambda: agregar_servicio_a_dispositivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("➕ AGREGAR/MODIFICAR SERVICIOS A DISPOSITIVO") # Título actualizado
 
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para modificar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return NAV_VOLVER
 
     modificables = []
     print(f"{Color.BOLD}Seleccione un dispositivo para gestionar sus servicios:{Color.END}\n")
@@ -998,58 +3913,46 @@ def agregar_servicio_a_dispositivo(dispositivos_lista): # Esta función puede se
 
     if not modificables:
         mostrar_mensaje("No hay dispositivos elegibles (Servidor, Router, Firewall) para gestionar servicios.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return NAV_VOLVER
 
     print(f"{Color.YELLOW}0.{Color.END} Cancelar / Volver")
 
     try:
         num_in = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (0-{len(modificables)}): {Color.END}").strip()
         if num_in == "0":
-            mostrar_mensaje("Operación cancelada.", "info"); sleep(1)
-            pop_menu_history()(); return
+            mostrar_mensaje("Operación cancelada.", "info"); pausa(1)
+            return NAV_VOLVER
 
         idx_sel_mod_lista = int(num_in) - 1
 
         if 0 <= idx_sel_mod_lista < len(modificables):
-            disp_mod_original = modificables[idx_sel_mod_lista]
-            # Encontrar el índice original en la lista global para asegurar que se modifica el objeto correcto
-            idx_orig_global = -1
-            for i, original_disp_global in enumerate(dispositivos_lista):
-                if original_disp_global is disp_mod_original: # Comparar por identidad de objeto
-                    idx_orig_global = i
-                    break
-            
-            if idx_orig_global == -1:
-                mostrar_mensaje("Error interno: no se encontró el dispositivo original en la lista global.", "error", esperar_enter=True);
-                pop_menu_history()(); return
-
-            disp_a_gestionar_servicios = dispositivos_lista[idx_orig_global]
+            # Los elementos de 'modificables' son los mismos objetos del repositorio
+            disp_a_gestionar_servicios = modificables[idx_sel_mod_lista]
 
-            if _modificar_servicios_para_dispositivo(disp_a_gestionar_servicios, dispositivos_lista):
-                # _modificar_servicios_para_dispositivo ya guarda el archivo
+            edicion = EdicionDispositivo(dispositivos_lista, disp_a_gestionar_servicios)
+            _modificar_servicios_para_dispositivo(edicion)
+            if confirmar_edicion_interactiva(edicion): # Todos los cambios de servicios en una sola escritura
                 mostrar_mensaje(f"Gestión de servicios para '{disp_a_gestionar_servicios.get('NOMBRE')}' completada.", "exito")
             else:
                 mostrar_mensaje(f"No se realizaron cambios en los servicios de '{disp_a_gestionar_servicios.get('NOMBRE')}'.", "info")
-            sleep(1)
+            pausa(1)
 
         else:
-            mostrar_mensaje("Número de dispositivo inválido.", "error"); sleep(2)
+            mostrar_mensaje("Número de dispositivo inválido.", "error"); pausa(2)
     except ValueError:
-        mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error"); sleep(2)
+        mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error"); pausa(2)
     except Exception as e:
         mostrar_mensaje(f"Error inesperado gestionando servicios: {e}", "error", esperar_enter=True)
 
-    pop_menu_history()();
+    return NAV_VOLVER
 
 
 def eliminar_dispositivo(dispositivos_lista):
-    current_menu_func = lambda: eliminar_dispositivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("❌ ELIMINAR DISPOSITIVO")
 
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para eliminar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return NAV_VOLVER
 
     for i, d in enumerate(dispositivos_lista, 1):
         print(f"{Color.YELLOW}{i}.{Color.END} {d.get('NOMBRE')} ({d.get('TIPO')})")
@@ -1058,8 +3961,8 @@ def eliminar_dispositivo(dispositivos_lista):
     try:
         num_in = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo a eliminar (0-{len(dispositivos_lista)}): {Color.END}").strip()
         if num_in == "0":
-            mostrar_mensaje("Eliminación cancelada.", "info"); sleep(1)
-            pop_menu_history()(); return
+            mostrar_mensaje("Eliminación cancelada.", "info"); pausa(1)
+            return NAV_VOLVER
 
         idx_sel = int(num_in) - 1
         if 0 <= idx_sel < len(dispositivos_lista):
@@ -1070,10 +3973,16 @@ def eliminar_dispositivo(dispositivos_lista):
             print(f"{Color.RED}{'⚠' * 70}{Color.END}")
 
             if confirmar == 's':
-                del dispositivos_lista[idx_sel]
-                guardar_dispositivos_en_archivo(dispositivos_lista) # <<< GUARDAR DATOS
-                mostrar_mensaje(f"Dispositivo '{nombre_elim}' eliminado exitosamente.", "exito")
-                mostrar_barra_progreso(1, "Eliminando dispositivo y guardando cambios...")
+                try:
+                    eliminado = dispositivos_lista.eliminar(disp_elim) # El repositorio lo persiste en el almacenamiento
+                except ConflictoVersion as e:
+                    mostrar_mensaje(f"{e} No se eliminó.", "error", esperar_enter=True)
+                    return NAV_VOLVER
+                if eliminado:
+                    mostrar_mensaje(f"Dispositivo '{nombre_elim}' eliminado exitosamente.", "exito")
+                    mostrar_barra_progreso(1, "Eliminando dispositivo y guardando cambios...")
+                else:
+                    mostrar_mensaje(f"Otro usuario ya había eliminado '{nombre_elim}'.", "info")
             elif confirmar == 'n':
                 mostrar_mensaje("Eliminación cancelada por el usuario.", "info")
             else:
@@ -1083,38 +3992,64 @@ def eliminar_dispositivo(dispositivos_lista):
     except ValueError:
         mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error")
 
-    sleep(1)
-    pop_menu_history()();
+    pausa(1)
+    return NAV_VOLVER
 
 
+def calcular_estadisticas(dispositivos_lista):
+    """Cuenta dispositivos por tipo, ubicación/capa, servicio y VLAN (sin imprimir nada)."""
+    tipos_count, ubicacion_count, serv_count, vlan_usage_count = {}, {}, {}, {}
+    dispositivos_con_vlans = 0
+    total_vlans_configuradas = 0
+    for d in dispositivos_lista:
+        tipo = d.get("TIPO","N/A")
+        tipos_count[tipo] = tipos_count.get(tipo,0)+1
+        ubicacion = d.get("UBICACION","N/A")
+        if ubicacion != "N/A":
+            ubicacion_count[ubicacion] = ubicacion_count.get(ubicacion,0)+1
+        for s_tag in d.get("SERVICIOS",[]) or []:
+            serv_count[s_tag] = serv_count.get(s_tag,0)+1
+        vlans_lista_disp = d.get("VLANS", [])
+        if vlans_lista_disp:
+            dispositivos_con_vlans += 1
+            total_vlans_configuradas += len(vlans_lista_disp)
+            for vlan in vlans_lista_disp:
+                vlan_usage_count[vlan] = vlan_usage_count.get(vlan, 0) + 1
+    return {
+        "total": len(dispositivos_lista),
+        "por_tipo": tipos_count,
+        "por_ubicacion": ubicacion_count,
+        "por_servicio": serv_count,
+        "por_vlan": vlan_usage_count,
+        "dispositivos_con_vlans": dispositivos_con_vlans,
+        "total_vlans_configuradas": total_vlans_configuradas,
+    }
+
+def _resumir_nombres(dispositivos, maximo=10):
+    nombres = sorted(d.get("NOMBRE", "N/A") for d in dispositivos)
+    resto = len(nombres) - maximo
+    return ", ".join(nombres[:maximo]) + (f" ... y {resto} más" if resto > 0 else "")
+
 def generar_reporte_estadistico(dispositivos_lista):
-    current_menu_func = lambda: generar_reporte_estadistico(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("📊 REPORTE ESTADÍSTICO DETALLADO")
 
     if not dispositivos_lista:
         mostrar_mensaje("⚠️ No hay dispositivos para generar un reporte.", "advertencia", True)
-        pop_menu_history()(); return
+        return NAV_VOLVER
+
+    estadisticas = dispositivos_lista.estadisticas.como_dict() # Contadores incrementales: no recorre el inventario
 
     print(f"\n{Color.BOLD}{Color.PURPLE}📌 RESUMEN GENERAL{Color.END}")
-    print(f"{Color.CYAN}Total dispositivos:{Color.END} {len(dispositivos_lista)}")
+    print(f"{Color.CYAN}Total dispositivos:{Color.END} {estadisticas['total']}")
     print(f"{Color.CYAN}Reporte generado por:{Color.END} {current_user}")
     print(f"{Color.CYAN}Fecha y Hora:{Color.END} {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     print(f"\n{Color.BOLD}{Color.PURPLE}🔢 DISTRIBUCIÓN POR TIPO DE DISPOSITIVO:{Color.END}")
-    tipos_count = {}
-    for d in dispositivos_lista:
-        tipo = d.get("TIPO","N/A")
-        tipos_count[tipo] = tipos_count.get(tipo,0)+1
-    for tipo, cant in sorted(tipos_count.items(), key=lambda x:x[1], reverse=True):
+    for tipo, cant in sorted(estadisticas["por_tipo"].items(), key=lambda x:x[1], reverse=True):
         print(f"  {Color.YELLOW}{tipo}:{Color.END} {cant}")
 
     print(f"\n{Color.BOLD}{Color.PURPLE}📍 DISTRIBUCIÓN POR UBICACIÓN/CAPA DE RED:{Color.END}") # Cambiado
-    ubicacion_count = {}
-    for d in dispositivos_lista:
-        ubicacion = d.get("UBICACION","N/A") # Cambiado
-        if ubicacion != "N/A":
-            ubicacion_count[ubicacion] = ubicacion_count.get(ubicacion,0)+1
+    ubicacion_count = estadisticas["por_ubicacion"]
     if ubicacion_count:
         for ubicacion_val, cant in sorted(ubicacion_count.items(), key=lambda x:x[1], reverse=True):
             print(f"  {Color.YELLOW}{ubicacion_val}:{Color.END} {cant}")
@@ -1123,13 +4058,7 @@ def generar_reporte_estadistico(dispositivos_lista):
 
 
     print(f"\n{Color.BOLD}{Color.PURPLE}🛠️ SERVICIOS MÁS UTILIZADOS EN LA RED:{Color.END}")
-    serv_count = {}
-    for d in dispositivos_lista:
-        servicios_lista_disp = d.get("SERVICIOS",[])
-        if servicios_lista_disp:
-            for s_tag in servicios_lista_disp:
-                serv_count[s_tag] = serv_count.get(s_tag,0)+1
-
+    serv_count = estadisticas["por_servicio"]
     if serv_count:
         for serv, cant in sorted(serv_count.items(), key=lambda x:x[1], reverse=True):
             print(f"  {Color.YELLOW}{serv}:{Color.END} {cant} dispositivos")
@@ -1137,88 +4066,1660 @@ def generar_reporte_estadistico(dispositivos_lista):
         print(f"  {Color.DARKCYAN}No hay servicios configurados en ningún dispositivo.{Color.END}")
 
     print(f"\n{Color.BOLD}{Color.PURPLE}🔗 USO DE VLANs EN LA RED:{Color.END}")
-    vlan_usage_count = {}
-    dispositivos_con_vlans = 0
-    total_vlans_configuradas = 0
-    for d in dispositivos_lista:
-        vlans_lista_disp = d.get("VLANS", [])
-        if vlans_lista_disp:
-            dispositivos_con_vlans +=1
-            total_vlans_configuradas += len(vlans_lista_disp)
-            for vlan in vlans_lista_disp:
-                vlan_usage_count[vlan] = vlan_usage_count.get(vlan, 0) + 1
-
+    vlan_usage_count = estadisticas["por_vlan"]
     if vlan_usage_count:
-        print(f"  {Color.CYAN}Total de dispositivos con VLANs configuradas:{Color.END} {dispositivos_con_vlans}")
-        print(f"  {Color.CYAN}Número total de configuraciones de VLAN (instancias):{Color.END} {total_vlans_configuradas}")
+        print(f"  {Color.CYAN}Total de dispositivos con VLANs configuradas:{Color.END} {estadisticas['dispositivos_con_vlans']}")
+        print(f"  {Color.CYAN}Número total de configuraciones de VLAN (instancias):{Color.END} {estadisticas['total_vlans_configuradas']}")
         print(f"  {Color.CYAN}VLANs específicas más utilizadas (veces que aparece cada VLAN):{Color.END}")
         for vlan, cant in sorted(vlan_usage_count.items(), key=lambda x: (x[1], x[0]), reverse=True):
             print(f"    {Color.YELLOW}VLAN {vlan}:{Color.END} {cant} veces")
     else:
         print(f"  {Color.DARKCYAN}No hay VLANs configuradas en ningún dispositivo de la red.{Color.END}")
 
+    if serv_count:
+        print(f"\n{Color.BOLD}{Color.PURPLE}🧾 DISPOSITIVOS POR SERVICIO:{Color.END}")
+        for serv in sorted(serv_count, key=lambda x: serv_count[x], reverse=True):
+            print(f"  {Color.YELLOW}{serv}:{Color.END} {_resumir_nombres(dispositivos_lista.dispositivos_por('SERVICIOS', serv))}")
+    if vlan_usage_count:
+        print(f"\n{Color.BOLD}{Color.PURPLE}🧾 DISPOSITIVOS POR VLAN:{Color.END}")
+        for vlan in sorted(vlan_usage_count):
+            print(f"  {Color.YELLOW}VLAN {vlan}:{Color.END} {_resumir_nombres(dispositivos_lista.dispositivos_por('VLANS', vlan))}")
+
+    subredes = dispositivos_lista.utilizacion_subredes()
+    if subredes:
+        print(f"\n{Color.BOLD}{Color.PURPLE}🌐 UTILIZACIÓN POR SUBRED (/{PREFIJO_SUBRED_REPORTE}):{Color.END}")
+        maximo_subredes = 20
+        for subred in sorted(subredes, key=lambda x: x["utilizacion"], reverse=True)[:maximo_subredes]:
+            libre = subred["siguiente_libre"] or "ninguna"
+            print(f"  {Color.YELLOW}{subred['red']}:{Color.END} {subred['usadas']}/{subred['capacidad']} ({subred['utilizacion']}%) - siguiente libre: {libre}")
+        if len(subredes) > maximo_subredes:
+            print(f"  {Color.DARKCYAN}... y {len(subredes) - maximo_subredes} subredes más.{Color.END}")
+    duplicadas = dispositivos_lista.ips_duplicadas()
+    if duplicadas:
+        print(f"\n{Color.BOLD}{Color.RED}⚠️ IPs ASIGNADAS A MÁS DE UN DISPOSITIVO:{Color.END}")
+        for ip, nombres in sorted(duplicadas.items(), key=lambda x: ip_a_entero(x[0])):
+            print(f"  {Color.YELLOW}{ip}:{Color.END} {', '.join(nombres)}")
+
+    if os.path.exists(SerieLatencias().ruta_cruda):
+        filas_monitor = resumen_monitor_por_dispositivo(dispositivos_lista)
+        if filas_monitor:
+            print(f"\n{Color.BOLD}{Color.PURPLE}📈 DISPONIBILIDAD Y LATENCIA (monitor, últimas {MONITOR_VENTANA_REPORTE_HORAS} h, ms):{Color.END}")
+            _imprimir_filas_monitor(filas_monitor, 10)
+
     print(f"\n{Color.BLUE}{'═' * 70}{Color.END}")
-    input(f"{Color.GREEN}Presione Enter para volver al menú anterior...{Color.END}")
-    pop_menu_history()();
+    opcion = input(f"{Color.GREEN}Presione Enter para volver al menú anterior ('v' para verificar los contadores con un recálculo completo)...{Color.END}").strip().lower()
+    if opcion == "v":
+        diferencias = dispositivos_lista.estadisticas.verificar_consistencia(dispositivos_lista)
+        if diferencias:
+            mostrar_mensaje("Los contadores no coinciden con el recálculo completo:\n  " + "\n  ".join(diferencias), "error", esperar_enter=True)
+        else:
+            mostrar_mensaje("Contadores consistentes con el recálculo completo.", "exito", esperar_enter=True)
+    return NAV_VOLVER
+
+MAXIMO_FILAS_VLAN = 50 # Filas por consulta en el mapa de VLANs
+
+def _texto_vlans(vlans):
+    return ", ".join(map(str, vlans)) if vlans else "ninguna"
+
+def _consultar_mapa_vlans(dispositivos_lista, topologia, comando, argumento):
+    """Ejecuta una consulta del mapa de VLANs e imprime el resultado. Devuelve False si la entrada no es válida."""
+    if comando == "v":
+        vlans = validar_vlans_input(argumento)
+        if not vlans:
+            raise ValueError("Indique al menos una VLAN (p. ej. v 10,20).")
+        filas = [(d.get("NOMBRE", "N/A"), d.get("IP", "N/A")) for d in topologia.dispositivos_en(vlans)]
+        print(f"\n{Color.BOLD}{Color.PURPLE}Dispositivos en las VLANs {_texto_vlans(vlans)}: {len(filas)}{Color.END}")
+        for nombre, ip in sorted(filas, key=lambda f: f[0].lower())[:MAXIMO_FILAS_VLAN]:
+            print(f"  {Color.YELLOW}{nombre}{Color.END} ({ip})")
+    elif comando in ("c", "r"):
+        disp = dispositivos_lista.obtener_por_nombre(argumento)
+        if disp is None:
+            raise ValueError(f"No existe un dispositivo llamado '{argumento}'.")
+        if comando == "c":
+            filas = sorted(topologia.comparten_con(disp), key=lambda f: (-len(f[1]), f[0].get("NOMBRE", "").lower()))
+            print(f"\n{Color.BOLD}{Color.PURPLE}Comparten VLAN con {disp.get('NOMBRE')} (VLANs {_texto_vlans(disp.get('VLANS'))}): {len(filas)}{Color.END}")
+            for otro, comunes in filas[:MAXIMO_FILAS_VLAN]:
+                print(f"  {Color.YELLOW}{otro.get('NOMBRE')}{Color.END} ({otro.get('TIPO')}): VLANs {_texto_vlans(comunes)}")
+        else:
+            filas = dispositivos_lista.divergencias_vlan(disp)
+            print(f"\n{Color.BOLD}{Color.PURPLE}Diferencias con {disp.get('NOMBRE')} (VLANs {_texto_vlans(disp.get('VLANS'))}) entre dispositivos {disp.get('TIPO')}: {len(filas)}{Color.END}")
+            for otro, faltantes, sobrantes in filas[:MAXIMO_FILAS_VLAN]:
+                print(f"  {Color.YELLOW}{otro.get('NOMBRE')}{Color.END}: faltan {_texto_vlans(faltantes)}; sobran {_texto_vlans(sobrantes)}")
+    else:
+        return False
+    if len(filas) > MAXIMO_FILAS_VLAN:
+        print(f"  {Color.DARKCYAN}... y {len(filas) - MAXIMO_FILAS_VLAN} más (use el comando 'vlans' de la CLI para el listado completo).{Color.END}")
+    return True
+
+def mapa_vlans_interactivo(dispositivos_lista):
+    while True:
+        mostrar_titulo("🔗 MAPA DE VLANs (TOPOLOGÍA)")
+        topologia = dispositivos_lista.topologia_vlan()
+        resumen = topologia.resumen()
+        if not resumen["vlans_en_uso"]:
+            mostrar_mensaje("No hay VLANs configuradas en ningún dispositivo.", "advertencia", esperar_enter=True)
+            return NAV_VOLVER
+
+        print(f"{Color.CYAN}VLANs en uso:{Color.END} {resumen['vlans_en_uso']}    {Color.CYAN}Dispositivos con VLANs:{Color.END} {resumen['dispositivos_con_vlans']}")
+        print(f"\n{Color.BOLD}{Color.PURPLE}📶 VLANs CON MÁS DISPOSITIVOS:{Color.END}")
+        for vlan, cant in sorted(resumen["miembros_por_vlan"].items(), key=lambda x: (-x[1], x[0]))[:10]:
+            print(f"  {Color.YELLOW}VLAN {vlan}:{Color.END} {cant} dispositivos")
+        un_miembro = topologia.vlans_con_un_miembro()
+        if un_miembro:
+            print(f"\n{Color.BOLD}{Color.RED}⚠️ VLANs PRESENTES EN UN SOLO DISPOSITIVO (posible error de configuración):{Color.END}")
+            for vlan, disp in list(un_miembro.items())[:20]:
+                print(f"  {Color.YELLOW}VLAN {vlan}:{Color.END} {disp.get('NOMBRE')}")
+            if len(un_miembro) > 20:
+                print(f"  {Color.DARKCYAN}... y {len(un_miembro) - 20} más.{Color.END}")
+
+        print(f"\n{Color.BOLD}Consultas:{Color.END}")
+        print(f"{Color.YELLOW}c <nombre>{Color.END}  Dispositivos que comparten alguna VLAN con <nombre>")
+        print(f"{Color.YELLOW}r <nombre>{Color.END}  Diferencias de VLANs de los equipos del mismo tipo respecto de <nombre> (p. ej. un switch de referencia)")
+        print(f"{Color.YELLOW}v <vlans>{Color.END}   Dispositivos que tienen todas las VLANs indicadas (p. ej. v 10,20)")
+
+        opcion = mostrar_opciones_navegacion()
+        if isinstance(opcion, AccionNavegacion): return opcion
+
+        comando, _, argumento = opcion.partition(" ")
+        try:
+            if not _consultar_mapa_vlans(dispositivos_lista, topologia, comando, argumento.strip()):
+                mostrar_mensaje(f"Opción '{opcion}' no válida. Use c, r o v seguido del nombre o las VLANs.", "error"); pausa(2)
+                continue
+        except ValueError as e:
+            mostrar_mensaje(str(e), "error"); pausa(2)
+            continue
+        input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+
+# Exportación en streaming: los dispositivos se escriben uno a uno sobre un buffer grande,
+# sin armar la salida completa en memoria, por lo que el consumo se mantiene plano aun con
+# inventarios de millones de dispositivos.
+FORMATOS_EXPORTACION = {"txt": "Reporte de texto", "csv": "CSV", "jsonl": "JSON Lines", "md": "Tabla Markdown"}
+CAMPOS_EXPORTACION = ["NOMBRE", "IP", "TIPO", "UBICACION", "SERVICIOS", "VLANS"]
+TAMANO_BUFFER_EXPORTACION = 1 << 16 # 64 KiB por escritura real a disco
+
+def _abrir_salida_exportacion(ruta, comprimir=False):
+    """Abre un archivo de texto con buffer grande; si se pide, comprimido con gzip."""
+    if comprimir:
+        binario = io.BufferedWriter(gzip.GzipFile(ruta, 'wb'), buffer_size=TAMANO_BUFFER_EXPORTACION)
+        return io.TextIOWrapper(binario, encoding='utf-8', newline='')
+    return open(ruta, 'w', encoding='utf-8', newline='', buffering=TAMANO_BUFFER_EXPORTACION)
+
+def _texto_campo(disp, campo):
+    valor = disp.get(campo, "N/A")
+    if campo in ("SERVICIOS", "VLANS"):
+        return ", ".join(map(str, valor or []))
+    return valor
+
+def _escribir_txt(f, dispositivos, campos):
+    etiquetas = {"NOMBRE": "Nombre", "IP": "IP", "TIPO": "Tipo", "UBICACION": "Ubicación/Capa", "SERVICIOS": "Servicios", "VLANS": "VLANs"}
+    vacios = {"SERVICIOS": "Ninguno", "VLANS": "Ninguna"}
+    f.write("═════════════════════════════════════════════════════════════════════════════\n")
+    f.write(f"                REPORTE DE DISPOSITIVOS DE RED ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})\n")
+    f.write(f"                Generado por: {current_user}\n")
+    f.write("═════════════════════════════════════════════════════════════════════════════\n\n")
+    total = 0
+    for total, disp in enumerate(dispositivos, 1):
+        f.write(f"Dispositivo #{total}\n")
+        for campo in campos:
+            f.write(f"  {etiquetas[campo]}: {_texto_campo(disp, campo) or vacios.get(campo, 'N/A')}\n")
+        f.write("-------------------------------------------------------------------------------\n\n")
+    if not total:
+        f.write("No hay dispositivos para reportar.\n")
+    f.write(f"\nTotal de dispositivos en el reporte: {total}\n")
+    f.write("═════════════════════════════ FIN DEL REPORTE ═════════════════════════════\n")
+    return total
+
+def _escribir_csv(f, dispositivos, campos):
+    escritor = csv.writer(f)
+    escritor.writerow(campos)
+    total = 0
+    for total, disp in enumerate(dispositivos, 1):
+        escritor.writerow([_texto_campo(disp, campo) for campo in campos])
+    return total
+
+def _escribir_jsonl(f, dispositivos, campos):
+    total = 0
+    for total, disp in enumerate(dispositivos, 1):
+        f.write(json.dumps({campo: disp.get(campo, "N/A") for campo in campos}, ensure_ascii=False))
+        f.write("\n")
+    return total
+
+def _escribir_md(f, dispositivos, campos):
+    f.write("| " + " | ".join(campos) + " |\n")
+    f.write("|" + "---|" * len(campos) + "\n")
+    total = 0
+    for total, disp in enumerate(dispositivos, 1):
+        f.write("| " + " | ".join(str(_texto_campo(disp, campo)).replace("|", "\\|") for campo in campos) + " |\n")
+    return total
+
+ESCRITORES_EXPORTACION = {"txt": _escribir_txt, "csv": _escribir_csv, "jsonl": _escribir_jsonl, "md": _escribir_md}
+
+def exportar_dispositivos(dispositivos, ruta, formato="txt", campos=None, comprimir=False):
+    """Escribe los dispositivos (cualquier iterable) en el formato pedido y devuelve cuántos se exportaron."""
+    campos = campos or CAMPOS_EXPORTACION
+    campos_invalidos = [c for c in campos if c not in CAMPOS_EXPORTACION]
+    if campos_invalidos:
+        raise ValueError(f"Campos no válidos: {', '.join(campos_invalidos)}. Opciones: {', '.join(CAMPOS_EXPORTACION)}")
+    if formato not in ESCRITORES_EXPORTACION:
+        raise ValueError(f"Formato '{formato}' no válido. Opciones: {', '.join(FORMATOS_EXPORTACION)}")
+    with _abrir_salida_exportacion(ruta, comprimir) as f:
+        return ESCRITORES_EXPORTACION[formato](f, dispositivos, campos)
+
+def escribir_reporte_txt(dispositivos_lista, ruta_completa_archivo):
+    """Escribe el listado de dispositivos en el formato de reporte de texto."""
+    return exportar_dispositivos(dispositivos_lista, ruta_completa_archivo, "txt")
+
+def ruta_exportacion_por_defecto(formato, comprimir=False, directorio_reportes="reportes"):
+    os.makedirs(directorio_reportes, exist_ok=True)
+    nombre_archivo = datetime.now().strftime(f"reporte_dispositivos_%Y-%m-%d_%H-%M-%S.{formato}") + (".gz" if comprimir else "")
+    return os.path.join(directorio_reportes, nombre_archivo)
 
 def exportar_reporte_a_archivo(dispositivos_lista):
-    current_menu_func = lambda: exportar_reporte_a_archivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("📁 EXPORTAR REPORTE A ARCHIVO")
 
     if not dispositivos_lista:
         mostrar_mensaje("⚠️ No hay dispositivos para exportar.", "advertencia", True)
-        pop_menu_history()(); return
+        return NAV_VOLVER
+
+    formatos = list(FORMATOS_EXPORTACION.items())
+    print(f"{Color.BOLD}Formato de exportación:{Color.END}")
+    for i, (_, descripcion) in enumerate(formatos, 1):
+        print(f"{Color.YELLOW}{i}.{Color.END} {descripcion}")
+    opcion_formato = input(f"{Color.GREEN}↳ Formato (1-{len(formatos)}, Enter = texto): {Color.END}").strip() or "1"
+    if not opcion_formato.isdigit() or not 1 <= int(opcion_formato) <= len(formatos):
+        mostrar_mensaje("Formato inválido.", "error", True)
+        return NAV_VOLVER
+    formato = formatos[int(opcion_formato) - 1][0]
+
+    campos_txt = input(f"{Color.GREEN}↳ Campos a incluir separados por coma ({', '.join(CAMPOS_EXPORTACION)}; Enter = todos): {Color.END}").strip()
+    campos = [c.strip().upper() for c in campos_txt.split(",") if c.strip()] or None
+
+    dispositivos_a_exportar = dispositivos_lista
+    if input(f"{Color.GREEN}¿Desea exportar sólo un tipo de dispositivo? (s/n): {Color.END}").lower() == 's':
+        tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el tipo:", "Tipo", permitir_cancelar=True)
+        if tipo:
+            dispositivos_a_exportar = dispositivos_lista.filtrar(tipo=tipo)
+    comprimir = input(f"{Color.GREEN}¿Comprimir con gzip? (s/n): {Color.END}").lower() == 's'
 
-    directorio_reportes = "reportes"
     try:
-        os.makedirs(directorio_reportes, exist_ok=True)
+        ruta_completa_archivo = ruta_exportacion_por_defecto(formato, comprimir)
     except OSError as e:
-        mostrar_mensaje(f"Error al crear el directorio '{directorio_reportes}': {e}", "error", True)
-        pop_menu_history()(); return
-
-    nombre_archivo = datetime.now().strftime("reporte_dispositivos_%Y-%m-%d_%H-%M-%S.txt")
-    ruta_completa_archivo = os.path.join(directorio_reportes, nombre_archivo)
+        mostrar_mensaje(f"Error al crear el directorio 'reportes': {e}", "error", True)
+        return NAV_VOLVER
 
     try:
-        with open(ruta_completa_archivo, 'w', encoding='utf-8') as f:
-            f.write("═════════════════════════════════════════════════════════════════════════════\n")
-            f.write(f"                REPORTE DE DISPOSITIVOS DE RED ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})\n")
-            f.write(f"                Generado por: {current_user}\n")
-            f.write("═════════════════════════════════════════════════════════════════════════════\n\n")
-
-            if not dispositivos_lista:
-                f.write("No hay dispositivos para reportar.\n")
-            else:
-                for i, disp in enumerate(dispositivos_lista, 1):
-                    f.write(f"Dispositivo #{i}\n")
-                    f.write(f"  Nombre: {disp.get('NOMBRE', 'N/A')}\n")
-                    f.write(f"  IP: {disp.get('IP', 'N/A')}\n")
-                    f.write(f"  Tipo: {disp.get('TIPO', 'N/A')}\n")
-                    f.write(f"  Ubicación/Capa: {disp.get('UBICACION', 'N/A')}\n") # Cambiado 'CAPA' a 'UBICACION'
-
-                    servicios_lista = disp.get('SERVICIOS', [])
-                    servicios_str = ", ".join(servicios_lista) if servicios_lista else "Ninguno"
-                    f.write(f"  Servicios: {servicios_str}\n")
-
-                    vlans_lista = disp.get('VLANS', [])
-                    vlans_str = ", ".join(map(str, vlans_lista)) if vlans_lista else "Ninguna"
-                    f.write(f"  VLANs: {vlans_str}\n")
-                    f.write("-------------------------------------------------------------------------------\n\n")
-
-            f.write(f"\nTotal de dispositivos en el reporte: {len(dispositivos_lista)}\n")
-            f.write("═════════════════════════════ FIN DEL REPORTE ═════════════════════════════\n")
-
-        mostrar_mensaje(f"Reporte exportado exitosamente como '{ruta_completa_archivo}'", "exito", True)
+        total = exportar_dispositivos(dispositivos_a_exportar, ruta_completa_archivo, formato, campos, comprimir)
+        mostrar_mensaje(f"Reporte exportado exitosamente como '{ruta_completa_archivo}' ({total} dispositivos)", "exito", True)
+    except ValueError as e:
+        mostrar_mensaje(str(e), "error", True)
     except IOError as e:
         mostrar_mensaje(f"Error al escribir el archivo de reporte '{ruta_completa_archivo}': {e}", "error", True)
 
-    pop_menu_history()();
+    return NAV_VOLVER
+
+
+# ---------------- IMPORTACIÓN DE INVENTARIOS LEGADOS (.txt) ----------------
+# Formato de bloques usado por los archivos de zona/campus:
+#   ========================================
+#   Tipo: Switch
+#   Nombre: SW1
+#   IP: 10.2.0.1
+#   VLAN: 10,20,30
+#   Jerarquía: Distribución
+#   Servicios: VLAN, Trunking, Datos
+#   Fecha Registro: 2025-04-22 20:12:04
+#   ========================================
+ARCHIVOS_INVENTARIO_LEGADO = ["zona core.txt", "campus uno.txt", "campus matriz.txt", "sector outsourcing.txt"]
+TIPOS_LEGADO = {
+    'router': 'ROUTER', 'switch': 'SWITCH', 'switch multicapa': 'SWITCH', 'dispositivo final': 'PC',
+    'pc': 'PC', 'servidor': 'SERVIDOR', 'server': 'SERVIDOR', 'firewall': 'FIREWALL', 'impresora': 'IMPRESORA'
+}
+JERARQUIAS_LEGADO = {
+    'núcleo': 'NUCLEO', 'nucleo': 'NUCLEO', 'core': 'NUCLEO', 'distribución': 'DISTRIBUCION',
+    'distribucion': 'DISTRIBUCION', 'acceso': 'ACCESO', 'cliente': 'N/A', 'n/a': 'N/A'
+}
+
+def leer_bloques_inventario_legado(ruta):
+    """Recorre el archivo línea a línea y entrega (línea de inicio, {campo: valor}) por cada bloque."""
+    with open(ruta, 'r', encoding='utf-8', errors='replace') as f:
+        campos, linea_inicio = {}, None
+        for num_linea, linea in enumerate(f, 1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            if linea.startswith("===="):
+                if campos:
+                    yield linea_inicio, campos
+                campos, linea_inicio = {}, None
+                continue
+            clave, separador, valor = linea.partition(":")
+            if not separador:
+                continue
+            if linea_inicio is None:
+                linea_inicio = num_linea
+            campos[clave.strip().lower()] = valor.strip()
+        if campos:
+            yield linea_inicio, campos
+
+
+def _dispositivo_desde_bloque_legado(campos, dispositivos_lista):
+    """Convierte un bloque legado al esquema de crear_dispositivo. Devuelve (dispositivo, advertencias)."""
+    advertencias = []
+    nombre = campos.get("nombre", "")
+    validar_nombre(nombre)
+    if dispositivos_lista.nombre_en_uso(nombre):
+        raise ValueError(f"El nombre '{nombre}' ya existe.")
+
+    tipo_legado = campos.get("tipo", "").lower()
+    tipo_key = TIPOS_LEGADO.get(tipo_legado)
+    if tipo_key is None:
+        raise ValueError(f"Tipo '{campos.get('tipo', '')}' no reconocido.")
+
+    ip = campos.get("ip", "")
+    if ip and ip.upper() != "N/A":
+        validar_ip(ip)
+        disp = dispositivos_lista.ip_en_uso(ip)
+        if disp is not None:
+            raise ValueError(f"La IP '{ip}' ya está asignada al dispositivo '{disp.get('NOMBRE')}'.")
+    else:
+        ip = "N/A"
+
+    vlans_txt = campos.get("vlan", "")
+    vlans = [] if vlans_txt.upper() in ("", "N/A") else validar_vlans_input(vlans_txt)
+
+    jerarquia = campos.get("jerarquía", campos.get("jerarquia", "N/A"))
+    capa_key = JERARQUIAS_LEGADO.get(jerarquia.lower())
+    if capa_key is None:
+        advertencias.append(f"Jerarquía '{jerarquia}' no reconocida; se asigna N/A.")
+        capa_key = 'N/A'
+
+    servicios = []
+    servicios_txt = campos.get("servicios", "")
+    if servicios_txt.lower() not in ("", "ninguno", "n/a"):
+        for servicio in servicios_txt.split(","):
+            try:
+                servicios.append(_resolver_opcion(SERVICIOS_VALIDOS, servicio, "Servicio"))
+            except ValueError:
+                advertencias.append(f"Servicio '{servicio.strip()}' no reconocido; se omite.")
+
+    disp = crear_dispositivo(TIPOS_DISPOSITIVO[tipo_key], nombre.strip(), ip, CAPAS_RED[capa_key], sorted(set(servicios)), vlans)
+    if not disp:
+        raise ValueError("Datos del dispositivo inválidos.")
+    return disp, advertencias
+
+
+def importar_inventarios_legados(dispositivos_lista, rutas):
+    """Importa uno o más archivos legados en una sola pasada.
+
+    Los registros inválidos o duplicados no detienen la importación: se acumulan en el
+    informe con su archivo y línea. El almacenamiento se suspende y al final se guarda todo
+    una sola vez.
+    """
+    informe = {"importados": 0, "errores": [], "advertencias": []}
+    with dispositivos_lista.operacion_masiva():
+        for ruta in rutas:
+            try:
+                for num_linea, campos in leer_bloques_inventario_legado(ruta):
+                    try:
+                        disp, advertencias = _dispositivo_desde_bloque_legado(campos, dispositivos_lista)
+                    except ValueError as e:
+                        informe["errores"].append({"archivo": ruta, "linea": num_linea, "nombre": campos.get("nombre", ""), "error": str(e)})
+                        continue
+                    dispositivos_lista.agregar(disp)
+                    informe["importados"] += 1
+                    for aviso in advertencias:
+                        informe["advertencias"].append({"archivo": ruta, "linea": num_linea, "nombre": disp.get("NOMBRE"), "advertencia": aviso})
+            except IOError as e:
+                informe["errores"].append({"archivo": ruta, "linea": 0, "nombre": "", "error": str(e)})
+    return informe
+
+
+def importar_inventario_legado_interactivo(dispositivos_lista):
+    mostrar_titulo("📥 IMPORTAR INVENTARIO LEGADO (.txt)")
+
+    disponibles = [r for r in ARCHIVOS_INVENTARIO_LEGADO if os.path.exists(r)]
+    print(f"{Color.DARKCYAN}Archivos por defecto encontrados: {', '.join(disponibles) or 'Ninguno'}{Color.END}")
+    rutas_txt = input(f"{Color.GREEN}↳ Rutas a importar separadas por coma (Enter para usar las de por defecto, 0 para cancelar): {Color.END}").strip()
+    if rutas_txt == "0":
+        mostrar_mensaje("Importación cancelada.", "info"); pausa(1)
+        return NAV_VOLVER
+    rutas = [r.strip() for r in rutas_txt.split(",") if r.strip()] if rutas_txt else disponibles
+    if not rutas:
+        mostrar_mensaje("No hay archivos para importar.", "advertencia", esperar_enter=True)
+        return NAV_VOLVER
+
+    informe = importar_inventarios_legados(dispositivos_lista, rutas)
+    mostrar_mensaje(f"Dispositivos importados: {informe['importados']}", "exito")
+    if informe["advertencias"]:
+        print(f"{Color.YELLOW}{Color.BOLD}Advertencias ({len(informe['advertencias'])}):{Color.END}")
+        for aviso in informe["advertencias"][:20]:
+            print(f"  {aviso['archivo']}:{aviso['linea']} {aviso['nombre']} - {aviso['advertencia']}")
+    if informe["errores"]:
+        print(f"{Color.RED}{Color.BOLD}Registros rechazados ({len(informe['errores'])}):{Color.END}")
+        for error in informe["errores"][:20]:
+            print(f"  {error['archivo']}:{error['linea']} {error['nombre']} - {error['error']}")
+    if len(informe["errores"]) > 20 or len(informe["advertencias"]) > 20:
+        print(f"{Color.DARKCYAN}... use 'python CodigoPrueba.py import' para obtener el informe completo en JSON.{Color.END}")
+    input(f"\n{Color.GREEN}Presione Enter para volver al menú anterior...{Color.END}")
+    return NAV_VOLVER
+
+
+# ---------------- VALIDACIÓN MASIVA EN PARALELO ----------------
+# validar_inventario_masivo recibe registros crudos: dicts con TIPO, NOMBRE, IP, UBICACION,
+# SERVICIOS y VLANS como texto o listas, por ejemplo de un JSON, JSON Lines o CSV externo.
+# Los reparte en lotes entre procesos y devuelve los dispositivos normalizados más una lista
+# de errores por registro y campo. Cada campo pasa por los mismos validadores que el alta
+# por menú o por línea de comandos (validar_nombre, validar_ip, analizar_vlans y
+# _resolver_opcion), con las expresiones y tablas de búsqueda armadas una vez por proceso.
+# La unicidad de nombre e IP depende de todos los registros, así que se resuelve al final en
+# el proceso principal y en el orden de entrada.
+VALIDACION_TAMANO_LOTE = 2000 # Registros por lote enviado a cada proceso
+VALIDACION_MINIMO_PARALELO = 5000 # Con menos registros no compensa arrancar procesos
+
+def _texto_crudo(valor):
+    if type(valor) is str:
+        return valor
+    if valor is None:
+        return ""
+    if isinstance(valor, (list, tuple)):
+        return ",".join(map(str, valor))
+    return str(valor)
+
+def _normalizar_nombre(texto, advertencias):
+    validar_nombre(texto)
+    return texto.strip()
+
+def _normalizar_ip(texto, advertencias):
+    texto = texto.strip()
+    if texto and texto.upper() != "N/A":
+        validar_ip(texto)
+        return texto
+    return "N/A"
+
+# Tipo, ubicación, servicios y VLANs se repiten mucho entre registros: se recuerda el
+# resultado de cada texto ya visto (los errores no se guardan y se vuelven a calcular)
+@functools.lru_cache(maxsize=4096)
+def _opcion_normalizada(opciones, texto):
+    opciones_dict, nombre_campo = _OPCIONES_NORMALIZABLES[opciones]
+    return _resolver_opcion(opciones_dict, texto, nombre_campo)
+
+_OPCIONES_NORMALIZABLES = {"TIPO": (TIPOS_DISPOSITIVO, "Tipo"), "UBICACION": (CAPAS_RED, "Ubicación"), "SERVICIOS": (SERVICIOS_VALIDOS, "Servicio")}
+
+@functools.lru_cache(maxsize=4096)
+def _servicios_normalizados(texto):
+    return tuple(sorted({_opcion_normalizada("SERVICIOS", s_txt) for s_txt in texto.split(",") if s_txt.strip()}))
+
+@functools.lru_cache(maxsize=4096)
+def _vlans_normalizadas(texto):
+    vlans, repetidas = analizar_vlans(texto)
+    return tuple(vlans), tuple(repetidas)
+
+def _normalizar_servicios(texto, advertencias):
+    return list(_servicios_normalizados(texto)) # Lista propia de cada dispositivo
+
+def _normalizar_vlans(texto, advertencias):
+    vlans, repetidas = _vlans_normalizadas(texto)
+    for v_int in repetidas:
+        advertencias.append(("VLANS", f"VLAN '{v_int}' repetida; se omite el duplicado."))
+    return list(vlans)
+
+# Mismo orden que los argumentos de Dispositivo: (tipo, nombre, ip, ubicación, servicios, vlans)
+_NORMALIZADORES = (
+    ("TIPO", lambda texto, _: _opcion_normalizada("TIPO", texto)),
+    ("NOMBRE", _normalizar_nombre),
+    ("IP", _normalizar_ip),
+    ("UBICACION", lambda texto, _: _opcion_normalizada("UBICACION", texto) if texto.strip() else "N/A"),
+    ("SERVICIOS", _normalizar_servicios),
+    ("VLANS", _normalizar_vlans),
+)
+CAMPOS_REGISTRO = tuple(campo for campo, _ in _NORMALIZADORES)
+
+def _normalizar_valores(valores):
+    errores, advertencias, campos = [], [], []
+    for (campo, normalizar), valor in zip(_NORMALIZADORES, valores):
+        try:
+            campos.append(normalizar(_texto_crudo(valor), advertencias))
+        except ValueError as e:
+            errores.append((campo, str(e)))
+    return (None if errores else tuple(campos)), errores, advertencias
+
+def normalizar_registro(registro):
+    """Valida un registro crudo campo por campo.
+
+    Devuelve (campos, errores, advertencias): campos es la tupla (tipo, nombre, ip, ubicación,
+    servicios, vlans) lista para Dispositivo, o None si hubo errores; errores y advertencias
+    son listas de (CAMPO, mensaje).
+    """
+    return _normalizar_valores([registro.get(campo) for campo in CAMPOS_REGISTRO])
+
+def _validar_lote(lote):
+    """Se ejecuta en los procesos del pool: normaliza un lote de tuplas de valores crudos."""
+    return [_normalizar_valores(valores) for valores in lote]
+
+def _lotes(registros, tamano):
+    for inicio in range(0, len(registros), tamano):
+        yield registros[inicio:inicio + tamano]
+
+def _resultados_por_lote(registros, procesos, tamano_lote):
+    """Resultados de normalizar_registro en el orden de entrada, y cuántos procesos se usaron."""
+    if procesos > 1 and len(registros) >= VALIDACION_MINIMO_PARALELO:
+        from concurrent.futures import ProcessPoolExecutor # Solo se importa si se usa
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                return [r for lote in pool.map(_validar_lote, _lotes(registros, tamano_lote)) for r in lote], procesos
+        except (OSError, BrokenProcessPool) as e: # p. ej. sin permiso para crear procesos
+            mostrar_mensaje(f"No se pudo validar en paralelo ({e}); se valida en este proceso.", "advertencia")
+    return _validar_lote(registros), 1
+
+def _cpus_disponibles():
+    if hasattr(os, "sched_getaffinity"): # Respeta los límites de CPU del contenedor o de taskset
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def validar_inventario_masivo(registros, procesos=None, tamano_lote=VALIDACION_TAMANO_LOTE, existentes=None):
+    """Valida y normaliza registros crudos repartiéndolos entre varios procesos.
+
+    Devuelve {"dispositivos", "errores", "advertencias", "procesados", "procesos"}. Cada error
+    o advertencia indica el índice del registro (desde 0), su nombre, el campo y el mensaje.
+    Si se pasa un repositorio en 'existentes' también se rechazan nombres e IPs ya usados en él.
+    """
+    # A los procesos se envían tuplas de valores: pesan menos al serializarlas que los dicts, y los
+    # códigos internos de un Dispositivo no valen en otro proceso
+    registros = [tuple(r.get(campo) for campo in CAMPOS_REGISTRO) for r in registros]
+    resultados, procesos_usados = _resultados_por_lote(registros, max(1, procesos or _cpus_disponibles()), max(1, tamano_lote))
+    informe = {"dispositivos": [], "errores": [], "advertencias": [], "procesados": len(registros), "procesos": procesos_usados}
+    nombres, ips = set(), {} # Ya aceptados en esta validación: nombre en minúsculas / IP entera -> nombre
+    for indice, (campos, errores, advertencias) in enumerate(resultados):
+        nombre = campos[1] if campos else _texto_crudo(registros[indice][1])
+        if campos:
+            tipo, nombre, ip, ubicacion, servicios, vlans = campos
+            if nombre.lower() in nombres or (existentes is not None and existentes.nombre_en_uso(nombre)):
+                errores.append(("NOMBRE", f"El nombre '{nombre}' ya existe."))
+            if ip != "N/A":
+                otro = ips.get(ip_a_entero(ip))
+                if otro is None and existentes is not None:
+                    otro = (existentes.ip_en_uso(ip) or {}).get("NOMBRE")
+                if otro is not None:
+                    errores.append(("IP", f"La IP '{ip}' ya está asignada al dispositivo '{otro}'."))
+        for campo, mensaje in errores:
+            informe["errores"].append({"indice": indice, "nombre": nombre, "campo": campo, "error": mensaje})
+        for campo, mensaje in advertencias:
+            informe["advertencias"].append({"indice": indice, "nombre": nombre, "campo": campo, "advertencia": mensaje})
+        if not errores:
+            informe["dispositivos"].append(Dispositivo(tipo, nombre, ip, ubicacion, servicios, vlans))
+            nombres.add(nombre.lower())
+            if ip != "N/A":
+                ips[ip_a_entero(ip)] = nombre
+    return informe
+
+def leer_registros_crudos(ruta):
+    """Registros de un archivo JSON (lista de objetos), JSON Lines o CSV con encabezado; admite .gz."""
+    base = ruta[:-3] if ruta.endswith(".gz") else ruta
+    abrir = gzip.open if ruta.endswith(".gz") else open
+    with abrir(ruta, 'rt', encoding='utf-8', newline='') as f:
+        if base.endswith(".csv"):
+            return [{(clave or "").strip().upper(): valor for clave, valor in fila.items()} for fila in csv.DictReader(f)]
+        if base.endswith(".jsonl"):
+            return [json.loads(linea) for linea in f if linea.strip()]
+        datos = json.load(f)
+    if not isinstance(datos, list) or not all(isinstance(d, dict) for d in datos):
+        raise ValueError(f"'{ruta}' debe contener una lista de objetos JSON.")
+    return datos
+
+
+# ---------------- DIFERENCIAS Y RECONCILIACIÓN DE INVENTARIOS ----------------
+# diferencias_inventarios compara dos inventarios (instantánea JSON, JSON Lines, CSV, .txt
+# legado o el inventario actual) sin cargar ninguno completo en memoria:
+#   1. Recorre el inventario anterior y guarda por dispositivo solo dos hashes de 64 bits,
+#      el del nombre (clave) y el del contenido normalizado, en dos arrays ordenados por
+#      clave (16 bytes por dispositivo).
+#   2. Recorre el nuevo: si la clave no está, es un alta; si está con otro hash de
+#      contenido, es una modificación. Solo se guardan estos registros.
+#   3. Vuelve a recorrer el anterior para obtener los valores viejos de los modificados y
+#      de los que no aparecieron (bajas). Una baja y un alta con la misma IP se informan
+#      como un dispositivo renombrado.
+# El resultado es un parche: operaciones agregar/modificar/eliminar con el mismo formato que
+# el diario, más los valores anteriores para detectar conflictos. aplicar_parche lo aplica
+# con los métodos normales del repositorio (agregar, modificar, eliminar).
+ORIGEN_INVENTARIO_ACTUAL = "actual" # En la línea de comandos: el inventario cargado (instantánea + diario)
+
+def _iterar_arreglo_json(f, tamano_bloque=1 << 16):
+    """Entrega uno a uno los elementos de un arreglo JSON sin leer el archivo completo."""
+    decodificador = json.JSONDecoder()
+    texto, pos, abierto = "", 0, False
+    while True:
+        while pos < len(texto) and texto[pos] in " \t\r\n,":
+            pos += 1
+        if not abierto and pos < len(texto):
+            if texto[pos] != "[":
+                raise ValueError("Se esperaba un arreglo JSON.")
+            abierto, pos = True, pos + 1
+            continue
+        if pos < len(texto) and texto[pos] == "]":
+            return
+        try:
+            if pos >= len(texto):
+                raise ValueError
+            elemento, fin = decodificador.raw_decode(texto, pos)
+        except ValueError: # Elemento incompleto: leer más
+            bloque = f.read(tamano_bloque)
+            if not bloque:
+                if texto[pos:].strip():
+                    raise ValueError("Arreglo JSON incompleto.")
+                return
+            texto, pos = texto[pos:] + bloque, 0
+            continue
+        yield elemento
+        pos = fin
+
+def iterar_inventario(origen):
+    """Registros de un inventario: un repositorio (o lista) de dispositivos o la ruta de un
+    archivo JSON, JSON Lines, CSV (admiten .gz) o .txt legado. Los archivos se leen por partes."""
+    if not isinstance(origen, str):
+        yield from origen
+        return
+    if origen.endswith(".txt"):
+        vacio = RepositorioDispositivos() # Sin chequeo de duplicados: de eso se ocupa la comparación
+        for num_linea, campos in leer_bloques_inventario_legado(origen):
+            try:
+                yield _dispositivo_desde_bloque_legado(campos, vacio)[0]
+            except ValueError as e:
+                yield {"NOMBRE": campos.get("nombre", ""), "_error": f"línea {num_linea}: {e}"}
+        return
+    base = origen[:-3] if origen.endswith(".gz") else origen
+    abrir = gzip.open if origen.endswith(".gz") else open
+    with abrir(origen, 'rt', encoding='utf-8', newline='') as f:
+        if base.endswith(".csv"):
+            for fila in csv.DictReader(f):
+                yield {(clave or "").strip().upper(): valor for clave, valor in fila.items()}
+        elif base.endswith(".jsonl"):
+            for linea in f:
+                if linea.strip():
+                    yield json.loads(linea)
+        else:
+            yield from _iterar_arreglo_json(f)
+
+def _hash64(texto):
+    return int.from_bytes(hashlib.blake2b(texto.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _huella_dispositivo(campos):
+    """(hash del nombre, hash del contenido) de una tupla normalizada."""
+    tipo, nombre, ip, ubicacion, servicios, vlans = campos
+    contenido = "\x1f".join((tipo, nombre, ip, ubicacion, ",".join(servicios), ",".join(map(str, vlans))))
+    return _hash64(nombre.lower()), _hash64(contenido)
+
+def _normalizados(origen, invalidos, lado):
+    """(índice, campos normalizados) de cada registro válido; los inválidos se anotan y se saltean."""
+    for indice, registro in enumerate(iterar_inventario(origen)):
+        error = registro.get("_error") if isinstance(registro, dict) else None
+        campos, errores, _ = (None, [("", error)], None) if error else _normalizar_valores([registro.get(c) for c in CAMPOS_REGISTRO])
+        if campos is None:
+            invalidos.append({"inventario": lado, "indice": indice, "nombre": _texto_crudo(registro.get("NOMBRE")),
+                              "errores": [f"{campo}: {mensaje}" if campo else mensaje for campo, mensaje in errores]})
+            continue
+        yield indice, campos
+
+def _como_dict(campos):
+    return dict(zip(CAMPOS_REGISTRO, campos))
+
+def _cambios_entre(anterior, nuevo):
+    """({campo: valor nuevo}, {campo: valor anterior}) de los campos que difieren."""
+    cambios, antes = {}, {}
+    for campo, valor_anterior, valor_nuevo in zip(CAMPOS_REGISTRO, anterior, nuevo):
+        if valor_anterior != valor_nuevo:
+            cambios[campo], antes[campo] = valor_nuevo, valor_anterior
+    return cambios, antes
+
+def diferencias_inventarios(anterior, nuevo):
+    """Compara dos inventarios y devuelve el parche que lleva de 'anterior' a 'nuevo'.
+
+    'anterior' se recorre dos veces, así que debe ser una ruta o un repositorio/lista (no un
+    generador). Devuelve {"operaciones": [...], "resumen": {...}, "invalidos": [...], "repetidos": [...]}.
+    """
+    invalidos, repetidos = [], []
+    # 1. Huellas del inventario anterior, ordenadas por hash del nombre
+    huellas = sorted(_huella_dispositivo(campos) for _, campos in _normalizados(anterior, invalidos, "anterior"))
+    claves = array("Q", (clave for clave, _ in huellas))
+    contenidos = array("Q", (contenido for _, contenido in huellas))
+    del huellas
+    vistos = bytearray(len(claves))
+    # 2. Recorrido del inventario nuevo
+    modificados, agregados, sin_cambios = {}, [], 0 # posición en claves -> campos nuevos
+    for _, campos in _normalizados(nuevo, invalidos, "nuevo"):
+        clave, contenido = _huella_dispositivo(campos)
+        pos = bisect.bisect_left(claves, clave)
+        if pos == len(claves) or claves[pos] != clave:
+            agregados.append(campos)
+            continue
+        while pos + 1 < len(claves) and claves[pos + 1] == clave and vistos[pos]: # Nombre repetido en el anterior
+            pos += 1
+        if vistos[pos]:
+            repetidos.append({"inventario": "nuevo", "nombre": campos[1]})
+            continue
+        vistos[pos] = 1
+        if contenidos[pos] == contenido:
+            sin_cambios += 1
+        else:
+            modificados[pos] = campos
+    # 3. Valores anteriores de los modificados y de las bajas
+    operaciones, eliminados, usados = [], [], bytearray(len(claves))
+    for _, campos in _normalizados(anterior, [], "anterior"): # Los inválidos ya se anotaron en el paso 1
+        clave, contenido = _huella_dispositivo(campos)
+        pos = bisect.bisect_left(claves, clave)
+        if pos + 1 < len(claves) and claves[pos + 1] == clave: # Nombre repetido en el anterior
+            repetidos.append({"inventario": "anterior", "nombre": campos[1]})
+        # Entre nombres repetidos, la posición con este mismo contenido
+        while pos + 1 < len(claves) and claves[pos + 1] == clave and (usados[pos] or contenidos[pos] != contenido):
+            pos += 1
+        usados[pos] = 1
+        if not vistos[pos]:
+            eliminados.append(campos)
+        elif pos in modificados:
+            cambios, antes = _cambios_entre(campos, modificados.pop(pos))
+            operaciones.append({"op": "modificar", "nombre": campos[1], "cambios": cambios, "antes": antes})
+    # Una baja y un alta con la misma IP son el mismo equipo con otro nombre
+    altas_por_ip = {campos[2]: i for i, campos in enumerate(agregados) if campos[2] != "N/A"}
+    renombrados = 0
+    for campos in eliminados:
+        i = altas_por_ip.pop(campos[2], None) if campos[2] != "N/A" else None
+        if i is None:
+            operaciones.append({"op": "eliminar", "nombre": campos[1], "dispositivo": _como_dict(campos)})
+            continue
+        cambios, antes = _cambios_entre(campos, agregados[i])
+        operaciones.append({"op": "modificar", "nombre": campos[1], "cambios": cambios, "antes": antes})
+        agregados[i], renombrados = None, renombrados + 1
+    operaciones.extend({"op": "agregar", "dispositivo": _como_dict(campos)} for campos in agregados if campos is not None)
+    # Orden de aplicación: bajas, modificaciones y altas (libera nombres e IPs antes de reusarlos)
+    orden = {"eliminar": 0, "modificar": 1, "agregar": 2}
+    operaciones.sort(key=lambda op: orden[op["op"]])
+    resumen = {tipo_op: sum(1 for op in operaciones if op["op"] == tipo_op) for tipo_op in orden}
+    resumen.update(renombrados=renombrados, sin_cambios=sin_cambios, anterior=len(claves))
+    return {"operaciones": operaciones, "resumen": resumen, "invalidos": invalidos, "repetidos": repetidos}
+
+def escribir_parche(operaciones, ruta):
+    """Guarda el parche en JSON Lines (una operación por línea)."""
+    with open(ruta, 'w', encoding='utf-8') as f:
+        for operacion in operaciones:
+            f.write(json.dumps(operacion, ensure_ascii=False) + "\n")
+    return len(operaciones)
+
+def leer_parche(ruta):
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+_NORMALIZADOR_POR_CAMPO = dict(_NORMALIZADORES)
+
+def _valor_comparable(campo, valor):
+    """Valor normalizado como en el diff (p. ej. servicios ordenados como texto); si no se puede
+    normalizar (dato viejo no válido) se compara tal cual."""
+    normalizar = _NORMALIZADOR_POR_CAMPO.get(campo)
+    if normalizar is None:
+        return valor
+    try:
+        return normalizar(_texto_crudo(valor), [])
+    except ValueError:
+        return valor
+
+def _coincide(disp, valores):
+    return all(_valor_comparable(campo, disp.get(campo)) == _valor_comparable(campo, valor) for campo, valor in valores.items())
+
+def _liberados_por_parche(operaciones):
+    """{(campo, nombre)} de los dispositivos que el propio parche borra o a los que les cambia
+    NOMBRE o IP: lo que ocupan hoy queda libre durante la aplicación (p. ej. un intercambio de IPs)."""
+    liberados = set()
+    for operacion in operaciones:
+        if operacion.get("op") == "eliminar":
+            nombre = str(operacion.get("nombre") or "").lower()
+            liberados.update({("NOMBRE", nombre), ("IP", nombre)})
+        elif operacion.get("op") == "modificar":
+            nombre = str(operacion.get("nombre") or "").lower()
+            liberados.update((campo, nombre) for campo in ("NOMBRE", "IP") if campo in (operacion.get("cambios") or {}))
+    return liberados
+
+def _ocupado_por_otro(dispositivos_lista, disp, cambios, liberados):
+    """Motivo del conflicto si el nuevo NOMBRE o IP ya lo usa otro dispositivo que el parche no libera, o None."""
+    if "NOMBRE" in cambios and dispositivos_lista.nombre_en_uso(cambios["NOMBRE"], excluir=disp):
+        otro = dispositivos_lista.obtener_por_nombre(cambios["NOMBRE"])
+        if ("NOMBRE", str(otro.get("NOMBRE")).lower()) not in liberados:
+            return f"ya existe un dispositivo con el nombre '{otro.get('NOMBRE')}'"
+    if cambios.get("IP", "N/A") != "N/A":
+        otro = dispositivos_lista.ip_en_uso(cambios["IP"], excluir=disp)
+        if otro is not None and ("IP", str(otro.get("NOMBRE")).lower()) not in liberados:
+            return f"la IP ya está asignada a '{otro.get('NOMBRE')}'"
+    return None
+
+def aplicar_parche(dispositivos_lista, operaciones, forzar=False, simular=False):
+    """Aplica un parche con agregar/modificar/eliminar del repositorio.
+
+    Una operación ya aplicada se cuenta y se saltea. Si el dispositivo no está como el parche
+    espera (otro valor anterior, nombre ocupado, dispositivo inexistente) es un conflicto y no
+    se aplica, salvo con forzar=True cuando es posible. Con simular=True no se cambia nada.
+    """
+    informe = {"aplicadas": 0, "ya_aplicadas": 0, "conflictos": []}
+
+    def conflicto(indice, operacion, motivo):
+        informe["conflictos"].append({"indice": indice, "op": operacion.get("op"),
+                                      "nombre": operacion.get("nombre") or operacion.get("dispositivo", {}).get("NOMBRE"), "motivo": motivo})
+
+    liberados = _liberados_por_parche(operaciones)
+    contexto = dispositivos_lista.operacion_masiva() if not simular else contextlib.nullcontext()
+    with contexto:
+        for indice, operacion in enumerate(operaciones):
+            tipo_op = operacion.get("op")
+            if tipo_op == "agregar":
+                datos = operacion.get("dispositivo") or {}
+                existente = dispositivos_lista.obtener_por_nombre(datos.get("NOMBRE"))
+                if existente is not None:
+                    if _coincide(existente, datos):
+                        informe["ya_aplicadas"] += 1
+                    else:
+                        conflicto(indice, operacion, "ya existe un dispositivo con ese nombre")
+                    continue
+                otro = dispositivos_lista.ip_en_uso(datos.get("IP")) if datos.get("IP", "N/A") != "N/A" else None
+                if otro is not None and not forzar:
+                    conflicto(indice, operacion, f"la IP ya está asignada a '{otro.get('NOMBRE')}'")
+                    continue
+                if not simular:
+                    dispositivos_lista.agregar(Dispositivo.desde_dict(datos))
+            elif tipo_op == "modificar":
+                cambios = operacion.get("cambios") or {}
+                disp = dispositivos_lista.obtener_por_nombre(operacion.get("nombre"))
+                if disp is None:
+                    renombrado = dispositivos_lista.obtener_por_nombre(cambios.get("NOMBRE"))
+                    if renombrado is not None and _coincide(renombrado, cambios):
+                        informe["ya_aplicadas"] += 1
+                    else:
+                        conflicto(indice, operacion, "el dispositivo no existe")
+                    continue
+                if _coincide(disp, cambios):
+                    informe["ya_aplicadas"] += 1
+                    continue
+                if not forzar and not _coincide(disp, operacion.get("antes") or {}):
+                    conflicto(indice, operacion, "el dispositivo cambió desde que se generó el parche")
+                    continue
+                if not forzar:
+                    ocupado = _ocupado_por_otro(dispositivos_lista, disp, cambios, liberados)
+                    if ocupado is not None:
+                        conflicto(indice, operacion, ocupado)
+                        continue
+                if not simular:
+                    dispositivos_lista.modificar(disp, cambios)
+            elif tipo_op == "eliminar":
+                disp = dispositivos_lista.obtener_por_nombre(operacion.get("nombre"))
+                if disp is None:
+                    informe["ya_aplicadas"] += 1
+                    continue
+                if not forzar and not _coincide(disp, operacion.get("dispositivo") or {}):
+                    conflicto(indice, operacion, "el dispositivo cambió desde que se generó el parche")
+                    continue
+                if not simular:
+                    dispositivos_lista.eliminar(disp)
+            else:
+                conflicto(indice, operacion, f"operación desconocida '{tipo_op}'")
+                continue
+            informe["aplicadas"] += 1
+    return informe
+
+
+# ---------------- API HTTP/JSON LOCAL ----------------
+# Servidor HTTP embebido para que otras herramientas lean y modifiquen el inventario sin los
+# menús ni el reporte de texto. Usa http.server con un hilo por conexión y HTTP/1.1 con
+# keep-alive. Trabaja sobre el repositorio en memoria con sus índices; antes de cada pedido
+# aplica lo que guardaron otras sesiones. Se inicia con: python CodigoPrueba.py serve
+#   GET    /dispositivos            ?q=<consulta> &tipo= &ubicacion= &servicio= &vlan= &ip= &nombre= &pagina= &por_pagina=
+#   POST   /dispositivos            {"nombre", "tipo", "ip", "ubicacion", "servicios": [...], "vlans": [...]}
+#   GET    /dispositivos/<nombre>
+#   PATCH  /dispositivos/<nombre>   campos a cambiar (If-Match opcional)
+#   DELETE /dispositivos/<nombre>   (If-Match opcional)
+#   GET    /estadisticas            contadores del reporte estadístico
+#   POST   /ping                    {"nombres": [...]} o filtros como en el listado; "motor": "ping" | "interno"
+# La ETag de un dispositivo es su VERSION ("v3"). Con If-Match se evita pisar cambios ajenos
+# (412 si ya cambió). La de un listado o de las estadísticas cambia con cualquier alta, baja o
+# modificación del inventario; con If-None-Match se responde 304 sin armar el cuerpo.
+API_HOST_POR_DEFECTO = "127.0.0.1"
+API_PUERTO_POR_DEFECTO = 8080
+API_POR_PAGINA = 100
+API_MAX_POR_PAGINA = 1000
+API_MAX_CUERPO = 1 << 20 # Bytes
+API_MAX_PING = 256 # Hosts por pedido de ping
+API_RESULTADOS_EN_CACHE = 32 # Consultas cuyo resultado ordenado se reutiliza mientras el inventario no cambie
+API_CAMPOS_DISPOSITIVO = ("nombre", "ip", "tipo", "ubicacion", "servicios", "vlans")
+API_CAMPOS_FILTRO = ("tipo", "ubicacion", "servicio", "vlan", "ip", "nombre")
+
+class ErrorAPI(Exception):
+    """Error de un pedido a la API, con el código de estado HTTP a responder."""
+
+    def __init__(self, estado, mensaje, cabeceras=None):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.cabeceras = cabeceras or {}
+
+def _entero_parametro(parametros, nombre, defecto, minimo, maximo):
+    valor = parametros.get(nombre)
+    if valor is None:
+        return defecto
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        raise ErrorAPI(400, f"'{nombre}' debe ser un número entero.")
+    if not minimo <= valor <= maximo:
+        raise ErrorAPI(400, f"'{nombre}' debe estar entre {minimo} y {maximo}.")
+    return valor
+
+def _texto_consulta_api(parametros):
+    """Une 'q' y los filtros sueltos (tipo=, vlan=, ...) en un texto para analizar_consulta."""
+    partes = [str(parametros["q"])] if parametros.get("q") else []
+    for campo in API_CAMPOS_FILTRO:
+        valor = parametros.get(campo)
+        if valor not in (None, ""):
+            partes.append(f"{campo}:{shlex.quote(str(valor))}")
+    return " ".join(partes)
+
+def _argumentos_desde_json(cuerpo):
+    """(Namespace como el de la línea de comandos, VERSION indicada en el cuerpo o None).
+
+    Las listas se pasan a texto separado por comas para validarlas igual que en add/modify.
+    """
+    valores = dict.fromkeys(API_CAMPOS_DISPOSITIVO)
+    version = None
+    for clave, valor in (cuerpo or {}).items():
+        campo = str(clave).lower() # Acepta también el dispositivo tal como lo devuelve GET (NOMBRE, IP, ...)
+        if campo == "version":
+            if isinstance(valor, bool) or not isinstance(valor, int):
+                raise ErrorAPI(400, "'version' debe ser un número entero.")
+            version = valor
+        elif campo not in valores:
+            raise ErrorAPI(400, f"Campo '{clave}' no reconocido. Campos: {', '.join(API_CAMPOS_DISPOSITIVO)}.")
+        elif isinstance(valor, list):
+            valores[campo] = ",".join(str(v) for v in valor)
+        elif valor is not None:
+            valores[campo] = str(valor)
+    return argparse.Namespace(**valores), version
+
+def _sin_debil(etiqueta):
+    etiqueta = etiqueta.strip()
+    return etiqueta[2:] if etiqueta.startswith("W/") else etiqueta
+
+def _etiqueta_coincide(cabecera, etiqueta):
+    """Comparación débil de If-None-Match: '*' o alguna de las etiquetas indicadas."""
+    if cabecera is None:
+        return False
+    valores = {_sin_debil(e) for e in cabecera.split(",")}
+    return "*" in valores or _sin_debil(etiqueta) in valores
+
+def _etiqueta_dispositivo(disp):
+    return f'"v{disp.get("VERSION", 0)}"'
+
+def _version_if_match(cabecera):
+    """VERSION pedida en If-Match ('"v3"'); None si no se indicó o es '*'."""
+    if cabecera is None or cabecera.strip() == "*":
+        return None
+    coincidencia = re.fullmatch(r'"v(\d+)"', _sin_debil(cabecera))
+    if coincidencia is None:
+        raise ErrorAPI(412, "If-Match no corresponde a ninguna versión (use la ETag de GET /dispositivos/<nombre>).")
+    return int(coincidencia.group(1))
+
+
+class APIInventario:
+    """Resuelve los pedidos de la API sobre un RepositorioDispositivos, sin saber nada de sockets.
+
+    Los índices del repositorio no admiten hilos concurrentes, así que un cerrojo serializa el
+    acceso; los pings se hacen fuera de él. Los resultados ordenados de las consultas y las
+    estadísticas se reutilizan mientras no cambie la generación del inventario.
+    """
+
+    def __init__(self, repositorio):
+        self.repositorio = repositorio
+        self.cerrojo = threading.Lock()
+        self.arranque = format(time.time_ns(), "x") # Las ETag de otra ejecución del servidor no coinciden
+        self._cache = {}
+        self._generacion_cache = None
+
+    @contextlib.contextmanager
+    def _repositorio(self):
+        with self.cerrojo:
+            self.repositorio.sincronizar()
+            if self._generacion_cache != self.repositorio.generacion:
+                self._cache.clear()
+                self._generacion_cache = self.repositorio.generacion
+            yield self.repositorio
+
+    def _en_cache(self, clave, calcular):
+        if clave not in self._cache:
+            if len(self._cache) >= API_RESULTADOS_EN_CACHE:
+                del self._cache[next(iter(self._cache))] # El más antiguo
+            self._cache[clave] = calcular()
+        return self._cache[clave]
+
+    def _etiqueta_inventario(self):
+        return f'W/"{self.arranque}-{self.repositorio.generacion}"'
+
+    def atender(self, metodo, ruta, parametros, cuerpo, cabeceras):
+        """(estado HTTP, documento JSON o None, cabeceras extra) del pedido. Lanza ErrorAPI o ValueError."""
+        partes = [unquote(p) for p in ruta.strip("/").split("/")]
+        if partes[0] == "dispositivos" and len(partes) == 1:
+            manejadores = {"GET": self._listar, "POST": self._agregar}
+        elif partes[0] == "dispositivos" and len(partes) == 2:
+            manejadores = {"GET": self._obtener, "PATCH": self._modificar, "DELETE": self._eliminar}
+        elif partes == ["estadisticas"]:
+            manejadores = {"GET": self._estadisticas}
+        elif partes == ["ping"]:
+            manejadores = {"POST": self._ping}
+        else:
+            raise ErrorAPI(404, f"Ruta '{ruta}' no encontrada.")
+        manejador = manejadores.get(metodo)
+        if manejador is None:
+            raise ErrorAPI(405, f"Método {metodo} no permitido en '{ruta}'.", {"Allow": ", ".join(manejadores)})
+        return manejador(partes[1] if len(partes) == 2 else None, parametros, cuerpo, cabeceras)
+
+    def _buscar(self, repo, nombre):
+        disp = repo.obtener_por_nombre(nombre)
+        if disp is None:
+            raise ErrorAPI(404, f"No existe un dispositivo llamado '{nombre}'.")
+        return disp
+
+    def _listar(self, nombre, parametros, cuerpo, cabeceras):
+        pagina = _entero_parametro(parametros, "pagina", 1, 1, 10 ** 9)
+        por_pagina = _entero_parametro(parametros, "por_pagina", API_POR_PAGINA, 1, API_MAX_POR_PAGINA)
+        texto = _texto_consulta_api(parametros)
+        with self._repositorio() as repo:
+            etiqueta = self._etiqueta_inventario()
+            if _etiqueta_coincide(cabeceras.get("If-None-Match"), etiqueta):
+                return 304, None, {"ETag": etiqueta}
+            encontrados = self._en_cache(("consulta", texto), lambda: repo.consultar(analizar_consulta(texto)))
+            inicio = (pagina - 1) * por_pagina
+            datos = {"total": len(encontrados), "pagina": pagina, "por_pagina": por_pagina,
+                     "paginas": max(1, math.ceil(len(encontrados) / por_pagina)),
+                     "dispositivos": [_dispositivo_para_json(d) for d in encontrados[inicio:inicio + por_pagina]]}
+        return 200, datos, {"ETag": etiqueta}
+
+    def _obtener(self, nombre, parametros, cuerpo, cabeceras):
+        with self._repositorio() as repo:
+            disp = self._buscar(repo, nombre)
+            etiqueta = _etiqueta_dispositivo(disp)
+            if _etiqueta_coincide(cabeceras.get("If-None-Match"), etiqueta):
+                return 304, None, {"ETag": etiqueta}
+            return 200, {"dispositivo": _dispositivo_para_json(disp)}, {"ETag": etiqueta}
+
+    def _agregar(self, nombre, parametros, cuerpo, cabeceras):
+        args, _ = _argumentos_desde_json(cuerpo)
+        if args.nombre is None or args.tipo is None:
+            raise ErrorAPI(400, "Para agregar se requieren 'nombre' y 'tipo'.")
+        with self._repositorio() as repo:
+            datos = _cambios_desde_argumentos(args, repo)
+            nuevo_disp = crear_dispositivo(datos["TIPO"], datos["NOMBRE"], datos.get("IP"), datos.get("UBICACION"), datos.get("SERVICIOS"), datos.get("VLANS"))
+            if not nuevo_disp:
+                raise ValueError("Datos del dispositivo inválidos.")
+            repo.agregar(nuevo_disp)
+            return 201, {"dispositivo": _dispositivo_para_json(nuevo_disp)}, {
+                "ETag": _etiqueta_dispositivo(nuevo_disp), "Location": "/dispositivos/" + quote(nuevo_disp.get("NOMBRE"), safe="")}
+
+    def _modificar(self, nombre, parametros, cuerpo, cabeceras):
+        args, version = _argumentos_desde_json(cuerpo)
+        pedida = _version_if_match(cabeceras.get("If-Match"))
+        version = pedida if pedida is not None else version
+        with self._repositorio() as repo:
+            disp = self._buscar(repo, nombre)
+            cambios = _cambios_desde_argumentos(args, repo, dispositivo_actual=disp)
+            if not cambios:
+                raise ErrorAPI(400, "No se indicó ningún campo a modificar.")
+            try:
+                repo.modificar(disp, cambios, version=version)
+            except ConflictoVersion as e:
+                cambio_version = version is not None and disp.get("VERSION", 0) != version
+                raise ErrorAPI(412 if cambio_version else 409, str(e), {"ETag": _etiqueta_dispositivo(disp)})
+            return 200, {"dispositivo": _dispositivo_para_json(disp), "campos_modificados": sorted(cambios)}, {
+                "ETag": _etiqueta_dispositivo(disp)}
+
+    def _eliminar(self, nombre, parametros, cuerpo, cabeceras):
+        version = _version_if_match(cabeceras.get("If-Match"))
+        with self._repositorio() as repo:
+            disp = self._buscar(repo, nombre)
+            try:
+                eliminado = repo.eliminar(disp, version=version)
+            except ConflictoVersion as e:
+                raise ErrorAPI(412, str(e), {"ETag": _etiqueta_dispositivo(disp)})
+            if not eliminado:
+                raise ErrorAPI(404, f"Otro usuario ya eliminó '{nombre}'.")
+            return 200, {"eliminado": _dispositivo_para_json(disp)}, {}
+
+    def _estadisticas(self, nombre, parametros, cuerpo, cabeceras):
+        with self._repositorio() as repo:
+            etiqueta = self._etiqueta_inventario()
+            if _etiqueta_coincide(cabeceras.get("If-None-Match"), etiqueta):
+                return 304, None, {"ETag": etiqueta}
+            estadisticas = self._en_cache("estadisticas", lambda: _estadisticas_para_json(repo))
+        return 200, {"estadisticas": estadisticas}, {"ETag": etiqueta}
+
+    def _ping(self, nombre, parametros, cuerpo, cabeceras):
+        parametros = cuerpo or {}
+        motor = parametros.get("motor", "ping")
+        if motor not in ("ping", "interno"):
+            raise ErrorAPI(400, "'motor' debe ser 'ping' o 'interno'.")
+        concurrencia = _entero_parametro(parametros, "concurrencia", PING_CONCURRENCIA_POR_DEFECTO, 1, API_MAX_PING)
+        timeout = _entero_parametro(parametros, "timeout", PING_TIMEOUT_POR_DEFECTO, 1, 30)
+        nombres = parametros.get("nombres")
+        if nombres is not None and not isinstance(nombres, list):
+            raise ErrorAPI(400, "'nombres' debe ser una lista.")
+        with self._repositorio() as repo:
+            if nombres is not None:
+                objetivos = [self._buscar(repo, str(n)) for n in nombres]
+            else:
+                objetivos = repo.consultar(analizar_consulta(_texto_consulta_api(parametros)))
+            # Copias: el barrido corre sin el cerrojo mientras otros pedidos modifican el inventario
+            objetivos = [dict(d) for d in objetivos if d.get("IP") and d.get("IP") != "N/A"]
+        if len(objetivos) > API_MAX_PING:
+            raise ErrorAPI(400, f"Se pidieron {len(objetivos)} hosts; el máximo por pedido es {API_MAX_PING}.")
+        inicio = time.perf_counter()
+        if motor == "interno":
+            resultados = barrido_sondeo(objetivos, concurrencia, timeout)
+        else:
+            resultados = barrido_ping(objetivos, concurrencia, timeout)
+        resumen = {estado: sum(1 for r in resultados if r["ESTADO"] == estado) for estado in ESTADOS_PING}
+        return 200, {"resumen": resumen, "segundos": round(time.perf_counter() - inicio, 3),
+                     "resultados": sorted(resultados, key=lambda r: r["NOMBRE"] or "")}, {}
+
+
+class ManejadorAPI(BaseHTTPRequestHandler):
+    """Traduce cada pedido HTTP a APIInventario.atender y responde JSON con Content-Length,
+    para que la conexión pueda reutilizarse (keep-alive)."""
+    protocol_version = "HTTP/1.1"
+    server_version = "GestionRedAPI/1.0"
+    disable_nagle_algorithm = True # Respuestas chicas: se envían sin esperar a juntar más datos
+    timeout = 30 # Segundos que se espera el siguiente pedido de una conexión inactiva
+
+    def do_GET(self): self._atender("GET")
+    def do_POST(self): self._atender("POST")
+    def do_PATCH(self): self._atender("PATCH")
+    def do_DELETE(self): self._atender("DELETE")
+    def do_PUT(self): self._atender("PUT") # Sin rutas: responde 405 con los métodos permitidos
+
+    def _leer_cuerpo(self):
+        if self.headers.get("Transfer-Encoding"):
+            self.close_connection = True
+            raise ErrorAPI(411, "Se requiere Content-Length (no se admite Transfer-Encoding).")
+        try:
+            largo = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self.close_connection = True
+            raise ErrorAPI(400, "Content-Length no válido.")
+        if largo > API_MAX_CUERPO:
+            self.close_connection = True # El cuerpo queda sin leer: la conexión no puede reutilizarse
+            raise ErrorAPI(413, f"El cuerpo supera los {API_MAX_CUERPO} bytes.")
+        if largo <= 0:
+            return None
+        cuerpo = json.loads(self.rfile.read(largo))
+        if not isinstance(cuerpo, dict):
+            raise ErrorAPI(400, "El cuerpo debe ser un objeto JSON.")
+        return cuerpo
+
+    def _atender(self, metodo):
+        try:
+            partes = urlsplit(self.path)
+            parametros = {clave: valores[-1] for clave, valores in parse_qs(partes.query).items()}
+            cuerpo = self._leer_cuerpo() if metodo in ("POST", "PATCH") else None
+            estado, datos, cabeceras = self.server.api.atender(metodo, partes.path, parametros, cuerpo, self.headers)
+            if datos is not None:
+                datos = {"ok": True, **datos}
+        except ErrorAPI as e:
+            estado, datos, cabeceras = e.estado, {"ok": False, "error": str(e)}, e.cabeceras
+        except ConflictoVersion as e:
+            estado, datos, cabeceras = 409, {"ok": False, "error": str(e)}, {}
+        except ValueError as e: # Validaciones del inventario y JSON mal formado
+            estado, datos, cabeceras = 400, {"ok": False, "error": str(e)}, {}
+        except (IOError, sqlite3.Error) as e:
+            estado, datos, cabeceras = 500, {"ok": False, "error": str(e)}, {}
+        self._responder(estado, datos, cabeceras)
+
+    def _responder(self, estado, datos, cabeceras):
+        self.send_response(estado)
+        cuerpo = b""
+        if estado != 304:
+            cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in cabeceras.items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        if self.server.registrar:
+            super().log_message(formato, *args)
+
+
+class ServidorAPI(ThreadingHTTPServer):
+    """Servidor HTTP de la API: un hilo por conexión sobre un único APIInventario."""
+    daemon_threads = True
+    request_queue_size = 128 # Conexiones pendientes de aceptar cuando llegan muchos clientes a la vez
+
+    def __init__(self, api, host=API_HOST_POR_DEFECTO, puerto=API_PUERTO_POR_DEFECTO, registrar=False):
+        super().__init__((host, puerto), ManejadorAPI)
+        self.api = api
+        self.registrar = registrar # Una línea por pedido en la salida de error
+
+    @property
+    def direccion(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+
+# ---------------- INTERFAZ DE LÍNEA DE COMANDOS (BATCH) ----------------
+# Permite usar el sistema desde scripts y cron sin menús, pausas ni inicio de sesión:
+#   python CodigoPrueba.py list --tipo switch
+#   python CodigoPrueba.py add --tipo router --nombre R-Core --ip 10.0.0.1 --servicios DHCP,VPN
+# Cada subcomando imprime un único documento JSON por la salida estándar; los mensajes
+# informativos de las funciones reutilizadas se desvían a la salida de error.
+
+def _cambios_desde_argumentos(args, dispositivos_lista, dispositivo_actual=None):
+    """Valida los campos indicados en la línea de comandos y devuelve el dict de cambios."""
+    cambios = {}
+    if args.nombre is not None:
+        validar_nombre(args.nombre)
+        if dispositivos_lista.nombre_en_uso(args.nombre, excluir=dispositivo_actual):
+            raise ValueError(f"El nombre '{args.nombre}' ya existe.")
+        cambios["NOMBRE"] = args.nombre.strip()
+    if args.ip is not None:
+        ip = args.ip.strip()
+        if ip and ip.upper() != "N/A":
+            validar_ip(ip)
+            disp = dispositivos_lista.ip_en_uso(ip, excluir=dispositivo_actual)
+            if disp is not None:
+                raise ValueError(f"La IP '{ip}' ya está asignada al dispositivo '{disp.get('NOMBRE')}'.")
+            cambios["IP"] = ip
+        else:
+            cambios["IP"] = "N/A"
+    if args.tipo is not None:
+        cambios["TIPO"] = _resolver_opcion(TIPOS_DISPOSITIVO, args.tipo, "Tipo")
+    if args.ubicacion is not None:
+        cambios["UBICACION"] = _resolver_opcion(CAPAS_RED, args.ubicacion, "Ubicación")
+    if args.servicios is not None:
+        servicios = [_resolver_opcion(SERVICIOS_VALIDOS, s_txt, "Servicio") for s_txt in args.servicios.split(',') if s_txt.strip()]
+        cambios["SERVICIOS"] = sorted(set(servicios))
+    if args.vlans is not None:
+        cambios["VLANS"] = validar_vlans_input(args.vlans)
+    return cambios
+
+
+def _dispositivo_para_json(disp):
+    return dict(disp)
+
+
+def avisar_vlans_descartadas(dispositivos_lista):
+    """Advierte de las VLANs no válidas que se omitieron al cargar el inventario (ver Dispositivo.vlans_descartadas)."""
+    for disp in dispositivos_lista:
+        for vlan in getattr(disp, "vlans_descartadas", ()):
+            mostrar_mensaje(f"VLAN '{vlan}' no válida (1-4094) en '{disp.get('NOMBRE')}'. Se omitió al cargar.", "advertencia")
+
+def _cargar_repositorio_cli(almacenamiento, carga_completa=False, instantanea=False):
+    """Con SQLite las consultas se resuelven en la base; con JSON (o si se pide) se carga todo.
+
+    Los comandos de solo consulta (instantanea=True) usan la instantánea binaria si está al día.
+    """
+    if instantanea and not carga_completa:
+        vigente = InstantaneaMmap.abrir_si_vigente(almacenamiento)
+        if vigente is not None:
+            return vigente
+    if isinstance(almacenamiento, AlmacenamientoSQLite) and not carga_completa:
+        return RepositorioSQLite(almacenamiento)
+    repositorio = RepositorioDispositivos(almacenamiento.cargar(), almacenamiento)
+    avisar_vlans_descartadas(repositorio)
+    return repositorio
+
+
+def _filtros_desde_argumentos(args):
+    return {
+        "tipo": _resolver_opcion(TIPOS_DISPOSITIVO, args.tipo, "Tipo"),
+        "ubicacion": _resolver_opcion(CAPAS_RED, args.ubicacion, "Ubicación"),
+        "servicio": _resolver_opcion(SERVICIOS_VALIDOS, args.servicio, "Servicio"),
+        "vlan": args.vlan,
+    }
+
+
+def _cli_list(args, dispositivos):
+    encontrados = dispositivos.filtrar(**_filtros_desde_argumentos(args))
+    return {"total": len(encontrados), "dispositivos": [_dispositivo_para_json(d) for d in encontrados]}
+
+def _cli_search(args, dispositivos):
+    encontrados = dispositivos.consultar(analizar_consulta(args.texto))
+    return {"total": len(encontrados), "dispositivos": [_dispositivo_para_json(d) for d in encontrados]}
+
+def _cli_add(args, dispositivos):
+    if args.nombre is None or args.tipo is None:
+        raise ValueError("Para agregar se requieren --nombre y --tipo.")
+    datos = _cambios_desde_argumentos(args, dispositivos)
+    nuevo_disp = crear_dispositivo(datos["TIPO"], datos["NOMBRE"], datos.get("IP"), datos.get("UBICACION"), datos.get("SERVICIOS"), datos.get("VLANS"))
+    if not nuevo_disp:
+        raise ValueError("Datos del dispositivo inválidos.")
+    dispositivos.agregar(nuevo_disp)
+    return {"dispositivo": _dispositivo_para_json(nuevo_disp)}
+
+def _cli_modify(args, dispositivos):
+    disp = dispositivos.obtener_por_nombre(args.objetivo)
+    if disp is None:
+        raise ValueError(f"No existe un dispositivo llamado '{args.objetivo}'.")
+    cambios = _cambios_desde_argumentos(args, dispositivos, dispositivo_actual=disp)
+    if not cambios:
+        raise ValueError("No se indicó ningún campo a modificar.")
+    dispositivos.modificar(disp, cambios, version=args.version_esperada)
+    return {"dispositivo": _dispositivo_para_json(disp), "campos_modificados": sorted(cambios)}
+
+def _cli_delete(args, dispositivos):
+    disp = dispositivos.obtener_por_nombre(args.objetivo)
+    if disp is None:
+        raise ValueError(f"No existe un dispositivo llamado '{args.objetivo}'.")
+    dispositivos.eliminar(disp, version=args.version_esperada)
+    return {"eliminado": _dispositivo_para_json(disp)}
+
+def _estadisticas_para_json(dispositivos):
+    """Contadores del reporte estadístico y los dispositivos por servicio y por VLAN, listos para JSON."""
+    estadisticas = dispositivos.estadisticas.como_dict()
+    # Las claves JSON deben ser texto; las VLAN se exponen como "10", "20", ...
+    estadisticas["por_vlan"] = {str(vlan): cant for vlan, cant in sorted(estadisticas["por_vlan"].items())}
+    estadisticas["dispositivos_por_servicio"] = {serv: sorted(d.get("NOMBRE") for d in dispositivos.dispositivos_por("SERVICIOS", serv)) for serv in sorted(estadisticas["por_servicio"])}
+    estadisticas["dispositivos_por_vlan"] = {str(vlan): sorted(d.get("NOMBRE") for d in dispositivos.dispositivos_por("VLANS", vlan)) for vlan in sorted(dispositivos.conteo_por("VLANS"))}
+    return estadisticas
+
+def _cli_report(args, dispositivos):
+    resultado = {"estadisticas": _estadisticas_para_json(dispositivos)}
+    if args.verificar:
+        resultado["diferencias"] = dispositivos.estadisticas.verificar_consistencia(dispositivos)
+    return resultado
+
+def _cli_export(args, dispositivos):
+    ruta = args.salida or ruta_exportacion_por_defecto(args.formato, args.gzip)
+    campos = [c.strip().upper() for c in args.campos.split(",") if c.strip()] if args.campos else None
+    seleccion = dispositivos.iterar(**_filtros_desde_argumentos(args))
+    total = exportar_dispositivos(seleccion, ruta, args.formato, campos, args.gzip)
+    return {"archivo": ruta, "formato": args.formato, "total": total}
+
+def _cli_import(args, dispositivos):
+    return importar_inventarios_legados(dispositivos, args.archivos or [r for r in ARCHIVOS_INVENTARIO_LEGADO if os.path.exists(r)])
+
+def _cli_validate(args, dispositivos):
+    if args.archivo is None and args.importar:
+        raise ValueError("--importar requiere un archivo de registros.")
+    # Sin archivo se revalida el inventario guardado completo
+    registros = leer_registros_crudos(args.archivo) if args.archivo else dispositivos.dispositivos
+    inicio = time.perf_counter()
+    informe = validar_inventario_masivo(registros, args.procesos, args.lote, existentes=dispositivos if args.archivo else None)
+    resultado = {"archivo": args.archivo, "procesados": informe["procesados"], "validos": len(informe["dispositivos"]),
+                 "procesos": informe["procesos"], "segundos": round(time.perf_counter() - inicio, 3),
+                 "errores": informe["errores"], "advertencias": informe["advertencias"]}
+    if args.importar:
+        with dispositivos.operacion_masiva():
+            for disp in informe["dispositivos"]:
+                dispositivos.agregar(disp)
+        resultado["importados"] = len(informe["dispositivos"])
+    return resultado
+
+def _cli_diff(args, dispositivos):
+    origenes = [dispositivos if o == ORIGEN_INVENTARIO_ACTUAL else o for o in (args.anterior, args.nuevo)]
+    inicio = time.perf_counter()
+    diferencias = diferencias_inventarios(*origenes)
+    operaciones = diferencias["operaciones"]
+    resultado = {"anterior": args.anterior, "nuevo": args.nuevo, "segundos": round(time.perf_counter() - inicio, 3),
+                 "resumen": diferencias["resumen"], "invalidos": diferencias["invalidos"], "repetidos": diferencias["repetidos"],
+                 "operaciones": operaciones[:args.maximo], "omitidas": max(0, len(operaciones) - args.maximo)}
+    if args.parche:
+        resultado["parche"] = args.parche
+        escribir_parche(operaciones, args.parche)
+    return resultado
+
+def _cli_apply_patch(args, dispositivos):
+    return {"parche": args.parche, "simulado": args.simular, **aplicar_parche(dispositivos, leer_parche(args.parche), args.forzar, args.simular)}
+
+def _cli_compile_snapshot(args, dispositivos):
+    ruta = args.salida or ruta_instantanea_binaria(dispositivos.almacenamiento)
+    inicio = time.perf_counter()
+    # El sello se toma después de cargar: la carga puede haber compactado el diario
+    total = compilar_instantanea(dispositivos, ruta, sello_almacenamiento(dispositivos.almacenamiento))
+    return {"archivo": ruta, "total": total, "bytes": os.path.getsize(ruta), "segundos": round(time.perf_counter() - inicio, 3)}
+
+def _cli_lookup(args, dispositivos):
+    resultados = []
+    for valor in args.valores:
+        try:
+            validar_ip(valor)
+            disp = dispositivos.obtener_por_ip(valor)
+        except ValueError: # No es una IP: se busca por nombre
+            disp = dispositivos.obtener_por_nombre(valor)
+        resultados.append({"consulta": valor, "dispositivo": _dispositivo_para_json(disp) if disp is not None else None})
+    return {"fuente": "instantanea" if isinstance(dispositivos, InstantaneaMmap) else dispositivos.__class__.__name__,
+            "resultados": resultados}
+
+def _cli_subnets(args, dispositivos):
+    redes = [_red_consulta(r.strip()) for r in args.redes.split(",") if r.strip()] if args.redes else None
+    if not 8 <= args.prefijo <= 32:
+        raise ValueError("El prefijo debe estar entre 8 y 32.")
+    resultado = {"subredes": dispositivos.utilizacion_subredes(args.prefijo, redes),
+                 "ips_duplicadas": dispositivos.ips_duplicadas()}
+    if redes:
+        resultado["superposiciones"] = [[str(a), str(b)] for a, b in IndiceIP.superposiciones(redes)]
+    return resultado
+
+def _cli_vlans(args, dispositivos):
+    topologia = dispositivos.topologia_vlan()
+    resumen = topologia.resumen()
+    resultado = {"vlans_en_uso": resumen["vlans_en_uso"], "dispositivos_con_vlans": resumen["dispositivos_con_vlans"],
+                 "miembros_por_vlan": {str(vlan): cant for vlan, cant in resumen["miembros_por_vlan"].items()},
+                 "vlans_un_solo_dispositivo": {str(vlan): d.get("NOMBRE") for vlan, d in topologia.vlans_con_un_miembro().items()}}
+    if args.vlans:
+        vlans = validar_vlans_input(args.vlans)
+        resultado["en_vlans"] = {"vlans": vlans, "dispositivos": sorted(d.get("NOMBRE") for d in topologia.dispositivos_en(vlans))}
+    for campo, nombre in (("comparten_con", args.dispositivo), ("divergencias", args.referencia)):
+        if nombre is None:
+            continue
+        disp = dispositivos.obtener_por_nombre(nombre)
+        if disp is None:
+            raise ValueError(f"No existe un dispositivo llamado '{nombre}'.")
+        if campo == "comparten_con":
+            resultado[campo] = {"dispositivo": disp.get("NOMBRE"), "vlans": disp.get("VLANS"),
+                                "vecinos": sorted(({"nombre": d.get("NOMBRE"), "vlans_comunes": comunes} for d, comunes in topologia.comparten_con(disp)),
+                                                  key=lambda v: v["nombre"].lower())}
+        else:
+            resultado[campo] = {"referencia": disp.get("NOMBRE"), "tipo": disp.get("TIPO"), "vlans": disp.get("VLANS"),
+                                "dispositivos": [{"nombre": d.get("NOMBRE"), "faltantes": faltantes, "sobrantes": sobrantes}
+                                                 for d, faltantes, sobrantes in dispositivos.divergencias_vlan(disp)]}
+    return resultado
+
+def _cli_probe(args, dispositivos):
+    objetivos = dispositivos.filtrar(**_filtros_desde_argumentos(args))
+    inicio = time.perf_counter()
+    resultados = barrido_sondeo(objetivos, args.concurrencia, args.timeout, conteo=args.conteo, puerto_tcp=args.puerto, metodo=args.metodo)
+    resumen = {estado: sum(1 for r in resultados if r["ESTADO"] == estado) for estado in ESTADOS_PING}
+    return {"resumen": resumen, "segundos": round(time.perf_counter() - inicio, 3),
+            "metodo": resultados[0]["METODO"] if resultados else None,
+            "resultados": sorted(resultados, key=lambda r: r["NOMBRE"] or "")}
+
+def _cli_monitor(args, dispositivos):
+    barrido = barrido_ping
+    if args.motor == "interno":
+        barrido = lambda objetivos, concurrencia, timeout: barrido_sondeo(objetivos, concurrencia, timeout, puerto_tcp=args.puerto)
+    monitor = MonitorConectividad(dispositivos, SerieLatencias(args.serie), args.intervalo, args.concurrencia, args.timeout, barrido)
+    try:
+        while args.ciclos == 0 or monitor.ciclos < args.ciclos:
+            inicio = time.monotonic()
+            resultados = monitor.ejecutar_ciclo()
+            caidos = sum(1 for r in resultados if r["ESTADO"] != "alcanzable")
+            print(f"[{_fecha_corta(time.time())}] barrido {monitor.ciclos}: {len(resultados)} hosts, {caidos} sin respuesta", file=sys.stderr, flush=True)
+            if args.ciclos == 0 or monitor.ciclos < args.ciclos:
+                sleep(max(0.0, args.intervalo - (time.monotonic() - inicio)))
+    except KeyboardInterrupt:
+        pass # Ctrl+C termina el monitoreo y devuelve el resumen
+    return {"ciclos": monitor.ciclos,
+            "cambios": [{"instante": _fecha_corta(i), "nombre": n, "ip": ip, "cambio": c} for i, n, ip, c in monitor.cambios]}
+
+def _cli_monitor_report(args, dispositivos):
+    filas = resumen_monitor_por_dispositivo(dispositivos, SerieLatencias(args.serie), args.horas)
+    for fila in filas:
+        for campo in ("caido_desde", "ultima_caida", "ultima_muestra"):
+            fila[campo] = _fecha_corta(fila[campo]) if fila[campo] else None
+    return {"horas": args.horas, "total": len(filas), "dispositivos": filas}
+
+def _cli_migrate_sqlite(args, dispositivos):
+    destino = AlmacenamientoSQLite(args.destino)
+    try:
+        existentes = destino.contar()
+        if existentes and not args.reemplazar:
+            raise ValueError(f"La base '{destino.ruta}' ya tiene {existentes} dispositivos. Use --reemplazar para sobrescribirla.")
+        if not destino.compactar(dispositivos.dispositivos):
+            raise IOError(f"No se pudo escribir en '{destino.ruta}'.")
+        return {"origen": dispositivos.almacenamiento.ruta_instantanea, "destino": destino.ruta, "total": destino.contar()}
+    finally:
+        destino.cerrar()
+
+def _cli_ping(args, dispositivos):
+    objetivos = dispositivos.filtrar(**_filtros_desde_argumentos(args))
+    resultados = barrido_ping(objetivos, args.concurrencia, args.timeout)
+    resumen = {estado: sum(1 for r in resultados if r["ESTADO"] == estado) for estado in ESTADOS_PING}
+    return {"resumen": resumen, "resultados": sorted(resultados, key=lambda r: r["NOMBRE"] or "")}
+
+def _cli_serve(args, dispositivos):
+    servidor = ServidorAPI(APIInventario(dispositivos), args.host, args.puerto, args.registrar)
+    print(f"API escuchando en {servidor.direccion}/ (Ctrl+C para terminar)", file=sys.stderr, flush=True)
+    inicio = time.monotonic()
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass # Ctrl+C detiene el servidor y devuelve el resumen
+    finally:
+        servidor.server_close()
+    return {"direccion": servidor.direccion, "segundos": round(time.monotonic() - inicio, 1)}
+
+
+def _agregar_argumentos_filtro(subparser):
+    subparser.add_argument("--tipo", help="Tipo de dispositivo (PC, SERVIDOR, ROUTER, SWITCH, FIREWALL, IMPRESORA)")
+    subparser.add_argument("--ubicacion", help="Ubicación/capa (NUCLEO, DISTRIBUCION, ACCESO, N/A)")
+    subparser.add_argument("--servicio", help="Servicio (DNS, DHCP, WEB, BD, CORREO, VPN)")
+    subparser.add_argument("--vlan", type=int, help="Número de VLAN")
+
+def _agregar_argumentos_dispositivo(subparser):
+    subparser.add_argument("--nombre", help="Nombre del dispositivo (3-50 caracteres)")
+    subparser.add_argument("--tipo", help="Tipo de dispositivo (PC, SERVIDOR, ROUTER, SWITCH, FIREWALL, IMPRESORA)")
+    subparser.add_argument("--ip", help="Dirección IP (vacía o N/A si no aplica)")
+    subparser.add_argument("--ubicacion", help="Ubicación/capa (NUCLEO, DISTRIBUCION, ACCESO, N/A)")
+    subparser.add_argument("--servicios", help="Servicios separados por coma (DNS,DHCP,WEB,BD,CORREO,VPN)")
+    subparser.add_argument("--vlans", help="VLANs separadas por coma (1-4094)")
+
+
+def construir_parser_cli():
+    parser = argparse.ArgumentParser(prog="CodigoPrueba.py", description="Gestión de dispositivos de red sin menús interactivos. La salida es JSON.")
+    parser.add_argument("--datos", help=f"Archivo de dispositivos (por defecto {NOMBRE_ARCHIVO_DATOS} o {NOMBRE_ARCHIVO_SQLITE})")
+    parser.add_argument("--almacenamiento", choices=["json", "sqlite"], default=ALMACENAMIENTO,
+                        help=f"Dónde se guarda el inventario (por defecto {ALMACENAMIENTO}; ver GESTION_RED_ALMACENAMIENTO)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_list = sub.add_parser("list", help="Lista dispositivos, opcionalmente filtrados")
+    _agregar_argumentos_filtro(p_list)
+    p_list.set_defaults(funcion=_cli_list, instantanea=True)
+
+    p_search = sub.add_parser("search", help="Busca por nombre o con una consulta (tipo:switch vlan:20 ip:10.2.0.0/16 nombre:SW*)")
+    p_search.add_argument("texto", help="Parte del nombre o consulta multicampo entre comillas")
+    p_search.set_defaults(funcion=_cli_search, instantanea=True)
+
+    p_add = sub.add_parser("add", help="Agrega un dispositivo")
+    _agregar_argumentos_dispositivo(p_add)
+    p_add.set_defaults(funcion=_cli_add)
+
+    p_modify = sub.add_parser("modify", help="Modifica los campos indicados de un dispositivo")
+    p_modify.add_argument("objetivo", help="Nombre actual del dispositivo")
+    _agregar_argumentos_dispositivo(p_modify)
+    p_modify.add_argument("--version-esperada", type=int, help="Falla si el dispositivo ya no está en esta VERSION (otro usuario lo cambió)")
+    p_modify.set_defaults(funcion=_cli_modify)
+
+    p_delete = sub.add_parser("delete", help="Elimina un dispositivo por nombre")
+    p_delete.add_argument("objetivo", help="Nombre del dispositivo")
+    p_delete.add_argument("--version-esperada", type=int, help="Falla si el dispositivo ya no está en esta VERSION")
+    p_delete.set_defaults(funcion=_cli_delete)
+
+    p_report = sub.add_parser("report", help="Estadísticas por tipo, ubicación, servicio y VLAN")
+    p_report.add_argument("--verificar", action="store_true", help="Recalcula todo en una pasada y compara con los contadores")
+    p_report.set_defaults(funcion=_cli_report)
+
+    p_export = sub.add_parser("export", help="Exporta los dispositivos en texto, CSV, JSON Lines o Markdown")
+    p_export.add_argument("--formato", choices=list(FORMATOS_EXPORTACION), default="txt")
+    p_export.add_argument("--campos", help=f"Campos separados por coma ({','.join(CAMPOS_EXPORTACION)})")
+    p_export.add_argument("--gzip", action="store_true", help="Comprime la salida con gzip")
+    p_export.add_argument("--salida", help="Ruta del archivo (por defecto reportes/reporte_dispositivos_<fecha>.<formato>)")
+    _agregar_argumentos_filtro(p_export)
+    p_export.set_defaults(funcion=_cli_export)
+
+    p_import = sub.add_parser("import", help="Importa inventarios legados en formato de bloques .txt")
+    p_import.add_argument("archivos", nargs="*", help="Archivos a importar (por defecto los .txt de zona/campus)")
+    p_import.set_defaults(funcion=_cli_import, carga_completa=True)
+
+    p_compile = sub.add_parser("compile-snapshot", help="Compila el inventario JSON en una instantánea binaria de solo lectura (mmap)")
+    p_compile.add_argument("--salida", help="Archivo de la instantánea (por defecto junto al JSON, con extensión .snap)")
+    p_compile.set_defaults(funcion=_cli_compile_snapshot, carga_completa=True, origen_json=True)
+
+    p_lookup = sub.add_parser("lookup", help="Busca dispositivos por nombre exacto o IP (usa la instantánea binaria si está al día)")
+    p_lookup.add_argument("valores", nargs="+", help="Nombres o IPs")
+    p_lookup.set_defaults(funcion=_cli_lookup, instantanea=True)
+
+    p_validate = sub.add_parser("validate", help="Valida y normaliza registros en paralelo (JSON, JSON Lines o CSV) o revalida el inventario")
+    p_validate.add_argument("archivo", nargs="?", help="Archivo de registros crudos; sin archivo se revalida el inventario guardado")
+    p_validate.add_argument("--procesos", type=int, help="Procesos a usar (por defecto uno por CPU)")
+    p_validate.add_argument("--lote", type=int, default=VALIDACION_TAMANO_LOTE, help="Registros por lote enviado a cada proceso")
+    p_validate.add_argument("--importar", action="store_true", help="Agrega al inventario los registros válidos")
+    p_validate.set_defaults(funcion=_cli_validate, carga_completa=True)
+
+    p_diff = sub.add_parser("diff", help="Diferencias entre dos inventarios (altas, bajas y cambios por campo) y parche para reconciliarlos")
+    p_diff.add_argument("anterior", help=f"Inventario de referencia: JSON, JSON Lines, CSV, .txt legado o '{ORIGEN_INVENTARIO_ACTUAL}'")
+    p_diff.add_argument("nuevo", nargs="?", default=ORIGEN_INVENTARIO_ACTUAL, help=f"Inventario a comparar (por defecto '{ORIGEN_INVENTARIO_ACTUAL}', el inventario cargado)")
+    p_diff.add_argument("--parche", help="Guarda en este archivo (JSON Lines) el parche que lleva del anterior al nuevo")
+    p_diff.add_argument("--maximo", type=int, default=100, help="Operaciones a incluir en la salida (el parche las incluye todas)")
+    p_diff.set_defaults(funcion=_cli_diff, carga_completa=True)
+
+    p_apply = sub.add_parser("apply-patch", help="Aplica un parche generado con diff usando altas, modificaciones y bajas normales")
+    p_apply.add_argument("parche", help="Archivo JSON Lines generado con diff --parche")
+    p_apply.add_argument("--forzar", action="store_true", help="Aplica aunque el dispositivo haya cambiado desde que se generó el parche")
+    p_apply.add_argument("--simular", action="store_true", help="Solo informa qué se aplicaría y los conflictos")
+    p_apply.set_defaults(funcion=_cli_apply_patch, carga_completa=True)
+
+    p_subnets = sub.add_parser("subnets", help="Utilización por subred, siguiente IP libre, IPs duplicadas y redes superpuestas")
+    p_subnets.add_argument("--prefijo", type=int, default=PREFIJO_SUBRED_REPORTE, help=f"Tamaño de las subredes a agrupar (por defecto /{PREFIJO_SUBRED_REPORTE})")
+    p_subnets.add_argument("--redes", help="Redes CIDR separadas por coma a analizar en lugar de agrupar (p. ej. 10.0.0.0/16,10.0.5.0/24)")
+    p_subnets.set_defaults(funcion=_cli_subnets, carga_completa=True)
+
+    p_vlans = sub.add_parser("vlans", help="Mapa de VLANs: miembros por VLAN, VLANs en un solo dispositivo, vecinos y diferencias con una referencia")
+    p_vlans.add_argument("--dispositivo", help="Lista los dispositivos que comparten alguna VLAN con este")
+    p_vlans.add_argument("--referencia", help="Compara las VLANs de los dispositivos del mismo tipo con las de este (p. ej. un switch modelo)")
+    p_vlans.add_argument("--vlans", help="Lista los dispositivos que tienen todas estas VLANs (separadas por coma)")
+    p_vlans.set_defaults(funcion=_cli_vlans, carga_completa=True)
+
+    p_migrate = sub.add_parser("migrate-sqlite", help="Copia el inventario JSON (instantánea + diario) a una base SQLite")
+    p_migrate.add_argument("--destino", default=NOMBRE_ARCHIVO_SQLITE, help=f"Base SQLite de destino (por defecto {NOMBRE_ARCHIVO_SQLITE})")
+    p_migrate.add_argument("--reemplazar", action="store_true", help="Sobrescribe la base si ya tiene dispositivos")
+    p_migrate.set_defaults(funcion=_cli_migrate_sqlite, origen_json=True)
+
+    p_serve = sub.add_parser("serve", help="API HTTP/JSON local para otras herramientas (listar, consultar, editar, estadísticas, ping)")
+    p_serve.add_argument("--host", default=API_HOST_POR_DEFECTO, help=f"Dirección donde escuchar (por defecto {API_HOST_POR_DEFECTO}, solo este equipo)")
+    p_serve.add_argument("--puerto", type=int, default=API_PUERTO_POR_DEFECTO)
+    p_serve.add_argument("--registrar", action="store_true", help="Escribe una línea por pedido en la salida de error")
+    p_serve.set_defaults(funcion=_cli_serve, carga_completa=True)
+
+    p_ping = sub.add_parser("ping", help="Barrido de ping concurrente sobre los dispositivos con IP")
+    _agregar_argumentos_filtro(p_ping)
+    p_ping.add_argument("--concurrencia", type=int, default=PING_CONCURRENCIA_POR_DEFECTO)
+    p_ping.add_argument("--timeout", type=int, default=PING_TIMEOUT_POR_DEFECTO, help="Segundos por host")
+    p_ping.set_defaults(funcion=_cli_ping)
+
+    p_probe = sub.add_parser("probe", help="Sondeo en proceso (ICMP sin privilegios o TCP) sin lanzar un ping por host")
+    _agregar_argumentos_filtro(p_probe)
+    p_probe.add_argument("--metodo", choices=SONDEO_METODOS, default="auto", help="auto: ICMP si el sistema lo permite, si no TCP")
+    p_probe.add_argument("--puerto", type=int, default=SONDEO_PUERTO_TCP_POR_DEFECTO, help="Puerto del sondeo TCP")
+    p_probe.add_argument("--concurrencia", type=int, default=SONDEO_CONCURRENCIA_POR_DEFECTO)
+    p_probe.add_argument("--timeout", type=float, default=PING_TIMEOUT_POR_DEFECTO, help="Segundos por sondeo")
+    p_probe.add_argument("--conteo", type=int, default=1, help="Sondeos por host")
+    p_probe.set_defaults(funcion=_cli_probe)
+
+    p_monitor = sub.add_parser("monitor", help="Barridos de ping periódicos guardados en la serie temporal (Ctrl+C para terminar)")
+    p_monitor.add_argument("--intervalo", type=int, default=MONITOR_INTERVALO_POR_DEFECTO, help="Segundos entre barridos")
+    p_monitor.add_argument("--ciclos", type=int, default=0, help="Cantidad de barridos (0 = hasta Ctrl+C)")
+    p_monitor.add_argument("--concurrencia", type=int, default=PING_CONCURRENCIA_POR_DEFECTO)
+    p_monitor.add_argument("--timeout", type=int, default=PING_TIMEOUT_POR_DEFECTO, help="Segundos por host")
+    p_monitor.add_argument("--motor", choices=["ping", "interno"], default="ping", help="interno: sondeo ICMP/TCP en proceso (ver probe)")
+    p_monitor.add_argument("--puerto", type=int, default=SONDEO_PUERTO_TCP_POR_DEFECTO, help="Puerto del sondeo TCP del motor interno")
+    p_monitor.add_argument("--serie", default=NOMBRE_SERIE_MONITOR, help=f"Prefijo de los archivos de la serie (por defecto {NOMBRE_SERIE_MONITOR})")
+    p_monitor.set_defaults(funcion=_cli_monitor, carga_completa=True)
+
+    p_monitor_report = sub.add_parser("monitor-report", help="Disponibilidad y latencias p50/p95/p99 por dispositivo según el monitor")
+    p_monitor_report.add_argument("--horas", type=float, default=MONITOR_VENTANA_REPORTE_HORAS, help="Período a resumir")
+    p_monitor_report.add_argument("--serie", default=NOMBRE_SERIE_MONITOR)
+    p_monitor_report.set_defaults(funcion=_cli_monitor_report, carga_completa=True)
+    return parser
+
+
+def ejecutar_cli(argumentos):
+    """Ejecuta un subcomando y devuelve el código de salida (0 = éxito, 1 = error)."""
+    global current_user
+    args = construir_parser_cli().parse_args(argumentos)
+    current_user = current_user or "CLI"
+    almacenamiento = None
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            # migrate-sqlite siempre lee el JSON; --datos indica el archivo del almacenamiento usado
+            almacenamiento = crear_almacenamiento("json" if getattr(args, "origen_json", False) else args.almacenamiento, args.datos)
+            dispositivos = _cargar_repositorio_cli(almacenamiento, getattr(args, "carga_completa", False), getattr(args, "instantanea", False))
+            try:
+                resultado = args.funcion(args, dispositivos)
+            finally:
+                if isinstance(dispositivos, InstantaneaMmap):
+                    dispositivos.cerrar()
+        salida, codigo = {"ok": True, "comando": args.comando, **resultado}, 0
+    except (ValueError, IOError, sqlite3.Error) as e:
+        salida, codigo = {"ok": False, "comando": args.comando, "error": str(e)}, 1
+    finally:
+        if almacenamiento is not None:
+            almacenamiento.cerrar()
+    print(json.dumps(salida, ensure_ascii=False, indent=2))
+    return codigo
 
 
 # 🎛️ Función principal y bucle de menú
-def mostrar_menu_principal_opciones(dispositivos_lista):
-    current_menu_func = lambda: mostrar_menu_principal_opciones(dispositivos_lista)
+def mostrar_menu_principal_opciones(dispositivos_lista=None):
     mostrar_titulo("🚀 SISTEMA DE GESTIÓN DE DISPOSITIVOS DE RED 🚀")
     print(f"{Color.BOLD}{Color.YELLOW}1.{Color.END} 📱 Agregar Nuevo Dispositivo")
     print(f"{Color.BOLD}{Color.YELLOW}2.{Color.END} 📜 Mostrar Todos los Dispositivos")
@@ -1229,33 +5730,64 @@ def mostrar_menu_principal_opciones(dispositivos_lista):
     print(f"{Color.BOLD}{Color.YELLOW}7.{Color.END} 📊 Generar Reporte Estadístico Detallado")
     print(f"{Color.BOLD}{Color.YELLOW}8.{Color.END} 🌐 Probar Conectividad (Ping a Dispositivo)")
     print(f"{Color.BOLD}{Color.YELLOW}9.{Color.END} 📁 Exportar Listado de Dispositivos a Archivo") # Cambiado número
+    print(f"{Color.BOLD}{Color.YELLOW}10.{Color.END} 📥 Importar Inventario Legado (.txt)")
+    print(f"{Color.BOLD}{Color.YELLOW}11.{Color.END} 🔗 Mapa de VLANs (Topología)")
     print(f"{Color.BOLD}{Color.YELLOW}0.{Color.END} 🚪 Salir del Programa")
 
-
-    opcion_elegida = mostrar_opciones_navegacion(current_menu_func, es_menu_principal=True)
-    if opcion_elegida is None: return
-
-
-    if opcion_elegida == "0": salir_del_programa()
-    elif opcion_elegida == "1": mostrar_barra_progreso(0.5,"Cargando Agregar Dispositivo..."); agregar_dispositivo_interactivo(dispositivos_lista)
-    elif opcion_elegida == "2": mostrar_barra_progreso(0.5,"Cargando Vista de Dispositivos..."); mostrar_dispositivos(dispositivos_lista)
-    elif opcion_elegida == "3": mostrar_barra_progreso(0.5,"Iniciando Búsqueda..."); buscar_dispositivo(dispositivos_lista)
-    elif opcion_elegida == "4": mostrar_barra_progreso(0.5,"Cargando Modificación de Dispositivo..."); modificar_dispositivo_interactivo(dispositivos_lista) # <<< LLAMADA A NUEVA FUNCIÓN
-    elif opcion_elegida == "5": mostrar_barra_progreso(0.5,"Cargando Gestión de Servicios..."); agregar_servicio_a_dispositivo(dispositivos_lista) # Mantiene la función original, aunque redundante
-    elif opcion_elegida == "6": mostrar_barra_progreso(0.5,"Cargando Eliminación de Dispositivo..."); eliminar_dispositivo(dispositivos_lista)
-    elif opcion_elegida == "7": mostrar_barra_progreso(1,"Generando Reporte Estadístico..."); generar_reporte_estadistico(dispositivos_lista)
-    elif opcion_elegida == "8": mostrar_barra_progreso(0.5,"Cargando Herramienta de Ping..."); menu_ping_dispositivo(dispositivos_lista)
-    elif opcion_elegida == "9": mostrar_barra_progreso(0.5,"Exportando Reporte..."); exportar_reporte_a_archivo(dispositivos_lista)
-    else:
-        mostrar_mensaje(f"Opción '{opcion_elegida}' no válida. Seleccione entre 0-9 o una opción de navegación.", "error"); sleep(2)
-        # No es necesario llamar recursivamente aquí, el bucle en main se encargará.
-        # mostrar_menu_principal_opciones(dispositivos_lista) # Evitar recursión directa
+    # opción -> (duración de la barra, mensaje, pantalla)
+    pantallas = {
+        "1": (0.5, "Cargando Agregar Dispositivo...", agregar_dispositivo_interactivo),
+        "2": (0.5, "Cargando Vista de Dispositivos...", mostrar_dispositivos),
+        "3": (0.5, "Iniciando Búsqueda...", buscar_dispositivo),
+        "4": (0.5, "Cargando Modificación de Dispositivo...", modificar_dispositivo_interactivo),
+        "5": (0.5, "Cargando Gestión de Servicios...", agregar_servicio_a_dispositivo), # Mantiene la función original, aunque redundante
+        "6": (0.5, "Cargando Eliminación de Dispositivo...", eliminar_dispositivo),
+        "7": (1, "Generando Reporte Estadístico...", generar_reporte_estadistico),
+        "8": (0.5, "Cargando Herramienta de Ping...", menu_ping_dispositivo),
+        "9": (0.5, "Exportando Reporte...", exportar_reporte_a_archivo),
+        "10": (0.5, "Cargando Importación...", importar_inventario_legado_interactivo),
+        "11": (0.5, "Armando Mapa de VLANs...", mapa_vlans_interactivo),
+    }
+
+    opcion_elegida = mostrar_opciones_navegacion(es_menu_principal=True)
+    if isinstance(opcion_elegida, AccionNavegacion): return opcion_elegida
+
+    if opcion_elegida == "0": return salir_del_programa()
+    if opcion_elegida in pantallas:
+        duracion, mensaje, pantalla = pantallas[opcion_elegida]
+        mostrar_barra_progreso(duracion, mensaje)
+        return lambda: pantalla(inventario_al_dia(dispositivos_lista))
+    mostrar_mensaje(f"Opción '{opcion_elegida}' no válida. Seleccione entre 0-11 o una opción de navegación.", "error"); pausa(2)
+    return NAV_REPETIR
+
+_inventario = None
+
+def obtener_inventario():
+    """Devuelve el inventario de la sesión, cargándolo desde el almacenamiento configurado la primera vez."""
+    global _inventario
+    if _inventario is None:
+        almacenamiento = crear_almacenamiento()
+        _inventario = RepositorioDispositivos(almacenamiento.cargar(), almacenamiento) # Índices por nombre, IP, tipo, ubicación, servicios y VLANs
+        avisar_vlans_descartadas(_inventario)
+    return _inventario
+
+def inventario_al_dia(dispositivos_lista=None):
+    """Inventario de la sesión (carga diferida si no se indica) con lo que otros usuarios guardaron
+    desde la última pantalla; solo se leen las operaciones nuevas del diario."""
+    if dispositivos_lista is None:
+        dispositivos_lista = obtener_inventario()
+    dispositivos_lista.sincronizar()
+    return dispositivos_lista
+
+def activar_modo_rapido():
+    global MODO_RAPIDO
+    MODO_RAPIDO = True
 
 def main():
-    global menu_history
     # dispositivos = [] # <<< MODIFICADO: Cargar desde archivo
-    dispositivos = cargar_dispositivos_desde_archivo() # <<< MODIFICADO
-    sleep(1) # Pausa para ver mensaje de carga de datos
+    if not MODO_RAPIDO: # En modo rápido el inventario se carga al entrar a la primera pantalla que lo usa
+        obtener_inventario()
+        pausa(1) # Pausa para ver mensaje de carga de datos
 
     limpiar_pantalla()
     print(f"\n{Color.BLUE}{'═' * 70}{Color.END}")
@@ -1266,41 +5798,22 @@ def main():
     if not iniciar_sesion():
         return
 
-    menu_principal_lambda = lambda: mostrar_menu_principal_opciones(dispositivos)
-    menu_history = [menu_principal_lambda]
-
-    while True:
-        if menu_history:
-            menu_actual = menu_history[-1]
-            try:
-                menu_actual()
-            except Exception as e_menu: # Captura errores dentro de una función de menú
-                mostrar_mensaje(f"Error inesperado en la función del menú: {e_menu}", "error", esperar_enter=True)
-                import traceback
-                with open("error_log_menu.txt", "a", encoding='utf-8') as f_error_menu:
-                    f_error_menu.write(f"\n--- Error en Menú: {datetime.now()} ---\n")
-                    f_error_menu.write(f"Menu function: {menu_actual.__name__ if hasattr(menu_actual, '__name__') else 'lambda'}\n")
-                    traceback.print_exc(file=f_error_menu)
-                # Volver al menú principal en caso de error grave en un submenú
-                if menu_actual is not menu_principal_lambda: # Evitar bucle si el error es en el principal
-                    ir_a_menu_principal()
-                else: # Si el error es en el propio menú principal, intentar recargarlo
-                     menu_principal_lambda()
-
-
-        else: # Esto no debería ocurrir con la lógica actual
-            mostrar_mensaje("Error crítico de navegación: historial de menú vacío. Reiniciando al menú principal.", "error", True)
-            menu_history = [menu_principal_lambda]
-            menu_principal_lambda()
+    ejecutar_bucle_menus(mostrar_menu_principal_opciones)
 
 
 if __name__ == "__main__":
+    argumentos_cli = sys.argv[1:]
+    if "--rapido" in argumentos_cli:
+        argumentos_cli.remove("--rapido")
+        activar_modo_rapido()
+    if argumentos_cli: # Con argumentos: modo batch sin menús ni pausas
+        sys.exit(ejecutar_cli(argumentos_cli))
     try:
         main()
     except KeyboardInterrupt:
         limpiar_pantalla()
         print(f"\n{Color.YELLOW}Interrupción por teclado detectada. Cerrando el programa...{Color.END}")
-        sleep(1)
+        pausa(1)
         mostrar_barra_progreso(0.5, "Finalizando...", sufijo="¡Programa cerrado de forma segura!")
         limpiar_pantalla()
         sys.exit(0)
@@ -0,0 +1,65 @@
+"""Mide el tiempo de arranque de CodigoPrueba.py hasta el primer prompt (usuario del login).
+
+Lanza el programa varias veces en modo normal y en modo rápido (GESTION_RED_RAPIDO=1) y
+muestra el tiempo hasta que aparece "Nombre de Usuario". Los datos se leen del directorio
+actual, igual que al usar el programa.
+
+Uso: python benchmark_inicio.py [--repeticiones N] [--solo-rapido] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "CodigoPrueba.py")
+PRIMER_PROMPT = "Nombre de Usuario".encode("utf-8")
+
+def medir_arranque(rapido, limite_segundos=30):
+    """Segundos desde el lanzamiento hasta que el programa muestra el prompt de usuario."""
+    entorno = dict(os.environ, PYTHONIOENCODING="utf-8", TERM=os.environ.get("TERM", "dumb"))
+    entorno["GESTION_RED_RAPIDO"] = "1" if rapido else "0"
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen([sys.executable, SCRIPT], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=entorno)
+    salida = b""
+    try:
+        while PRIMER_PROMPT not in salida:
+            bloque = os.read(proceso.stdout.fileno(), 4096)
+            if not bloque:
+                raise RuntimeError("El programa terminó antes de mostrar el login.")
+            salida += bloque
+            if time.perf_counter() - inicio > limite_segundos:
+                raise RuntimeError("Tiempo de espera agotado esperando el login.")
+        return time.perf_counter() - inicio
+    finally:
+        proceso.kill()
+        proceso.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo hasta el primer prompt en modo normal y rápido.")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--solo-rapido", action="store_true", help="No medir el modo normal (tarda varios segundos por ejecución)")
+    parser.add_argument("--json", action="store_true", help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+
+    modos = [("rapido", True)] if args.solo_rapido else [("normal", False), ("rapido", True)]
+    resultados = {}
+    for nombre, rapido in modos:
+        tiempos = [medir_arranque(rapido) for _ in range(max(1, args.repeticiones))]
+        resultados[nombre] = {"mediana_s": round(statistics.median(tiempos), 4),
+                              "min_s": round(min(tiempos), 4), "max_s": round(max(tiempos), 4),
+                              "repeticiones": len(tiempos)}
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+    else:
+        for nombre, datos in resultados.items():
+            print(f"{nombre:>7}: mediana {datos['mediana_s'] * 1000:8.1f} ms  "
+                  f"(mín {datos['min_s'] * 1000:.1f} ms, máx {datos['max_s'] * 1000:.1f} ms, n={datos['repeticiones']})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Benchmark de las operaciones principales de CodigoPrueba.py según el tamaño del inventario.
+
+Genera inventarios sintéticos con crear_dispositivo (por defecto 1k, 10k y 100k dispositivos;
+hasta 1M con --tamanos) y mide guardar y cargar el JSON, armar los índices, los chequeos de
+unicidad de nombre e IP, las búsquedas, el conteo del reporte estadístico y la exportación.
+Para cada operación informa tiempo, rendimiento (elementos por segundo) y pico de memoria, y
+puede guardar los resultados en JSON para comparar versiones con --comparar.
+
+Uso: python benchmark_inventario.py [--tamanos 1000,10000,100000] [--repeticiones N]
+                                    [--sin-memoria] [--salida res.json] [--comparar anterior.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import CodigoPrueba as app
+
+CONSULTAS = ["SW", "nombre:DISP-00001*", "tipo:switch vlan:20", "ip:10.0.0.0/16", "tipo:router,firewall ubicacion:nucleo"]
+CONSULTAS_UNICIDAD = 10000 # Chequeos de nombre e IP por medición
+
+def inventario_sintetico(cantidad, semilla=1234):
+    """Dispositivos válidos creados con crear_dispositivo (nombres e IPs únicos)."""
+    azar = random.Random(semilla)
+    tipos = list(app.TIPOS_DISPOSITIVO.values())
+    ubicaciones = list(app.CAPAS_RED.values())
+    servicios = list(app.SERVICIOS_VALIDOS.values())
+    dispositivos = []
+    for i in range(cantidad):
+        ip = app.entero_a_ip(0x0A000000 + i + 1) if azar.random() < 0.9 else None
+        dispositivos.append(app.crear_dispositivo(
+            azar.choice(tipos), f"DISP-{i:07d}", ip, azar.choice(ubicaciones),
+            sorted(azar.sample(servicios, azar.randrange(3)), key=servicios.index),
+            sorted(azar.sample(range(1, 200), azar.randrange(4)))))
+    return dispositivos
+
+def _operaciones(dispositivos, directorio):
+    """[(nombre, función sin argumentos que devuelve cuántos elementos procesó)]."""
+    ruta_json = os.path.join(directorio, "inventario.json")
+    ruta_diario = os.path.join(directorio, "inventario.journal")
+    azar = random.Random(99)
+    repo = app.RepositorioDispositivos(dispositivos)
+    nombres = [f"DISP-{azar.randrange(len(dispositivos) * 2):07d}" for _ in range(CONSULTAS_UNICIDAD)]
+    ips = [app.entero_a_ip(0x0A000000 + azar.randrange(len(dispositivos) * 2) + 1) for _ in range(CONSULTAS_UNICIDAD)]
+    consultas = [app.analizar_consulta(c) for c in CONSULTAS]
+    repo.consultar(consultas[1]) # Arma el índice de trigramas (se crea en la primera búsqueda por nombre)
+
+    def guardar():
+        if not app.guardar_dispositivos_en_archivo(dispositivos, ruta_json):
+            raise RuntimeError("No se pudo guardar el inventario.")
+        return len(dispositivos)
+
+    def cargar():
+        return len(app.cargar_dispositivos_desde_archivo(app.DiarioDispositivos(ruta_diario, ruta_json)))
+
+    def indexar():
+        return len(app.RepositorioDispositivos(dispositivos))
+
+    def unicidad():
+        for nombre, ip in zip(nombres, ips):
+            repo.nombre_en_uso(nombre)
+            repo.ip_en_uso(ip)
+        return 2 * len(nombres)
+
+    def busqueda():
+        for terminos in consultas:
+            repo.consultar(terminos)
+        return len(consultas)
+
+    def reporte():
+        app.calcular_estadisticas(repo)
+        return len(repo)
+
+    def exportar(formato):
+        return lambda: app.exportar_dispositivos(repo.iterar(), os.path.join(directorio, f"export.{formato}"), formato)
+
+    # cargar necesita el archivo que escribe guardar, por eso va después
+    return [("guardar_json", guardar), ("cargar_json", cargar), ("indexar", indexar), ("unicidad_nombre_ip", unicidad),
+            ("busqueda", busqueda), ("reporte_conteo", reporte), ("exportar_txt", exportar("txt")), ("exportar_csv", exportar("csv"))]
+
+def _medir(funcion, repeticiones, medir_memoria):
+    """(mejor tiempo en segundos, elementos procesados, pico de memoria en KiB o None)."""
+    mejores, elementos = float("inf"), 0
+    for _ in range(max(1, repeticiones)):
+        inicio = time.perf_counter()
+        elementos = funcion()
+        mejores = min(mejores, time.perf_counter() - inicio)
+    pico = None
+    if medir_memoria: # Pasada aparte: tracemalloc hace más lenta la ejecución
+        tracemalloc.start()
+        try:
+            funcion()
+            pico = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+    return mejores, elementos, pico
+
+def _version():
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=False)
+        return salida.stdout.strip() or None
+    except OSError:
+        return None
+
+def ejecutar(tamanos, repeticiones, medir_memoria, al_medir=None):
+    resultados = []
+    for cantidad in tamanos:
+        with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+            dispositivos = inventario_sintetico(cantidad)
+        with tempfile.TemporaryDirectory() as directorio:
+            for operacion, funcion in _operaciones(dispositivos, directorio):
+                with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+                    segundos, elementos, pico = _medir(funcion, repeticiones, medir_memoria)
+                resultado = {"dispositivos": cantidad, "operacion": operacion, "segundos": round(segundos, 6),
+                             "elementos": elementos, "por_segundo": round(elementos / segundos, 1) if segundos else None,
+                             "pico_memoria_kib": pico}
+                resultados.append(resultado)
+                if al_medir:
+                    al_medir(resultado)
+    return {"version": _version(), "python": platform.python_version(), "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "resultados": resultados}
+
+def _imprimir(resultado):
+    pico = f"{resultado['pico_memoria_kib'] / 1024:9.1f} MiB" if resultado["pico_memoria_kib"] is not None else "        -"
+    print(f"{resultado['dispositivos']:>9} {resultado['operacion']:<20} {resultado['segundos'] * 1000:11.2f} ms "
+          f"{resultado['por_segundo'] or 0:>14,.0f}/s {pico}", flush=True)
+
+def comparar(actual, anterior):
+    """Imprime la variación de tiempo de cada medición presente en ambas ejecuciones."""
+    previos = {(r["dispositivos"], r["operacion"]): r for r in anterior["resultados"]}
+    print(f"\nComparación con {anterior.get('version') or 'la ejecución anterior'} ({anterior.get('fecha')}):")
+    for r in actual["resultados"]:
+        previo = previos.get((r["dispositivos"], r["operacion"]))
+        if previo and previo["segundos"]:
+            cambio = 100 * (r["segundos"] - previo["segundos"]) / previo["segundos"]
+            print(f"{r['dispositivos']:>9} {r['operacion']:<20} {previo['segundos'] * 1000:11.2f} ms -> {r['segundos'] * 1000:11.2f} ms ({cambio:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo, rendimiento y memoria de las operaciones del inventario.")
+    parser.add_argument("--tamanos", default="1000,10000,100000", help="Tamaños de inventario separados por coma (p. ej. 1000,1000000)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se informa el mejor tiempo de N ejecuciones")
+    parser.add_argument("--sin-memoria", action="store_true", help="No medir el pico de memoria (más rápido con inventarios grandes)")
+    parser.add_argument("--salida", help="Guardar los resultados en este archivo JSON")
+    parser.add_argument("--comparar", help="Archivo JSON de una ejecución anterior para comparar tiempos")
+    args = parser.parse_args()
+
+    tamanos = [int(t) for t in args.tamanos.split(",") if t.strip()]
+    print(f"{'Disp.':>9} {'Operación':<20} {'Tiempo':>14} {'Rendimiento':>16} {'Pico memoria':>13}")
+    actual = ejecutar(tamanos, args.repeticiones, not args.sin_memoria, al_medir=_imprimir)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(actual, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en '{args.salida}'.")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(actual, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
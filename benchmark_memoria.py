@@ -0,0 +1,74 @@
+"""Compara la memoria del inventario cargado como dicts (formato anterior) y como Dispositivo.
+
+Genera un inventario sintético, lo serializa a JSON y lo vuelve a cargar de las dos formas,
+igual que cargar_dispositivos_desde_archivo: json.load simple (un dict con listas y cadenas
+propias por dispositivo) y json.load con el object_hook que crea registros compactos.
+La memoria se mide con tracemalloc después de descartar el texto JSON.
+
+Uso: python benchmark_memoria.py [--cantidades 1000,10000,100000] [--semilla S] [--json]
+"""
+import argparse
+import gc
+import json
+import random
+import sys
+import tracemalloc
+
+import CodigoPrueba as app
+
+def _inventario_sintetico(cantidad, semilla):
+    azar = random.Random(semilla)
+    tipos = list(app.TIPOS_DISPOSITIVO.values())
+    ubicaciones = list(app.CAPAS_RED.values())
+    servicios = list(app.SERVICIOS_VALIDOS.values())
+    return [{
+        "TIPO": azar.choice(tipos), "NOMBRE": f"DISP-{i:07d}",
+        "IP": app.entero_a_ip(0x0A000000 + i + 1) if azar.random() < 0.9 else "N/A",
+        "UBICACION": azar.choice(ubicaciones),
+        "SERVICIOS": sorted(azar.sample(servicios, azar.randrange(3)), key=servicios.index),
+        "VLANS": sorted(azar.sample(range(1, 200), azar.randrange(4))),
+    } for i in range(cantidad)]
+
+def medir_carga(texto_json, object_hook=None):
+    """Bytes retenidos por la lista cargada desde texto_json (y la lista, para comprobarla)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        dispositivos = json.loads(texto_json, object_hook=object_hook)
+        gc.collect()
+        retenidos = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return retenidos, dispositivos
+
+def comparar(cantidad, semilla):
+    texto_json = json.dumps(_inventario_sintetico(cantidad, semilla), ensure_ascii=False)
+    bytes_dict, como_dict = medir_carga(texto_json)
+    bytes_compacto, compactos = medir_carga(texto_json, app._objeto_json_a_dispositivo)
+    # La versión compacta debe devolver exactamente los mismos datos
+    if [d.a_dict() for d in compactos] != como_dict:
+        raise RuntimeError("La carga compacta no reproduce los datos originales.")
+    return {"dispositivos": cantidad, "bytes_dict": bytes_dict, "bytes_compacto": bytes_compacto,
+            "bytes_por_disp_dict": round(bytes_dict / cantidad, 1),
+            "bytes_por_disp_compacto": round(bytes_compacto / cantidad, 1),
+            "reduccion": round(1 - bytes_compacto / bytes_dict, 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria del inventario: dicts frente a Dispositivo compacto.")
+    parser.add_argument("--cantidades", default="1000,10000,100000", help="Tamaños de inventario separados por coma")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--json", action="store_true", help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+
+    resultados = [comparar(int(c), args.semilla) for c in args.cantidades.split(",") if c.strip()]
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+    else:
+        for r in resultados:
+            print(f"{r['dispositivos']:>9} disp.: dict {r['bytes_dict'] / 2**20:8.1f} MiB ({r['bytes_por_disp_dict']:.0f} B/disp)  "
+                  f"compacto {r['bytes_compacto'] / 2**20:8.1f} MiB ({r['bytes_por_disp_compacto']:.0f} B/disp)  "
+                  f"-{r['reduccion'] * 100:.0f}%")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
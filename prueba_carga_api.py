@@ -0,0 +1,192 @@
+"""Prueba de carga de la API HTTP/JSON local (python CodigoPrueba.py serve).
+
+Levanta el servidor en un hilo sobre un inventario sintético, en un puerto libre de localhost.
+Con --url se usa en cambio un servidor que ya esté corriendo. Varios clientes envían pedidos
+por conexiones keep-alive durante un tiempo fijo. La mezcla de pedidos es:
+- listados paginados con filtros, que repiten la ETag en If-None-Match;
+- lecturas de un dispositivo;
+- estadísticas;
+- algunas modificaciones con If-Match.
+Informa pedidos por segundo, latencias p50/p95/p99 por tipo de pedido y cuántas respuestas
+fueron 304. Termina con código 1 en cuatro casos:
+- hubo errores;
+- alguna conexión se cerró (sin keep-alive);
+- no hubo ningún 304;
+- el rendimiento quedó por debajo de --min-pedidos-por-segundo.
+
+Uso: python prueba_carga_api.py [--dispositivos N] [--clientes C] [--segundos S]
+                                [--min-pedidos-por-segundo R] [--url http://127.0.0.1:8080]
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+import CodigoPrueba as app
+
+# (tipo de pedido, peso en la mezcla)
+MEZCLA = [("listar", 60), ("obtener", 20), ("estadisticas", 10), ("modificar", 10)]
+FILTROS = ["", "tipo=switch", "tipo=router&ubicacion=nucleo", "vlan=20", "q=nombre:DISP-00001*", "q=ip:10.0.0.0/24", "servicio=dns&vlan=10"]
+
+def _inventario_sintetico(cantidad, semilla):
+    azar = random.Random(semilla)
+    tipos = list(app.TIPOS_DISPOSITIVO.values())
+    ubicaciones = list(app.CAPAS_RED.values())
+    servicios = list(app.SERVICIOS_VALIDOS.values())
+    return [app.crear_dispositivo(
+        azar.choice(tipos), f"DISP-{i:07d}", app.entero_a_ip(0x0A000000 + i + 1), azar.choice(ubicaciones),
+        sorted(azar.sample(servicios, azar.randrange(3)), key=servicios.index),
+        sorted(azar.sample(range(1, 50), azar.randrange(4)))) for i in range(cantidad)]
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+def cliente(host, puerto, indice, opciones, fin, resultados):
+    """Envía pedidos por una sola conexión keep-alive hasta 'fin'; guarda latencias y estados."""
+    azar = random.Random(opciones["semilla"] + indice)
+    tipos = [t for t, peso in MEZCLA for _ in range(peso)]
+    etiquetas = {} # ruta -> última ETag recibida
+    conexion = http.client.HTTPConnection(host, puerto, timeout=30)
+    latencias = {t: [] for t, _ in MEZCLA}
+    estados, errores, reconexiones = {}, [], 0
+    while time.monotonic() < fin:
+        tipo = azar.choice(tipos)
+        nombre = f"DISP-{azar.randrange(opciones['dispositivos']):07d}"
+        cabeceras, cuerpo = {}, None
+        if tipo == "listar":
+            metodo = "GET"
+            ruta = f"/dispositivos?{azar.choice(FILTROS)}&pagina={azar.randint(1, 3)}&por_pagina=50"
+        elif tipo == "obtener":
+            metodo, ruta = "GET", "/dispositivos/" + quote(nombre)
+        elif tipo == "estadisticas":
+            metodo, ruta = "GET", "/estadisticas"
+        else:
+            metodo, ruta = "PATCH", "/dispositivos/" + quote(nombre)
+            cuerpo = json.dumps({"vlans": sorted(azar.sample(range(1, 50), azar.randrange(1, 4)))})
+            cabeceras["Content-Type"] = "application/json"
+        if metodo == "GET" and ruta in etiquetas:
+            cabeceras["If-None-Match"] = etiquetas[ruta]
+        elif metodo == "PATCH" and ruta in etiquetas:
+            cabeceras["If-Match"] = etiquetas[ruta] # Puede estar vieja: 412 es una respuesta esperada
+        inicio = time.perf_counter()
+        try:
+            conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            respuesta = conexion.getresponse()
+            respuesta.read()
+        except (OSError, http.client.HTTPException) as e:
+            errores.append(f"{metodo} {ruta}: {e}")
+            conexion.close()
+            conexion = http.client.HTTPConnection(host, puerto, timeout=30)
+            reconexiones += 1
+            continue
+        latencias[tipo].append(time.perf_counter() - inicio)
+        estados[respuesta.status] = estados.get(respuesta.status, 0) + 1
+        if respuesta.status in (200, 304) and respuesta.getheader("ETag"):
+            etiquetas[ruta] = respuesta.getheader("ETag")
+        elif respuesta.status != 412 or metodo != "PATCH":
+            errores.append(f"{metodo} {ruta}: HTTP {respuesta.status}")
+        if respuesta.will_close:
+            reconexiones += 1
+    conexion.close()
+    resultados[indice] = {"latencias": latencias, "estados": estados, "errores": errores, "reconexiones": reconexiones}
+
+@contextlib.contextmanager
+def servidor_local(opciones):
+    """Servidor de la API en un hilo, sobre un inventario sintético con diario en un directorio temporal."""
+    with tempfile.TemporaryDirectory() as directorio:
+        with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+            almacenamiento = app.AlmacenamientoJSON(os.path.join(directorio, "api.journal"), os.path.join(directorio, "api.json"))
+            repo = app.RepositorioDispositivos([], almacenamiento)
+            with repo.operacion_masiva():
+                for disp in _inventario_sintetico(opciones["dispositivos"], opciones["semilla"]):
+                    repo.agregar(disp)
+        servidor = app.ServidorAPI(app.APIInventario(repo), "127.0.0.1", 0)
+        hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+        hilo.start()
+        try:
+            with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+                yield servidor.server_address[:2]
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+            almacenamiento.cerrar()
+
+def ejecutar(host, puerto, opciones):
+    """Corre los clientes y devuelve (resumen, lista de errores)."""
+    resultados = [None] * opciones["clientes"]
+    fin = time.monotonic() + opciones["segundos"]
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=cliente, args=(host, puerto, i, opciones, fin, resultados)) for i in range(opciones["clientes"])]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+
+    estados, errores = {}, []
+    latencias = {t: [] for t, _ in MEZCLA}
+    for r in resultados:
+        for estado, cantidad in r["estados"].items():
+            estados[estado] = estados.get(estado, 0) + cantidad
+        for tipo, valores in r["latencias"].items():
+            latencias[tipo].extend(valores)
+        errores.extend(r["errores"])
+    pedidos = sum(estados.values())
+    reconexiones = sum(r["reconexiones"] for r in resultados)
+    resumen = {"clientes": opciones["clientes"], "pedidos": pedidos, "segundos": round(segundos, 3),
+               "pedidos_por_segundo": round(pedidos / segundos, 1) if segundos else None,
+               "estados": {str(e): c for e, c in sorted(estados.items())}, "reconexiones": reconexiones,
+               "latencias_ms": {tipo: {f"p{p}": round(_percentil(valores, p) * 1000, 2) for p in (50, 95, 99)}
+                                for tipo, valores in latencias.items() if valores}}
+    problemas = []
+    if errores:
+        problemas.append(f"{len(errores)} pedidos con error (primero: {errores[0]})")
+    if reconexiones:
+        problemas.append(f"{reconexiones} conexiones cerradas (sin keep-alive)")
+    if not estados.get(304):
+        problemas.append("ninguna respuesta 304 a los pedidos condicionales")
+    return resumen, problemas
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga sobre la API HTTP/JSON local: rendimiento, keep-alive y ETag.")
+    parser.add_argument("--dispositivos", type=int, default=10000, help="Tamaño del inventario sintético")
+    parser.add_argument("--clientes", type=int, default=8, help="Conexiones keep-alive simultáneas")
+    parser.add_argument("--segundos", type=float, default=5.0, help="Duración de la carga")
+    parser.add_argument("--min-pedidos-por-segundo", type=float, default=200.0, help="Rendimiento mínimo aceptable")
+    parser.add_argument("--url", help="Servidor ya iniciado con 'serve' (debe tener dispositivos DISP-0000000...)")
+    parser.add_argument("--semilla", type=int, default=1234)
+    args = parser.parse_args()
+
+    opciones = {"dispositivos": args.dispositivos, "clientes": args.clientes, "segundos": args.segundos, "semilla": args.semilla}
+    if args.url:
+        partes = urlsplit(args.url)
+        resumen, problemas = ejecutar(partes.hostname, partes.port or 80, opciones)
+    else:
+        with servidor_local(opciones) as (host, puerto):
+            resumen, problemas = ejecutar(host, puerto, opciones)
+
+    print(f"Clientes: {resumen['clientes']}, inventario de {args.dispositivos} dispositivos")
+    print(f"Pedidos: {resumen['pedidos']} en {resumen['segundos']:.2f} s ({resumen['pedidos_por_segundo'] or 0:.1f}/s)")
+    print("Respuestas: " + ", ".join(f"{estado}: {cantidad}" for estado, cantidad in resumen["estados"].items()))
+    for tipo, percentiles in resumen["latencias_ms"].items():
+        print(f"  {tipo:<13} " + "  ".join(f"{p} {ms:7.2f} ms" for p, ms in percentiles.items()))
+    if resumen["pedidos_por_segundo"] is not None and resumen["pedidos_por_segundo"] < args.min_pedidos_por_segundo:
+        problemas.append(f"rendimiento por debajo de {args.min_pedidos_por_segundo:.0f} pedidos/s")
+    if problemas:
+        print("FALLO: " + "; ".join(problemas))
+        return 1
+    print("OK: sin errores, conexiones reutilizadas y respuestas 304 para los pedidos repetidos.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
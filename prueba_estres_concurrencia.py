@@ -0,0 +1,174 @@
+"""Prueba de estrés de varias sesiones que escriben a la vez sobre el mismo inventario.
+
+Lanza varios procesos escritores sobre el mismo directorio de datos, como operadores
+distintos con su propia sesión de CodigoPrueba.py. Cada escritor repite lo siguiente:
+- sincroniza su sesión;
+- elige al azar uno de los mismos dispositivos que los demás;
+- le agrega una VLAN que solo él usa y lo guarda. Si recibe ConflictoVersion, vuelve a
+  leer el dispositivo y lo reintenta.
+Cada tanto también da de alta un dispositivo propio. El diario se compacta seguido para
+que las sesiones tengan que seguirlo mientras otro proceso lo reemplaza.
+
+Al final recarga el inventario y comprueba cuatro cosas:
+- ninguna VLAN se perdió ni se duplicó;
+- las versiones suman la cantidad de modificaciones;
+- están todas las altas;
+- cada sesión, actualizada solo con los cambios ajenos, quedó igual que el archivo.
+También informa el rendimiento. Termina con código 1 si algo falla. Con --sin-bloqueo se
+desactiva el bloqueo entre procesos, para ver las actualizaciones perdidas que evita.
+
+Uso: python prueba_estres_concurrencia.py [--procesos N] [--operaciones M] [--dispositivos D]
+                                         [--compactar-cada K] [--almacenamiento json|sqlite]
+                                         [--min-escrituras-por-segundo R] [--sin-bloqueo]
+"""
+import argparse
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+import CodigoPrueba as app
+
+PRIMERA_VLAN = 2 # Cada modificación agrega una VLAN distinta a partir de esta
+ALTA_CADA = 10 # Cada escritor da de alta un dispositivo propio cada tantas operaciones
+
+def _ruta_datos(directorio, almacenamiento):
+    return os.path.join(directorio, "inventario.db" if almacenamiento == "sqlite" else "inventario.json")
+
+def _nombres_compartidos(cantidad):
+    return [f"COMPARTIDO-{i:04d}" for i in range(cantidad)]
+
+def _firma(dispositivos):
+    """Hash del estado completo (nombre, VLANs y versión de cada dispositivo) para comparar sesiones."""
+    filas = sorted((d.get("NOMBRE"), tuple(d.get("VLANS") or ()), d.get("VERSION", 0)) for d in dispositivos)
+    return hashlib.blake2b(repr(filas).encode("utf-8"), digest_size=16).hexdigest()
+
+def _sesion(directorio, opciones):
+    almacenamiento = app.crear_almacenamiento(opciones["almacenamiento"], _ruta_datos(directorio, opciones["almacenamiento"]))
+    if isinstance(almacenamiento, app.AlmacenamientoJSON):
+        almacenamiento.max_operaciones = opciones["compactar_cada"]
+    return almacenamiento, app.RepositorioDispositivos(almacenamiento.cargar(), almacenamiento)
+
+def escritor(indice, directorio, opciones, barrera, resultados):
+    """Proceso escritor: modificaciones con reintento ante conflictos y algunas altas."""
+    with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+        if opciones["sin_bloqueo"]:
+            app.fcntl = None
+        almacenamiento, repo = _sesion(directorio, opciones)
+        azar = random.Random(opciones["semilla"] + indice)
+        nombres = _nombres_compartidos(opciones["dispositivos"])
+        operaciones = opciones["operaciones"]
+        conflictos = altas = 0
+        barrera.wait()
+        inicio = time.time()
+        for i in range(operaciones):
+            vlan = PRIMERA_VLAN + indice * operaciones + i
+            while True:
+                repo.sincronizar()
+                disp = repo.obtener_por_nombre(azar.choice(nombres))
+                try:
+                    repo.modificar(disp, {"VLANS": disp.get("VLANS") + [vlan]})
+                    break
+                except app.ConflictoVersion:
+                    conflictos += 1
+            if i % ALTA_CADA == 0:
+                repo.agregar(app.crear_dispositivo("Router", f"ESTRES-{indice:02d}-{i:05d}"))
+                altas += 1
+        fin = time.time()
+        barrera.wait() # Todos terminaron de escribir: ahora cada sesión debe quedar igual al archivo
+        repo.sincronizar()
+        firma = _firma(repo)
+        almacenamiento.cerrar()
+    resultados.put({"indice": indice, "inicio": inicio, "fin": fin, "conflictos": conflictos,
+                    "modificaciones": operaciones, "altas": altas, "firma": firma})
+
+def ejecutar(opciones):
+    """Corre la prueba en un directorio temporal y devuelve (resumen, lista de errores)."""
+    with tempfile.TemporaryDirectory() as directorio:
+        with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+            almacenamiento, repo = _sesion(directorio, opciones)
+            with repo.operacion_masiva():
+                for nombre in _nombres_compartidos(opciones["dispositivos"]):
+                    repo.agregar(app.crear_dispositivo("Switch", nombre))
+            almacenamiento.cerrar()
+
+        barrera = multiprocessing.Barrier(opciones["procesos"])
+        resultados = multiprocessing.Queue()
+        procesos = [multiprocessing.Process(target=escritor, args=(i, directorio, opciones, barrera, resultados))
+                    for i in range(opciones["procesos"])]
+        for proceso in procesos:
+            proceso.start()
+        por_escritor = [resultados.get() for _ in procesos]
+        for proceso in procesos:
+            proceso.join()
+
+        with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+            almacenamiento, final = _sesion(directorio, opciones)
+            almacenamiento.cerrar()
+
+    errores = []
+    esperadas = set(range(PRIMERA_VLAN, PRIMERA_VLAN + opciones["procesos"] * opciones["operaciones"]))
+    guardadas = [vlan for d in final for vlan in d.get("VLANS") or ()]
+    perdidas = esperadas - set(guardadas)
+    if perdidas:
+        errores.append(f"{len(perdidas)} modificaciones perdidas (VLANs que no quedaron guardadas)")
+    if len(guardadas) != len(set(guardadas)):
+        errores.append(f"{len(guardadas) - len(set(guardadas))} VLANs duplicadas")
+    compartidos = set(_nombres_compartidos(opciones["dispositivos"]))
+    suma_versiones = sum(d.get("VERSION", 0) - 1 for d in final if d.get("NOMBRE") in compartidos)
+    if suma_versiones != len(esperadas):
+        errores.append(f"las versiones suman {suma_versiones} modificaciones en lugar de {len(esperadas)}")
+    altas = sum(r["altas"] for r in por_escritor)
+    altas_guardadas = sum(1 for d in final if d.get("NOMBRE", "").startswith("ESTRES-"))
+    if altas_guardadas != altas:
+        errores.append(f"{altas - altas_guardadas} altas perdidas")
+    firma_final = _firma(final)
+    desfasadas = [r["indice"] for r in por_escritor if r["firma"] != firma_final]
+    if desfasadas:
+        errores.append(f"las sesiones {desfasadas} no quedaron iguales al archivo tras sincronizar")
+
+    segundos = max(r["fin"] for r in por_escritor) - min(r["inicio"] for r in por_escritor)
+    escrituras = sum(r["modificaciones"] + r["altas"] for r in por_escritor)
+    resumen = {"procesos": opciones["procesos"], "escrituras": escrituras, "segundos": round(segundos, 3),
+               "escrituras_por_segundo": round(escrituras / segundos, 1) if segundos else None,
+               "conflictos_reintentados": sum(r["conflictos"] for r in por_escritor),
+               "dispositivos_finales": len(final)}
+    return resumen, errores
+
+def main():
+    parser = argparse.ArgumentParser(description="Escritores concurrentes sobre el mismo inventario: sin actualizaciones perdidas.")
+    parser.add_argument("--procesos", type=int, default=8)
+    parser.add_argument("--operaciones", type=int, default=200, help="Modificaciones por proceso")
+    parser.add_argument("--dispositivos", type=int, default=20, help="Dispositivos compartidos que todos modifican")
+    parser.add_argument("--compactar-cada", type=int, default=100, help="Operaciones del diario antes de compactar (JSON)")
+    parser.add_argument("--almacenamiento", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--min-escrituras-por-segundo", type=float, default=20.0, help="Rendimiento mínimo aceptable")
+    parser.add_argument("--sin-bloqueo", action="store_true", help="Desactiva el bloqueo entre procesos (muestra el problema)")
+    parser.add_argument("--semilla", type=int, default=1234)
+    args = parser.parse_args()
+    if args.procesos * args.operaciones > 4094 - PRIMERA_VLAN:
+        parser.error("procesos × operaciones no puede superar 4092 (una VLAN distinta por modificación).")
+    if app.fcntl is None and not args.sin_bloqueo:
+        print("Aviso: este sistema no tiene fcntl; los procesos no se bloquean entre sí.")
+
+    opciones = {"procesos": args.procesos, "operaciones": args.operaciones, "dispositivos": args.dispositivos,
+                "compactar_cada": args.compactar_cada, "almacenamiento": args.almacenamiento,
+                "sin_bloqueo": args.sin_bloqueo, "semilla": args.semilla}
+    resumen, errores = ejecutar(opciones)
+    print(f"Escritores: {resumen['procesos']} ({args.almacenamiento}{', sin bloqueo' if args.sin_bloqueo else ''})")
+    print(f"Escrituras: {resumen['escrituras']} en {resumen['segundos']:.2f} s "
+          f"({resumen['escrituras_por_segundo'] or 0:.1f}/s), {resumen['conflictos_reintentados']} conflictos reintentados")
+    if resumen["escrituras_por_segundo"] is not None and resumen["escrituras_por_segundo"] < args.min_escrituras_por_segundo:
+        errores.append(f"rendimiento por debajo de {args.min_escrituras_por_segundo:.0f} escrituras/s")
+    if errores:
+        print("FALLO: " + "; ".join(errores))
+        return 1
+    print("OK: sin actualizaciones perdidas y todas las sesiones al día.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
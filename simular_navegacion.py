@@ -0,0 +1,132 @@
+"""Simulación de sesiones largas de navegación por los menús de CodigoPrueba.py.
+
+Ejecuta miles de navegaciones guionizadas (entrar a pantallas, volver, ir al menú principal,
+opciones inválidas) sin pausas ni limpieza de pantalla, y comprueba que la profundidad de la
+pila de Python y la memoria se mantengan acotadas. Termina con código 1 si no es así.
+
+Uso: python simular_navegacion.py [--ciclos N] [--semilla S]
+"""
+import argparse
+import builtins
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+import CodigoPrueba as app
+
+# Secuencias de entradas que recorren una pantalla y vuelven al menú desde el que se entró.
+# Todas parten del menú principal y terminan de nuevo en él.
+RECORRIDOS = [
+    ["2", "b"],                  # Listado y volver
+    ["2", "m"],                  # Listado y menú principal
+    ["2", ""],                   # Listado y Enter
+    ["3", "SW", "", ""],         # Buscar, ver resultados, volver a buscar, cancelar
+    ["3", "SW", "m"],            # Buscar y desde resultados al menú principal
+    ["3", "zzz", ""],            # Búsqueda sin resultados
+    ["4", "999", "0"],           # Modificar: número inválido (se repite la pantalla) y cancelar
+    ["4", "1", "6", "1", "77", "0", "7", "8", "9"], # Modificar: VLAN pendiente, deshacer, rehacer y descartar
+    ["4", "2", "4", "1", "0"],   # Modificar: ubicación y guardar
+    ["5", "0"],                  # Gestionar servicios y cancelar
+    ["6", "0"],                  # Eliminar y cancelar
+    ["7", ""],                   # Reporte estadístico
+    ["8", "b"],                  # Ping y volver
+    ["8", "m"],                  # Ping y menú principal
+    ["8", "o", "a", "b", "b"],   # Monitoreo: actualizar, volver al ping y al menú principal
+    ["11", "v 1", "", "b"],      # Mapa de VLANs: consulta por VLAN y volver
+    ["11", "c nadie", "m"],      # Mapa de VLANs: dispositivo inexistente y menú principal
+    ["x"],                       # Opción inválida en el menú principal
+    ["0", "n"],                  # Salir cancelado
+]
+
+def _inventario_de_prueba(cantidad=30):
+    tipos = list(app.TIPOS_DISPOSITIVO.values())
+    return [{
+        "NOMBRE": f"SW-SIM-{i:03d}", "IP": f"10.0.{i // 250}.{i % 250 + 1}",
+        "TIPO": tipos[i % len(tipos)], "UBICACION": "N/A",
+        "SERVICIOS": [], "VLANS": [i % 10 + 1],
+    } for i in range(cantidad)]
+
+def _profundidad_pila():
+    marco, profundidad = sys._getframe(1), 0
+    while marco is not None:
+        profundidad += 1
+        marco = marco.f_back
+    return profundidad
+
+def simular(ciclos, semilla):
+    """Recorre `ciclos` navegaciones al azar; devuelve (profundidad máxima, memoria por tramo)."""
+    azar = random.Random(semilla)
+    entradas = []
+    for _ in range(ciclos):
+        entradas.extend(azar.choice(RECORRIDOS))
+    entradas.extend(["s", "s"]) # Salir confirmando
+    total = len(entradas)
+    posicion = {"i": 0}
+    medicion = {"max_pila": 0, "tramos": []}
+    tramo = max(total // 10, 1)
+
+    def input_guionizado(prompt=""):
+        i = posicion["i"]
+        if i >= total:
+            raise EOFError
+        posicion["i"] = i + 1
+        medicion["max_pila"] = max(medicion["max_pila"], _profundidad_pila())
+        if i % tramo == 0:
+            medicion["tramos"].append(tracemalloc.get_traced_memory()[0])
+        return entradas[i]
+
+    originales = (builtins.input, app.sleep, app.limpiar_pantalla, app.mostrar_barra_progreso)
+    builtins.input = input_guionizado
+    app.sleep = lambda *_: None
+    app.limpiar_pantalla = lambda: None
+    app.mostrar_barra_progreso = lambda *a, **k: None
+    # Diario en un directorio temporal para no tocar los datos reales
+    with tempfile.TemporaryDirectory() as tmp:
+        almacenamiento = app.AlmacenamientoJSON(os.path.join(tmp, "sim.journal"), os.path.join(tmp, "sim.json"))
+        repo = app.RepositorioDispositivos(_inventario_de_prueba(), almacenamiento)
+        tracemalloc.start()
+        try:
+            with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+                app.ejecutar_bucle_menus(lambda: app.mostrar_menu_principal_opciones(repo))
+        finally:
+            tracemalloc.stop()
+            almacenamiento.cerrar()
+            builtins.input, app.sleep, app.limpiar_pantalla, app.mostrar_barra_progreso = originales
+    if posicion["i"] != total:
+        raise RuntimeError(f"La simulación terminó antes de tiempo ({posicion['i']}/{total} entradas).")
+    return medicion["max_pila"], medicion["tramos"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula sesiones largas de navegación por los menús.")
+    parser.add_argument("--ciclos", type=int, default=5000, help="Navegaciones a simular (por defecto 5000)")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--max-pila", type=int, default=60, help="Profundidad de pila máxima permitida")
+    parser.add_argument("--max-crecimiento-kib", type=int, default=256, help="Crecimiento de memoria máximo permitido (KiB)")
+    args = parser.parse_args()
+
+    # Un límite de recursión bajo hace que una navegación recursiva falle enseguida
+    sys.setrecursionlimit(max(args.max_pila * 3, 200))
+    # Primera pasada corta para calentar cachés antes de medir
+    simular(200, args.semilla)
+    max_pila, tramos = simular(args.ciclos, args.semilla)
+    crecimiento = (max(tramos[1:]) - tramos[1]) / 1024 if len(tramos) > 2 else 0.0
+
+    print(f"Navegaciones simuladas: {args.ciclos}")
+    print(f"Profundidad máxima de pila: {max_pila} marcos (límite {args.max_pila})")
+    print(f"Crecimiento de memoria: {crecimiento:.1f} KiB (límite {args.max_crecimiento_kib} KiB)")
+    errores = []
+    if max_pila > args.max_pila:
+        errores.append("la pila crece con la navegación")
+    if crecimiento > args.max_crecimiento_kib:
+        errores.append("la memoria crece con la navegación")
+    if errores:
+        print("FALLO: " + "; ".join(errores))
+        return 1
+    print("OK: pila y memoria acotadas.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+"""Dispositivo compacto: VLANs no válidas de archivos viejos."""
+import json
+
+import CodigoPrueba as app
+
+REGISTRO = '{"NOMBRE": "SW-VIEJO", "TIPO": "PC", "IP": "N/A", "UBICACION": "N/A", "SERVICIOS": [], "VLANS": [-1, 10, "abc", 99999999, 4094]}'
+
+def test_vlans_no_validas_se_omiten_sin_imprimir(capsys):
+    disp = json.loads(REGISTRO, object_hook=app._objeto_json_a_dispositivo)
+    assert disp["VLANS"] == [10, 4094]
+    assert disp.vlans_descartadas == (-1, "abc", 99999999)
+    assert capsys.readouterr().out == "" # La capa de datos no escribe en pantalla
+
+def test_reasignar_vlans_limpia_descartadas():
+    disp = json.loads(REGISTRO, object_hook=app._objeto_json_a_dispositivo)
+    disp["VLANS"] = [20]
+    assert disp.vlans_descartadas == ()
+
+def test_aviso_en_la_capa_de_carga(capsys):
+    disp = json.loads(REGISTRO, object_hook=app._objeto_json_a_dispositivo)
+    app.avisar_vlans_descartadas([disp])
+    salida = capsys.readouterr().out
+    assert "VLAN '-1'" in salida and "SW-VIEJO" in salida
@@ -0,0 +1,52 @@
+"""Instantánea binaria (mmap): lectura y rechazo de archivos truncados."""
+import contextlib
+import io
+import os
+
+import pytest
+
+import CodigoPrueba as app
+
+def _inventario(cantidad=30):
+    return [app.crear_dispositivo(app.TIPOS_DISPOSITIVO["SWITCH"], f"SW-{i:03d}", f"10.0.0.{i + 1}", None, None, [i % 5 + 1])
+            for i in range(cantidad)]
+
+@pytest.fixture
+def almacenamiento(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        almacenamiento = app.AlmacenamientoJSON(str(tmp_path / "inv.journal"), str(tmp_path / "inv.json"))
+        repo = app.RepositorioDispositivos(almacenamiento.cargar(), almacenamiento)
+        with repo.operacion_masiva():
+            for disp in _inventario():
+                repo.agregar(disp)
+        app.compilar_instantanea(repo, app.ruta_instantanea_binaria(almacenamiento), app.sello_almacenamiento(almacenamiento))
+    yield almacenamiento
+    almacenamiento.cerrar()
+
+def _truncar(ruta, bytes_menos):
+    with open(ruta, "r+b") as f:
+        f.truncate(os.path.getsize(ruta) - bytes_menos)
+
+def test_instantanea_vigente(almacenamiento):
+    instantanea = app.InstantaneaMmap.abrir_si_vigente(almacenamiento)
+    assert instantanea is not None
+    try:
+        assert len(instantanea) == 30
+        assert instantanea.obtener_por_nombre("sw-007")["IP"] == "10.0.0.8"
+        assert instantanea.obtener_por_ip("10.0.0.30")["NOMBRE"] == "SW-029"
+    finally:
+        instantanea.cerrar()
+
+@pytest.mark.parametrize("bytes_menos", [1, 2, 3, 4, 8, 20, 40, 200])
+def test_instantanea_truncada(almacenamiento, bytes_menos):
+    ruta = app.ruta_instantanea_binaria(almacenamiento)
+    _truncar(ruta, bytes_menos)
+    with pytest.raises(ValueError, match="truncada o dañada"):
+        app.InstantaneaMmap(ruta)
+    assert app.InstantaneaMmap.abrir_si_vigente(almacenamiento) is None # Se vuelve al JSON
+
+def test_instantanea_solo_cabecera(almacenamiento):
+    ruta = app.ruta_instantanea_binaria(almacenamiento)
+    _truncar(ruta, os.path.getsize(ruta) - app.FORMATO_CABECERA_INSTANTANEA.size)
+    with pytest.raises(ValueError):
+        app.InstantaneaMmap(ruta)
@@ -0,0 +1,31 @@
+"""MonitorConectividad: un ciclo que falla no detiene el hilo de fondo."""
+import time
+
+import CodigoPrueba as app
+
+def _esperar(condicion, segundos=3.0):
+    limite = time.monotonic() + segundos
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.01)
+    return condicion()
+
+def test_error_inesperado_queda_registrado_y_el_hilo_sigue(tmp_path):
+    llamadas = []
+
+    def barrido(objetivos, concurrencia, timeout):
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            return [{"NOMBRE": "R-01"}] # Resultado mal formado: KeyError al leer IP
+        return [{"NOMBRE": "R-01", "IP": "10.0.0.1", "ESTADO": "alcanzable", "RTT_PROM": 1.0, "PERDIDA": 0.0}]
+
+    repo = app.RepositorioDispositivos([app.crear_dispositivo(app.TIPOS_DISPOSITIVO["ROUTER"], "R-01", "10.0.0.1")])
+    monitor = app.MonitorConectividad(repo, app.SerieLatencias(str(tmp_path / "serie")), intervalo=0.2, barrido=barrido)
+    monitor.iniciar()
+    try:
+        assert _esperar(lambda: monitor.ultimo_error is not None)
+        assert monitor.ultimo_error.startswith("KeyError")
+        assert monitor.activo
+        assert _esperar(lambda: monitor.ciclos >= 1)
+        assert monitor.ultimo_error is None # El ciclo siguiente salió bien
+    finally:
+        monitor.detener()
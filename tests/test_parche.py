@@ -0,0 +1,58 @@
+"""Aplicación de parches de diferencias_inventarios sobre dispositivos con varios servicios."""
+import contextlib
+import io
+
+import CodigoPrueba as app
+
+def _dispositivo(nombre, servicios, ip="10.0.0.1"):
+    return app.crear_dispositivo(app.TIPOS_DISPOSITIVO["SWITCH"], nombre, ip, None, [app._opcion_normalizada("SERVICIOS", s) for s in servicios], [10])
+
+def _aplicar(repo, operaciones, **opciones):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return app.aplicar_parche(repo, operaciones, **opciones)
+
+def test_modificar_servicios_sin_falso_conflicto():
+    anterior = [_dispositivo("SW-1", ["DNS", "DHCP"])]
+    nuevo = [_dispositivo("SW-1", ["DNS", "DHCP", "WEB"])]
+    operaciones = app.diferencias_inventarios(anterior, nuevo)["operaciones"]
+    repo = app.RepositorioDispositivos(anterior)
+    assert _aplicar(repo, operaciones, simular=True) == {"aplicadas": 1, "ya_aplicadas": 0, "conflictos": []}
+    assert _aplicar(repo, operaciones)["aplicadas"] == 1
+    assert _aplicar(repo, operaciones) == {"aplicadas": 0, "ya_aplicadas": 1, "conflictos": []}
+
+def test_agregar_ya_aplicado():
+    disp = _dispositivo("R-1", ["DNS", "DHCP", "VPN"], ip="10.0.0.2")
+    operaciones = app.diferencias_inventarios([], [disp])["operaciones"]
+    repo = app.RepositorioDispositivos([app.Dispositivo.desde_dict(dict(disp))])
+    assert _aplicar(repo, operaciones) == {"aplicadas": 0, "ya_aplicadas": 1, "conflictos": []}
+
+def test_conflicto_real_se_sigue_detectando():
+    anterior = [_dispositivo("SW-1", ["DNS", "DHCP"])]
+    operaciones = app.diferencias_inventarios(anterior, [_dispositivo("SW-1", ["WEB"])])["operaciones"]
+    repo = app.RepositorioDispositivos([_dispositivo("SW-1", ["VPN"])])
+    informe = _aplicar(repo, operaciones)
+    assert informe["aplicadas"] == 0 and len(informe["conflictos"]) == 1
+
+def test_renombrar_a_un_nombre_ocupado_es_conflicto():
+    anterior = [_dispositivo("XXX", ["DNS"])]
+    operaciones = app.diferencias_inventarios(anterior, [_dispositivo("YYY", ["DNS"])])["operaciones"]
+    repo = app.RepositorioDispositivos([_dispositivo("XXX", ["DNS"]), _dispositivo("yyy", ["WEB"], ip="10.0.0.9")])
+    informe = _aplicar(repo, operaciones)
+    assert informe["aplicadas"] == 0 and len(informe["conflictos"]) == 1
+    assert repo.obtener_por_nombre("XXX") is not None
+
+def test_ip_ocupada_por_otro_dispositivo_es_conflicto():
+    anterior = [_dispositivo("SW-1", ["DNS"])]
+    operaciones = app.diferencias_inventarios(anterior, [_dispositivo("SW-1", ["DNS"], ip="10.0.0.5")])["operaciones"]
+    repo = app.RepositorioDispositivos([_dispositivo("SW-1", ["DNS"]), _dispositivo("SW-2", ["DNS"], ip="10.0.0.5")])
+    assert len(_aplicar(repo, operaciones, simular=True)["conflictos"]) == 1
+    assert _aplicar(repo, operaciones, forzar=True)["aplicadas"] == 1
+
+def test_intercambio_de_ips_se_aplica():
+    anterior = [_dispositivo("SW-1", ["DNS"], ip="10.0.0.1"), _dispositivo("SW-2", ["DNS"], ip="10.0.0.2")]
+    nuevo = [_dispositivo("SW-1", ["DNS"], ip="10.0.0.2"), _dispositivo("SW-2", ["DNS"], ip="10.0.0.1")]
+    operaciones = app.diferencias_inventarios(anterior, nuevo)["operaciones"]
+    repo = app.RepositorioDispositivos([app.Dispositivo.desde_dict(dict(d)) for d in anterior])
+    assert _aplicar(repo, operaciones, simular=True) == {"aplicadas": 2, "ya_aplicadas": 0, "conflictos": []}
+    assert _aplicar(repo, operaciones)["aplicadas"] == 2
+    assert repo.obtener_por_ip("10.0.0.1").get("NOMBRE") == "SW-2"
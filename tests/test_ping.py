@@ -0,0 +1,66 @@
+"""Analizador de la salida de ping sobre salidas reales de iputils, BusyBox, macOS y Windows."""
+import os
+
+import pytest
+
+import CodigoPrueba as app
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ping")
+
+def _analizar(nombre):
+    with open(os.path.join(FIXTURES, nombre), encoding="utf-8") as f:
+        return app.analizar_salida_ping(f.read())
+
+# archivo: (transmitidos, recibidos, perdida, respuestas, inalcanzable, estado)
+CASOS = {
+    "iputils_ok.txt": (4, 4, 0.0, 4, False, "alcanzable"),
+    "iputils_duplicados.txt": (4, 4, 0.0, 4, False, "alcanzable"),
+    "iputils_errores.txt": (4, 0, 100.0, 0, True, "inalcanzable"),
+    "iputils_perdida_parcial.txt": (4, 2, 50.0, 2, False, "alcanzable"),
+    "iputils_sin_respuesta.txt": (2, 0, 100.0, 0, False, "timeout"),
+    "busybox_ok.txt": (3, 3, 0.0, 3, False, "alcanzable"),
+    "busybox_duplicados.txt": (2, 2, 0.0, 2, False, "alcanzable"),
+    "macos_ok.txt": (2, 2, 0.0, 2, False, "alcanzable"),
+    "windows_en_ok.txt": (4, 4, 0.0, 4, False, "alcanzable"),
+    "windows_es_ok.txt": (2, 2, 0.0, 2, False, "alcanzable"),
+    "windows_en_inaccesible.txt": (2, 2, 100.0, 0, True, "inalcanzable"),
+    "windows_en_timeout.txt": (2, 0, 100.0, 0, False, "timeout"),
+}
+
+@pytest.mark.parametrize("archivo", sorted(CASOS))
+def test_resumen(archivo):
+    transmitidos, recibidos, perdida, respuestas, inalcanzable, estado = CASOS[archivo]
+    resultado = _analizar(archivo)
+    assert resultado.transmitidos == transmitidos
+    assert resultado.recibidos == recibidos
+    assert resultado.perdida == perdida
+    assert resultado.respuestas == respuestas
+    assert resultado.inalcanzable is inalcanzable
+    codigo_retorno = 0 if resultado.alcanzable else 1
+    assert app.estado_ping(resultado, codigo_retorno)[0] == estado
+
+def test_iputils_estadisticas_rtt():
+    resultado = _analizar("iputils_ok.txt")
+    assert resultado.rtts == [0.412, 0.387, 0.455, 0.401]
+    assert (resultado.rtt_min, resultado.rtt_prom, resultado.rtt_max, resultado.rtt_desv) == (0.387, 0.413, 0.455, 0.025)
+
+@pytest.mark.parametrize("archivo", ["iputils_duplicados.txt", "busybox_duplicados.txt"])
+def test_respuestas_duplicadas_no_cuentan(archivo):
+    resultado = _analizar(archivo)
+    assert len(resultado.rtts) == resultado.recibidos
+    assert 0.731 not in resultado.rtts and 1.213 not in resultado.rtts
+
+def test_busybox_calcula_desviacion():
+    resultado = _analizar("busybox_ok.txt")
+    assert (resultado.rtt_min, resultado.rtt_prom, resultado.rtt_max) == (0.547, 0.583, 0.62)
+    assert resultado.rtt_desv == pytest.approx(0.03, abs=0.001)
+
+def test_windows_minimo_maximo_media():
+    resultado = _analizar("windows_es_ok.txt")
+    assert (resultado.rtt_min, resultado.rtt_prom, resultado.rtt_max) == (2.0, 3.0, 4.0)
+
+def test_salida_desconocida():
+    resultado = app.analizar_salida_ping("ping: unknown host nadie.local\n")
+    assert not resultado.reconocido
+    assert app.estado_ping(resultado, 2)[0] == "inalcanzable"
+    assert not app.analizar_salida_ping("").reconocido
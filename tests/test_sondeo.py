@@ -0,0 +1,78 @@
+"""SondeadorAsincrono contra 127.0.0.1: un puerto TCP abierto y otro que descarta las conexiones."""
+import contextlib
+import socket
+import time
+
+import pytest
+
+import CodigoPrueba as app
+
+TIMEOUT = 0.5
+LOCALHOST = {"NOMBRE": "localhost", "IP": "127.0.0.1"}
+
+@contextlib.contextmanager
+def puerto_abierto():
+    servidor = socket.socket()
+    servidor.bind(("127.0.0.1", 0))
+    servidor.listen()
+    try:
+        yield servidor.getsockname()[1]
+    finally:
+        servidor.close()
+
+@contextlib.contextmanager
+def puerto_sin_respuesta():
+    """Puerto que escucha pero nunca acepta: con la cola llena, el kernel descarta los SYN nuevos
+    y la conexión queda sin respuesta, como un host o firewall que descarta el tráfico."""
+    servidor = socket.socket()
+    servidor.bind(("127.0.0.1", 0))
+    servidor.listen(0)
+    puerto = servidor.getsockname()[1]
+    relleno = []
+    try:
+        for _ in range(4):
+            cliente = socket.socket()
+            cliente.setblocking(False)
+            cliente.connect_ex(("127.0.0.1", puerto))
+            relleno.append(cliente)
+        time.sleep(0.1) # Que terminen los handshakes que sí entran en la cola
+        yield puerto
+    finally:
+        for cliente in relleno:
+            cliente.close()
+        servidor.close()
+
+def test_tcp_puerto_abierto_alcanzable():
+    with puerto_abierto() as puerto:
+        [resultado] = app.SondeadorAsincrono(TIMEOUT, puerto, metodo="tcp").sondear([LOCALHOST], conteo=2)
+    assert resultado["ESTADO"] == "alcanzable"
+    assert resultado["PERDIDA"] == 0.0
+    assert resultado["RTT_MIN"] is not None and resultado["RTT_MIN"] < TIMEOUT * 1000
+    assert resultado["METODO"] == f"tcp/{puerto}"
+
+def test_tcp_puerto_sin_respuesta_agota_el_tiempo():
+    with puerto_sin_respuesta() as puerto:
+        inicio = time.perf_counter()
+        [resultado] = app.SondeadorAsincrono(TIMEOUT, puerto, metodo="tcp").sondear([LOCALHOST])
+        segundos = time.perf_counter() - inicio
+    assert resultado["ESTADO"] == "timeout"
+    assert resultado["PERDIDA"] == 100.0
+    assert resultado["RTT_PROM"] is None
+    assert segundos < TIMEOUT + 1.0 # Se respeta el timeout del sondeo
+
+def test_tcp_mezcla_de_objetivos():
+    with puerto_abierto() as abierto, puerto_sin_respuesta() as descartado:
+        resultados = app.SondeadorAsincrono(TIMEOUT, abierto, metodo="tcp").sondear(
+            [LOCALHOST, {"NOMBRE": "sin-ip", "IP": "N/A"}])
+        sin_respuesta = app.barrido_sondeo([LOCALHOST], timeout=TIMEOUT, puerto_tcp=descartado, metodo="tcp")
+    assert [r["ESTADO"] for r in resultados] == ["alcanzable"] # Los dispositivos sin IP no se sondean
+    assert sin_respuesta[0]["ESTADO"] == "timeout"
+
+def test_icmp_localhost():
+    sock = app.abrir_socket_icmp()
+    if sock is None:
+        pytest.skip("El sistema no permite sockets ICMP sin privilegios (net.ipv4.ping_group_range).")
+    sock.close()
+    [resultado] = app.SondeadorAsincrono(TIMEOUT, metodo="icmp").sondear([LOCALHOST])
+    assert resultado["ESTADO"] == "alcanzable"
+    assert resultado["METODO"] == "icmp"